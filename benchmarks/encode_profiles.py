@@ -0,0 +1,85 @@
+"""
+出力プロファイルごとのエンコード時間とファイルサイズを計測するスクリプト
+
+Usage: python benchmarks/encode_profiles.py [image_path] [--megapixels 2] [--repeat 3]
+
+画像を指定しない場合は、固定シードのノイズを加えた合成画像を使う
+（ノイズ処理後の画像は圧縮が効きにくく、実際の出力に近い条件になる）。
+結果はMarkdownの表として標準出力に出す。
+"""
+import os
+import io
+import sys
+import time
+import argparse
+import numpy as np
+from PIL import Image
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'backend')
+sys.path.insert(0, os.path.normpath(BACKEND_DIR))
+
+from image_encoder import OUTPUT_PROFILES, encoder_options
+
+def make_sample_image(megapixels, seed=0, mode='RGB'):
+    """
+    グラデーションにガウシアンノイズを加えた合成画像を作る（4:3）
+    mode は 'RGB'、'RGBA'（左右で不透明度が変わる）、'L' のいずれか
+    """
+    rng = np.random.default_rng(seed)
+    height = int((megapixels * 1_000_000 * 3 / 4) ** 0.5)
+    width = int(height * 4 / 3)
+    channels = 1 if mode == 'L' else 3
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    image = np.broadcast_to(gradient, (height, width, channels)).copy()
+    image += rng.standard_normal(image.shape, dtype=np.float32) * 20
+    np.clip(image, 0, 255, out=image)
+    if mode == 'L':
+        return Image.fromarray(image[:, :, 0].astype(np.uint8))
+    result = Image.fromarray(image.astype(np.uint8))
+    if mode == 'RGBA':
+        alpha = np.broadcast_to(np.linspace(255, 64, width, dtype=np.float32)[None, :], (height, width))
+        result.putalpha(Image.fromarray(alpha.astype(np.uint8)))
+    return result
+
+def measure(image, save_options, repeat):
+    """
+    メモリ上へのエンコードを repeat 回行い、最短時間とバイト数を返す
+    """
+    best = None
+    size = 0
+    for _ in range(repeat):
+        buffer = io.BytesIO()
+        started = time.perf_counter()
+        image.save(buffer, **save_options)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+        size = buffer.tell()
+    return best, size
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='出力プロファイルごとのエンコード時間とサイズを計測する')
+    parser.add_argument('image', nargs='?', default=None, help='計測に使う画像（省略時は合成画像）')
+    parser.add_argument('--megapixels', type=float, default=2.0, help='合成画像の画素数（百万画素）')
+    parser.add_argument('--repeat', type=int, default=3, help='各設定の計測回数（最短時間を採用）')
+    args = parser.parse_args(argv)
+
+    if args.image:
+        with Image.open(args.image) as source:
+            image = source.convert('RGB')
+    else:
+        image = make_sample_image(args.megapixels)
+    width, height = image.size
+    print(f"Image: {width}x{height} ({width * height / 1e6:.2f} MP)")
+    print()
+    print("| 形式 | プロファイル | 設定 | 時間 (秒) | サイズ (MB) |")
+    print("|------|--------------|------|-----------|-------------|")
+    for output_format in ('png', 'webp'):
+        for profile in OUTPUT_PROFILES:
+            save_options = encoder_options(output_format, profile)
+            elapsed, size = measure(image, save_options, args.repeat)
+            settings = ', '.join(f"{key}={value}" for key, value in save_options.items() if key != 'format') or '既定値'
+            print(f"| {output_format.upper()} | {profile} | {settings} | {elapsed:.3f} | {size / 1e6:.2f} |")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
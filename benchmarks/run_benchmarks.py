@@ -0,0 +1,305 @@
+"""
+ノイズカーネルと処理パイプラインのベンチマークスクリプト
+
+Usage: python benchmarks/run_benchmarks.py [--groups noise,watermark,logo,resize,encode,pipeline]
+                                          [--sizes 0.25,2,12,40] [--modes RGB,RGBA,L] [--levels 0.2,0.5,1.0]
+                                          [--kernels gaussian,dct,...] [--repeat 3] [--seed 0] [--output result.json]
+
+固定シードの合成画像（encode_profiles.make_sample_image）を使い、次の項目を計測する。
+- noise: src/backend/noise の各カーネル（作業バッファ上で実行）
+- watermark: prepare_watermark + composite_sprite（キャッシュなし / キャッシュ済み）
+- logo: prepare_logo + composite_sprite
+- resize: resize_image（'default' / 'medium'）
+- encode: 出力プロファイルごとのメモリ上へのエンコード
+- pipeline: process_image 全体（PNGの一時ファイルを入出力に使う）
+
+各項目は repeat 回実行して最短時間と平均時間を取り、別に1回 tracemalloc を有効にして
+処理中に確保されたメモリのピーク（バイト）を計測する。入力の準備（バッファの複製など）は計測に含めない。
+結果はJSONで標準出力（または --output のファイル）に出す。処理中の表示は標準エラー出力に送る。
+
+既定の組み合わせ（4サイズ × 3モード × 3レベル）は40MPを含むため時間がかかる。
+変更の前後を比べる場合は --sizes や --groups で絞り込み、同じ引数で実行した結果同士を比べる。
+"""
+import os
+import io
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import contextlib
+import tracemalloc
+import numpy as np
+import PIL
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'backend')
+sys.path.insert(0, os.path.normpath(BACKEND_DIR))
+
+from encode_profiles import make_sample_image
+
+from noise import NOISE_TYPES, FUSED_SEPARATOR, apply_noise_array, requires_color
+from noise.rng import make_rng
+from image_buffer import image_to_buffer, composite_sprite
+from image_encoder import encoder_options, lossy_encoder_options, DEFAULT_LOSSY_QUALITY
+from image_resizer import resize_image
+import watermark_processor
+from watermark_processor import prepare_watermark, BUNDLED_WATERMARK_DIR
+from logo_processor import prepare_logo, BUNDLED_LOGO_DIR
+import process
+
+GROUPS = ('noise', 'watermark', 'logo', 'resize', 'encode', 'pipeline')
+DEFAULT_SIZES = (0.25, 2, 12, 40)
+DEFAULT_MODES = ('RGB', 'RGBA', 'L')
+DEFAULT_LEVELS = (0.2, 0.5, 1.0)
+
+# 計測に使う同梱素材
+WATERMARK_PATH = os.path.join(BUNDLED_WATERMARK_DIR, 'no_ai_1.png')
+LOGO_PATH = os.path.join(BUNDLED_LOGO_DIR, 'logo_A.png')
+
+# エンコードの計測対象（形式, プロファイル）。jpeg は非可逆（既定の品質）
+ENCODE_CASES = (('png', 'fast'), ('png', 'balanced'), ('webp', 'fast'), ('webp', 'balanced'), ('jpeg', None))
+
+# パイプラインの計測に使うノイズの組み合わせ
+PIPELINE_PRESETS = {
+    'gaussian': ['gaussian'],
+    'default': ['dct', 'gaussian', 'speckle', 'shot'],
+    'all': ['dct', 'gaussian', 'speckle', 'shot', 'himalayan', 'mustard'],
+}
+
+def measure(setup, run, repeat):
+    """
+    setup() の戻り値を run() に渡して repeat 回計測し、最短時間・平均時間・メモリのピークを返す
+    メモリのピークは tracemalloc を有効にした追加の1回で計測する（時間の計測には含めない）
+    """
+    times = []
+    for _ in range(repeat):
+        state = setup()
+        started = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - started)
+        del state
+
+    state = setup()
+    tracemalloc.start()
+    try:
+        run(state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del state
+    return min(times), sum(times) / len(times), peak
+
+def make_record(group, name, image, repeat, seed, result, **extra):
+    best, mean, peak = result
+    width, height = image.size
+    megapixels = width * height / 1e6
+    record = {
+        'group': group,
+        'name': name,
+        'mode': image.mode,
+        'width': width,
+        'height': height,
+        'megapixels': round(megapixels, 3),
+        'seed': seed,
+        'repeat': repeat,
+        'time_s': round(best, 6),
+        'mean_time_s': round(mean, 6),
+        'peak_bytes': peak,
+        'mp_per_s': round(megapixels / best, 3) if best > 0 else None,
+    }
+    record.update(extra)
+    print(f"{group}/{name} {image.mode} {width}x{height} {extra}: {best:.4f}s, peak {peak / 1e6:.1f}MB", file=sys.stderr)
+    return record
+
+def bench_noise(image, kernels, levels, repeat, seed):
+    records = []
+    for noise_type in kernels:
+        buffer, _ = image_to_buffer(image, require_color=requires_color(noise_type.split(FUSED_SEPARATOR)))
+        for level in levels:
+            result = measure(
+                lambda: (buffer.copy(), make_rng(seed)),
+                lambda state: apply_noise_array(state[0], noise_type, level, rng=state[1]),
+                repeat
+            )
+            records.append(make_record('noise', noise_type, image, repeat, seed, result,
+                                       noise_level=level, buffer_shape=list(buffer.shape)))
+    return records
+
+def bench_watermark(image, repeat, seed):
+    buffer, alpha = image_to_buffer(image)
+    options = dict(opacity=0.6, enableOutline=True, sizeFactor=0.5, outlineColor=(255, 255, 255))
+    records = []
+    for cache in ('cold', 'warm'):
+        def setup():
+            if cache == 'cold':
+                watermark_processor._watermark_layer_cache.clear()
+            return buffer.copy(), None if alpha is None else alpha.copy()
+
+        def run(state):
+            placement = prepare_watermark(image.size, WATERMARK_PATH, **options)
+            if placement is not None:
+                composite_sprite(state[0], placement[0], placement[1], alpha=state[1])
+
+        prepare_watermark(image.size, WATERMARK_PATH, **options)
+        records.append(make_record('watermark', 'watermark', image, repeat, seed, measure(setup, run, repeat), cache=cache))
+    return records
+
+def bench_logo(image, repeat, seed):
+    buffer, alpha = image_to_buffer(image)
+
+    def run(state):
+        placement = prepare_logo(image.size, LOGO_PATH, margin=24, position='random', rng=state[2])
+        if placement is not None:
+            composite_sprite(state[0], placement[0], placement[1], alpha=state[1])
+
+    prepare_logo(image.size, LOGO_PATH, rng=make_rng(seed))
+    result = measure(lambda: (buffer.copy(), None if alpha is None else alpha.copy(), make_rng(seed)), run, repeat)
+    return [make_record('logo', 'logo', image, repeat, seed, result)]
+
+def bench_resize(image, repeat, seed):
+    records = []
+    for resize_option in ('default', 'medium'):
+        result = measure(lambda: image, lambda source: resize_image(source, resize_option), repeat)
+        records.append(make_record('resize', resize_option, image, repeat, seed, result))
+    return records
+
+def bench_encode(image, repeat, seed):
+    records = []
+    for output_format, profile in ENCODE_CASES:
+        if output_format == 'jpeg':
+            save_options = lossy_encoder_options('jpeg', DEFAULT_LOSSY_QUALITY)
+            source = image.convert('L' if image.mode == 'L' else 'RGB')
+        else:
+            save_options = encoder_options(output_format, profile)
+            source = image
+        sizes = []
+
+        def run(target):
+            source.save(target, **save_options)
+            sizes.append(target.tell())
+
+        result = measure(io.BytesIO, run, repeat)
+        records.append(make_record('encode', f"{output_format}/{profile or 'default'}", image, repeat, seed, result,
+                                   output_bytes=sizes[-1]))
+    return records
+
+def _run_pipeline(input_path, output_path, options):
+    written = process._process_image(input_path, output_path, dict(options))
+    if not written or not os.path.exists(written):
+        raise RuntimeError(f"pipeline did not write an output: {written!r}")
+    return written
+
+def bench_pipeline(image, levels, repeat, seed, work_dir):
+    input_path = os.path.join(work_dir, f"input-{image.mode}-{image.size[0]}x{image.size[1]}.png")
+    output_path = os.path.join(work_dir, 'output.png')
+    image.save(input_path, **encoder_options('png', 'fast'))
+    records = []
+    for preset, noise_types in PIPELINE_PRESETS.items():
+        for level in levels:
+            options = {
+                'seed': seed,
+                'noiseLevel': level,
+                'noiseTypes': noise_types,
+                'applyWatermark': True,
+                'watermarkPath': WATERMARK_PATH,
+                'enableOutline': True,
+                'logoPath': LOGO_PATH,
+                'outputFormat': 'png',
+                'outputProfile': 'fast',
+            }
+            # process_image は例外を捕捉して False を返すため、例外を送出する本体を計測する
+            # （失敗した実行を速い成功として記録しないよう、出力の存在も確認する）
+            result = measure(lambda: None, lambda _: _run_pipeline(input_path, output_path, options), repeat)
+            records.append(make_record('pipeline', preset, image, repeat, seed, result,
+                                       noise_level=level, noise_types=noise_types))
+    os.remove(input_path)
+    return records
+
+def environment_info():
+    try:
+        import scipy
+        scipy_version = scipy.__version__
+    except ImportError:
+        scipy_version = None
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pillow': PIL.__version__,
+        'scipy': scipy_version,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def _split(value, convert=str):
+    return [convert(item.strip()) for item in value.split(',') if item.strip()]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ノイズカーネルと処理パイプラインのベンチマーク（結果はJSON）')
+    parser.add_argument('--groups', default=','.join(GROUPS), help=f"計測する項目（{', '.join(GROUPS)}）")
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES), help='合成画像の画素数（百万画素、カンマ区切り）')
+    parser.add_argument('--modes', default=','.join(DEFAULT_MODES), help='画像モード（RGB, RGBA, L）')
+    parser.add_argument('--levels', default=','.join(str(level) for level in DEFAULT_LEVELS), help='ノイズの強度（0.0〜1.0）')
+    parser.add_argument('--kernels', default=','.join(NOISE_TYPES),
+                        help=f"計測するノイズカーネル（{', '.join(NOISE_TYPES)}。'speckle+gaussian' のように融合したステージも指定できる）")
+    parser.add_argument('--repeat', type=int, default=3, help='各項目の計測回数（最短時間と平均時間を出す）')
+    parser.add_argument('--seed', type=int, default=0, help='合成画像とノイズのシード')
+    parser.add_argument('--output', default=None, help='結果のJSONを書き出すファイル（省略時は標準出力）')
+    args = parser.parse_args(argv)
+
+    groups = _split(args.groups)
+    unknown = [group for group in groups if group not in GROUPS] + [
+        name for name in _split(args.kernels) if not set(name.split(FUSED_SEPARATOR)) <= set(NOISE_TYPES)
+    ]
+    if unknown:
+        parser.error(f"unknown groups or kernels: {unknown}")
+    sizes = _split(args.sizes, float)
+    modes = _split(args.modes)
+    levels = _split(args.levels, float)
+    kernels = _split(args.kernels)
+
+    results = []
+    # バックエンドの表示は標準エラー出力に送り、標準出力はJSONだけにする
+    with contextlib.redirect_stdout(sys.stderr), tempfile.TemporaryDirectory(prefix='malice-bench-') as work_dir:
+        for megapixels in sizes:
+            for mode in modes:
+                image = make_sample_image(megapixels, seed=args.seed, mode=mode)
+                if 'noise' in groups:
+                    mode_kernels = [name for name in kernels if mode != 'L' or not requires_color(name.split(FUSED_SEPARATOR))]
+                    results += bench_noise(image, mode_kernels, levels, args.repeat, args.seed)
+                if 'watermark' in groups:
+                    results += bench_watermark(image, args.repeat, args.seed)
+                if 'logo' in groups:
+                    results += bench_logo(image, args.repeat, args.seed)
+                if 'resize' in groups:
+                    results += bench_resize(image, args.repeat, args.seed)
+                if 'encode' in groups:
+                    results += bench_encode(image, args.repeat, args.seed)
+                if 'pipeline' in groups:
+                    results += bench_pipeline(image, levels, args.repeat, args.seed, work_dir)
+                image.close()
+
+    report = {
+        'environment': environment_info(),
+        'config': {
+            'groups': groups,
+            'sizes': sizes,
+            'modes': modes,
+            'levels': levels,
+            'kernels': kernels,
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(report, output_file, ensure_ascii=False, indent=2)
+    else:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
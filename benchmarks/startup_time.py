@@ -0,0 +1,126 @@
+"""
+Pythonバックエンドの起動時間（コールドスタート）を計測するスクリプト
+
+Usage: python benchmarks/startup_time.py [--repeat 5] [--top 15] [--budget-ms 300] [--python PATH]
+
+次の2つを、毎回新しいインタプリタで計測する。
+- import: `python -X importtime -c "import process"` の出力から、process のインポートにかかった時間と
+  時間のかかったモジュール（自身の時間の上位）を集計する
+- worker: `process.py --worker` を起動してから ready 行が届くまでの時間（ウォーターマークとロゴの事前読み込みを含む）
+
+あわせて、起動時に読み込まれてはいけない重い依存（SciPy、piexif）が読み込まれていないかを確認する。
+結果はJSONで標準出力に出す。--budget-ms を指定すると、import の中央値が超えた場合や
+重い依存が読み込まれた場合に終了コード1を返す。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'backend'))
+
+# 起動時に読み込まれてはいけないモジュール（そのステージを実行する時に読み込む）
+LAZY_MODULES = ('scipy', 'piexif', 'metadata_processor')
+
+def parse_importtime(stderr):
+    """
+    -X importtime の出力を (モジュール名, 自身の時間[us], 累積時間[us]) のリストに変換する
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        entries.append((name.strip(), int(self_us), int(cumulative_us)))
+    return entries
+
+def measure_import(python, repeat):
+    """
+    process のインポートを repeat 回計測し、各回の累積時間と最後の回のモジュール一覧を返す
+    """
+    totals = []
+    entries = []
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [python, '-X', 'importtime', '-c', 'import process'],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        )
+        entries = parse_importtime(completed.stderr)
+        totals.append(next(cumulative for name, _, cumulative in entries if name == 'process') / 1000)
+    return totals, entries
+
+def measure_worker(python, repeat):
+    """
+    常駐ワーカーの起動から ready 行が届くまでの時間（ミリ秒）を repeat 回計測する
+    """
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        worker = subprocess.Popen(
+            [python, os.path.join(BACKEND_DIR, 'process.py'), '--worker'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+        try:
+            ready = json.loads(worker.stdout.readline())
+            elapsed = (time.perf_counter() - started) * 1000
+            if ready.get('event') != 'ready':
+                raise RuntimeError(f"unexpected worker output: {ready}")
+            times.append(elapsed)
+            worker.stdin.write(json.dumps({'command': 'shutdown'}) + '\n')
+            worker.stdin.close()
+            worker.wait(timeout=30)
+        finally:
+            if worker.poll() is None:
+                worker.kill()
+    return times
+
+def summarize(values):
+    return {
+        'medianMs': round(statistics.median(values), 1),
+        'minMs': round(min(values), 1),
+        'maxMs': round(max(values), 1),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pythonバックエンドのコールドスタート時間を計測する')
+    parser.add_argument('--repeat', type=int, default=5, help='計測回数（中央値を採用）')
+    parser.add_argument('--top', type=int, default=15, help='表示する遅いモジュールの数')
+    parser.add_argument('--budget-ms', type=float, default=None, help='import の中央値の上限（ミリ秒）')
+    parser.add_argument('--python', default=sys.executable, help='計測に使うPython（省略時は実行中のPython）')
+    args = parser.parse_args(argv)
+
+    import_totals, entries = measure_import(args.python, args.repeat)
+    worker_times = measure_worker(args.python, args.repeat)
+    imported = {name for name, _, _ in entries}
+    eager = sorted(name for name in imported if name.split('.')[0] in LAZY_MODULES)
+    slowest = sorted(entries, key=lambda entry: entry[1], reverse=True)[:args.top]
+
+    report = {
+        'python': args.python,
+        'repeat': args.repeat,
+        'import': summarize(import_totals),
+        'worker': summarize(worker_times),
+        'moduleCount': len(entries),
+        'eagerHeavyModules': eager,
+        'slowestModules': [
+            {'module': name, 'selfMs': round(self_us / 1000, 2), 'cumulativeMs': round(cumulative_us / 1000, 2)}
+            for name, self_us, cumulative_us in slowest
+        ],
+    }
+    failures = []
+    if eager:
+        failures.append(f"heavy modules imported at startup: {eager[:5]}")
+    if args.budget_ms is not None and report['import']['medianMs'] > args.budget_ms:
+        failures.append(f"import {report['import']['medianMs']}ms exceeds budget {args.budget_ms}ms")
+    report['ok'] = not failures
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures and args.budget_ms is not None else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+# ディスクキャッシュの保存先（未設定の場合はメモリ上のキャッシュのみ）
+CACHE_DIR_ENV = 'MALICE_CACHE_DIR'
+
+class LRUCache:
+    """
+    プロセス内で使う最大件数付きのLRUキャッシュ
+    ウォーターマークやロゴなど、前処理済みの画像素材を保持する
+    """
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """キーに対応する値を返す（無い場合はNone）"""
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        """値を保存し、上限を超えた場合は最も古いものから破棄する"""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+def file_signature(path):
+    """
+    ファイルの識別子（正規化した絶対パス、更新時刻、サイズ）を返す関数
+    ファイルが差し替えられた場合は別のキーになる
+
+    Raises:
+    - OSError: ファイルが存在しない、またはアクセスできない場合
+    """
+    stat = os.stat(path)
+    return (os.path.normcase(os.path.abspath(path)), stat.st_mtime_ns, stat.st_size)
+
+def _disk_cache_path(namespace, key):
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if not cache_dir:
+        return None
+    digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, namespace, digest + '.png')
+
+def load_cached_image(namespace, key):
+    """
+    ディスクキャッシュから画像を読み込む関数（MALICE_CACHE_DIR が未設定、または未保存の場合はNone）
+    """
+    path = _disk_cache_path(namespace, key)
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with Image.open(path) as image:
+            image.load()
+            return image
+    except Exception:
+        return None
+
+def save_cached_image(namespace, key, image):
+    """
+    画像をディスクキャッシュに保存する関数（MALICE_CACHE_DIR が未設定の場合は何もしない）
+    キャッシュの書き込み失敗は処理に影響させない
+    """
+    path = _disk_cache_path(namespace, key)
+    if not path:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        image.save(temp_path, format='PNG', compress_level=1)
+        os.replace(temp_path, path)
+    except Exception:
+        pass
@@ -0,0 +1,227 @@
+import os
+import sys
+import glob
+import json
+import time
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from malice_logging import configure_logging
+
+# バッチ処理の対象とする拡張子
+SUPPORTED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+# ワーカーごとに制限するスレッド数の環境変数（BLAS / OpenMP / SciPy FFT）
+THREAD_LIMIT_VARIABLES = (
+    'OMP_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+    'NUMEXPR_NUM_THREADS',
+    'MALICE_FFT_WORKERS',
+    'MALICE_TILE_WORKERS',
+)
+
+def collect_input_files(input_spec):
+    """
+    入力ディレクトリまたはglobパターンから処理対象の画像ファイルを集める関数
+
+    Parameters:
+    - input_spec: 入力ディレクトリのパス、またはglobパターン（例：'photos/*.png'）
+
+    Returns:
+    - 対象ファイルの絶対パスのリスト（ソート済み）
+    """
+    if os.path.isdir(input_spec):
+        candidates = [os.path.join(input_spec, name) for name in os.listdir(input_spec)]
+    else:
+        candidates = glob.glob(input_spec)
+    return sorted(
+        os.path.abspath(path) for path in candidates
+        if os.path.isfile(path) and os.path.splitext(path)[1].lower() in SUPPORTED_EXTENSIONS
+    )
+
+def plan_output_paths(input_files, output_dir):
+    """
+    入力ファイルごとの出力パス（出力ディレクトリ内の <名前>.png）を決める関数
+    拡張子違いの同名ファイル（大文字小文字の違いを含む）は、出力名が衝突しないよう元の拡張子を付け、
+    それでも衝突する場合は連番（_1, _2, ...）を付ける
+
+    Parameters:
+    - input_files: 入力ファイルのパスのリスト（collect_input_files の結果）
+    - output_dir: 出力ディレクトリ
+
+    Returns:
+    - 出力パスのリスト（input_files と同じ並び。実際の拡張子は出力形式に合わせて変わる）
+
+    Raises:
+    - ValueError: 出力ディレクトリが入力ファイルのあるディレクトリと同じ場合（入力を上書きしないため）
+    """
+    output_dir = os.path.abspath(output_dir)
+    input_dirs = {os.path.normcase(os.path.realpath(os.path.dirname(path))) for path in input_files}
+    if os.path.normcase(os.path.realpath(output_dir)) in input_dirs:
+        raise ValueError(f"Output directory must differ from the input directory: {output_dir}")
+    output_paths = []
+    used_stems = set()
+    for input_path in input_files:
+        stem, ext = os.path.splitext(os.path.basename(input_path))
+        if os.path.normcase(stem) in used_stems:
+            stem = f"{stem}_{ext.lstrip('.').lower()}"
+        # 拡張子を付けても重なる場合（別のディレクトリの同名ファイルなど）は、空くまで連番を付ける
+        candidate = stem
+        number = 1
+        while os.path.normcase(candidate) in used_stems:
+            candidate = f"{stem}_{number}"
+            number += 1
+        used_stems.add(os.path.normcase(candidate))
+        output_paths.append(os.path.join(output_dir, candidate + '.png'))
+    return output_paths
+
+def _run_batch_job(input_path, output_path, options):
+    """
+    プールのワーカープロセスで1ファイルを処理する関数
+
+    Returns:
+    - 処理結果の辞書（input, output, success, seconds, error, metrics）
+    """
+    # 遅延インポート（ワーカープロセス側で1回だけ読み込まれる）
+    from process import _process_image
+    from stage_metrics import StageMetrics
+
+    started = time.perf_counter()
+    metrics = StageMetrics().start()
+    try:
+        # 処理中の print はサマリー（stdout）を汚さないよう stderr に回す
+        with contextlib.redirect_stdout(sys.stderr):
+            written_path = _process_image(input_path, output_path, options, metrics=metrics)
+        return {
+            'input': input_path,
+            'output': written_path,
+            'success': True,
+            'seconds': round(time.perf_counter() - started, 4),
+            'metrics': metrics.to_record(),
+        }
+    except Exception as e:
+        return {
+            'input': input_path,
+            'output': output_path,
+            'success': False,
+            'seconds': round(time.perf_counter() - started, 4),
+            'error': str(e),
+            'metrics': metrics.to_record(),
+        }
+
+def run_batch(input_spec, output_dir, options=None, max_workers=None, threads_per_worker=1, log_level=None):
+    """
+    ディレクトリまたはglobで指定した複数画像をプロセスプールで並列処理する関数
+
+    Parameters:
+    - input_spec: 入力ディレクトリのパス、またはglobパターン
+    - output_dir: 出力ディレクトリ
+    - options: 全ファイル共通の処理オプション（process_image と同じ辞書）
+    - max_workers: プールのプロセス数（省略時はCPUコア数）
+    - threads_per_worker: 各ワーカーで許可するBLAS/OpenMP/FFTのスレッド数
+    - log_level: ワーカープロセスのログレベル（省略時はオプションの logLevel、環境変数 MALICE_LOG_LEVEL の順）
+
+    Returns:
+    - バッチ全体の結果（件数、経過時間、ファイルごとの結果）の辞書
+
+    Raises:
+    - ValueError: 出力ディレクトリが入力ファイルのあるディレクトリと同じ場合
+    """
+    input_files = collect_input_files(input_spec)
+    output_paths = plan_output_paths(input_files, output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    max_workers = max(1, min(max_workers or os.cpu_count() or 1, max(1, len(input_files))))
+
+    # 子プロセスはspawnで起動し、起動時に環境変数のスレッド数制限を読み込ませる
+    # （ワーカー数 × ライブラリ内部のスレッド数でコアを奪い合わないようにする）
+    saved_environment = {name: os.environ.get(name) for name in THREAD_LIMIT_VARIABLES}
+    for name in THREAD_LIMIT_VARIABLES:
+        os.environ[name] = str(threads_per_worker)
+
+    results = []
+    started = time.perf_counter()
+    try:
+        context = multiprocessing.get_context('spawn')
+        if log_level is None:
+            log_level = (options or {}).get('logLevel')
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context,
+                                 initializer=configure_logging, initargs=(log_level,)) as executor:
+            futures = {}
+            base_seed = (options or {}).get('seed')
+            for index, (input_path, output_path) in enumerate(zip(input_files, output_paths)):
+                # シード指定時はファイルごとに (seed, 並び順) から独立したストリームを割り当てる
+                # （ワーカー数や処理順に関係なく同じ結果になる）
+                file_options = dict(options or {})
+                if base_seed is not None:
+                    seed_entropy = list(base_seed) if isinstance(base_seed, list) else [base_seed]
+                    file_options['seed'] = seed_entropy + [index]
+                future = executor.submit(_run_batch_job, input_path, output_path, file_options)
+                futures[future] = (input_path, output_path)
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    # ワーカープロセスが異常終了した場合（BrokenProcessPool など）は、そのファイルを失敗として記録する
+                    input_path, output_path = futures[future]
+                    results.append({
+                        'input': input_path,
+                        'output': output_path,
+                        'success': False,
+                        'seconds': None,
+                        'error': f"{type(e).__name__}: {e}",
+                    })
+    finally:
+        for name, value in saved_environment.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    elapsed = time.perf_counter() - started
+    results.sort(key=lambda result: result['input'])
+    succeeded = sum(1 for result in results if result['success'])
+    return {
+        'total': len(results),
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'workers': max_workers,
+        'elapsedSeconds': round(elapsed, 4),
+        'filesPerSecond': round(len(results) / elapsed, 4) if elapsed > 0 else None,
+        'files': results,
+    }
+
+def main(argv):
+    """
+    batch サブコマンドのエントリポイント
+
+    Usage: python process.py batch <input_dir_or_glob> <output_dir> [options_json] [--workers N] [--threads-per-worker N] [--log-level LEVEL]
+    """
+    import argparse
+    parser = argparse.ArgumentParser(prog='process.py batch')
+    parser.add_argument('input', help='入力ディレクトリまたはglobパターン')
+    parser.add_argument('output_dir', help='出力ディレクトリ')
+    parser.add_argument('options_json', nargs='?', default=None, help='全ファイル共通の処理オプション（JSON）')
+    parser.add_argument('--workers', type=int, default=None, help='プロセス数（省略時はCPUコア数）')
+    parser.add_argument('--threads-per-worker', type=int, default=1, help='各ワーカーのBLAS/OpenMP/FFTスレッド数')
+    parser.add_argument('--log-level', default=None, help='ログレベル（debug, info, warning, error、ログは標準エラー出力）')
+    args = parser.parse_args(argv)
+
+    options = None
+    if args.options_json:
+        try:
+            options = json.loads(args.options_json)
+        except json.JSONDecodeError:
+            print("ERROR: Invalid JSON options")
+            return 1
+
+    log_level = args.log_level if args.log_level is not None else (options or {}).get('logLevel')
+    configure_logging(log_level)
+    try:
+        summary = run_batch(args.input, args.output_dir, options, args.workers, args.threads_per_worker, log_level)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        return 1
+    print(json.dumps(summary, ensure_ascii=False))
+    return 0 if summary['failed'] == 0 else 1
@@ -0,0 +1,173 @@
+import numpy as np
+from PIL import Image
+
+# 透過情報を持つモード
+ALPHA_MODES = ('RGBA', 'LA', 'PA', 'RGBa', 'La')
+
+def normalize_mode(image, require_color=False):
+    """
+    画像をパイプラインで扱うモード（L / LA / RGB / RGBA）に1回だけ正規化する関数
+
+    Parameters:
+    - image: 入力画像（PIL.Image）
+    - require_color: 色を使う処理（マスタードノイズなど）があり、グレースケールのままでは扱えない場合はTrue
+
+    Returns:
+    - 正規化された画像（PIL.Image、変換が不要な場合は入力そのもの）
+    """
+    has_alpha = image.mode in ALPHA_MODES or (image.mode == 'P' and 'transparency' in image.info)
+    grayscale = image.mode in ('L', 'LA', 'La', '1', 'I', 'I;16', 'F') and not require_color
+    if grayscale:
+        target = 'LA' if has_alpha else 'L'
+    else:
+        target = 'RGBA' if has_alpha else 'RGB'
+    return image if image.mode == target else image.convert(target)
+
+def sprite_has_color(sprite):
+    """
+    スプライト（ウォーターマークやロゴ、RGBA）の見える画素に色（R・G・Bが揃っていない画素）があるかどうかを返す関数
+    グレースケールの画像に合成する場合に、RGBへ変換する必要があるかの判定に使う
+    """
+    if sprite.mode != 'RGBA':
+        sprite = sprite.convert('RGBA')
+    pixels = np.asarray(sprite)
+    visible = pixels[..., 3] > 0
+    color = pixels[..., :3]
+    chroma = (color[..., 0] != color[..., 1]) | (color[..., 1] != color[..., 2])
+    return bool(np.any(chroma & visible))
+
+def placements_require_color(*placements):
+    """
+    合成するスプライトの配置（(スプライト, 位置)、無い場合はNone）の中に、色のあるスプライトがあるかどうかを返す関数
+    """
+    return any(placement is not None and sprite_has_color(placement[0]) for placement in placements)
+
+def image_to_buffer(image, require_color=False, dtype=np.float32):
+    """
+    PIL画像を色チャンネルだけのfloat32作業バッファと、別持ちの透過情報に分ける関数
+    ノイズ処理の間はこのバッファを使い回し、各ステージはその場で更新する（アルファは処理しない）
+
+    Parameters:
+    - image: 変換する画像（PIL.Image）
+    - require_color: グレースケール画像もRGBに変換する場合はTrue
+    - dtype: 作業バッファの型（uint8 のまま扱えるカーネルだけを使う場合は numpy.uint8、noise.buffer_dtype を参照）
+
+    Returns:
+    - (作業バッファ（(h, w) または (h, w, 3)）, 透過情報（uint8の (h, w)、無い場合はNone）)
+    """
+    image = normalize_mode(image, require_color=require_color)
+    if image.mode in ('L', 'RGB'):
+        return np.array(image, dtype=dtype), None
+    color_mode = image.mode[:-1]
+    alpha = np.array(image.getchannel('A'))
+    # 完全に不透明な画像は透過情報を持たない画像として扱う
+    if alpha.min() == 255:
+        alpha = None
+    return np.array(image.convert(color_mode), dtype=dtype), alpha
+
+def buffer_to_image(buffer, alpha=None):
+    """
+    作業バッファを0-255にクリップ・量子化してPIL画像に戻す関数
+    クリップはバッファ上でその場で行う（変換後のバッファは使い捨て）
+    出力は必要最小限のモード（L / LA / RGB / RGBA）になる
+
+    Parameters:
+    - buffer: 作業バッファ（NumPy配列、(h, w) または (h, w, 3)。uint8 の場合は変換しない）
+    - alpha: 透過情報（uint8の (h, w)、無い場合はNone）
+
+    Returns:
+    - 量子化された画像（PIL.Image）
+    """
+    if buffer.dtype != np.uint8:
+        np.clip(buffer, 0, 255, out=buffer)
+    image = Image.fromarray(buffer.astype(np.uint8, copy=False))
+    if alpha is not None and alpha.min() < 255:
+        image.putalpha(Image.fromarray(alpha.astype(np.uint8)))
+    return image
+
+def composite_sprite(buffer, sprite, position, alpha=None):
+    """
+    RGBAのスプライト（ウォーターマークやロゴ）を作業バッファに合成する関数
+    スプライトが重なる矩形範囲だけを切り出して合成し、その場で書き戻す（全面のキャンバスは作らない）
+
+    Parameters:
+    - buffer: 作業バッファ（NumPy配列、(h, w) または (h, w, 3)）
+    - sprite: 合成するスプライト（PIL.Image, RGBA）
+    - position: スプライト左上の位置（x, y）
+    - alpha: 透過情報（NumPy配列、(h, w)、0〜255）。指定時はこれも合わせて更新する
+
+    Returns:
+    - 合成後の作業バッファ（入力をその場で更新したもの）
+    """
+    left, top = position
+    sprite_width, sprite_height = sprite.size
+    height, width = buffer.shape[:2]
+    x0, y0 = max(left, 0), max(top, 0)
+    x1, y1 = min(left + sprite_width, width), min(top + sprite_height, height)
+    if x0 >= x1 or y0 >= y1:
+        return buffer
+
+    region = sprite.crop((x0 - left, y0 - top, x1 - left, y1 - top))
+    sprite_alpha = np.asarray(region.getchannel('A'), dtype=np.float32) / 255.0
+    if buffer.ndim == 2:
+        sprite_color = np.asarray(region.convert('L'), dtype=np.float32)
+    else:
+        sprite_color = np.asarray(region.convert('RGB'), dtype=np.float32)
+        sprite_alpha = sprite_alpha[:, :, None]
+
+    # 従来の「透明キャンバスへ paste(mask=α) → alpha_composite」と同じ結果になるよう、
+    # スプライトの色とアルファにもう一度アルファを掛けたものを重ねる
+    sprite_color *= sprite_alpha
+    sprite_alpha = sprite_alpha * sprite_alpha
+
+    target = buffer[y0:y1, x0:x1]
+    if alpha is None:
+        target *= 1.0 - sprite_alpha
+        target += sprite_color * sprite_alpha
+        return buffer
+
+    # 透過のある画像は alpha_composite と同じ式（ストレートアルファ）で合成する
+    base_alpha = alpha[y0:y1, x0:x1].astype(np.float32) / 255.0
+    if buffer.ndim == 3:
+        base_alpha = base_alpha[:, :, None]
+    out_alpha = sprite_alpha + base_alpha * (1.0 - sprite_alpha)
+    target *= base_alpha * (1.0 - sprite_alpha)
+    target += sprite_color * sprite_alpha
+    np.divide(target, out_alpha, out=target, where=out_alpha > 0)
+    alpha[y0:y1, x0:x1] = np.round((out_alpha if out_alpha.ndim == 2 else out_alpha[:, :, 0]) * 255.0)
+    return buffer
+
+def composite_sprite_image(image, sprite, position):
+    """
+    RGBAのスプライトをPIL画像に合成する関数（合成する矩形範囲だけを切り出して処理する）
+    入力画像のモード（L / RGB / RGBA）はそのまま保つ
+
+    Parameters:
+    - image: ベース画像（PIL.Image）
+    - sprite: 合成するスプライト（PIL.Image, RGBA）
+    - position: スプライト左上の位置（x, y）
+
+    Returns:
+    - 合成後の画像（PIL.Image、入力とは別のオブジェクト）
+    """
+    if image.mode not in ('L', 'RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    left, top = position
+    box = (
+        max(left, 0), max(top, 0),
+        min(left + sprite.size[0], image.size[0]), min(top + sprite.size[1], image.size[1]),
+    )
+    result = image.copy()
+    if box[0] >= box[2] or box[1] >= box[3]:
+        return result
+
+    region = np.array(image.crop(box), dtype=np.float32)
+    if image.mode == 'RGBA':
+        color, alpha = region[:, :, :3], region[:, :, 3]
+    else:
+        color, alpha = region, None
+    composite_sprite(color, sprite, (left - box[0], top - box[1]), alpha=alpha)
+    np.clip(region, 0, 255, out=region)
+    # 切り捨てではなく四捨五入で量子化する（alpha_composite の丸めに合わせる）
+    result.paste(Image.fromarray(np.round(region).astype(np.uint8), image.mode), box[:2])
+    return result
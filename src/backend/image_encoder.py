@@ -0,0 +1,285 @@
+import io
+import os
+import struct
+import zlib
+import numpy as np
+from malice_logging import get_logger
+
+logger = get_logger('encoder')
+
+# 出力プロファイルごとのエンコード設定（いずれも可逆圧縮なので画素値は変わらない）
+# ノイズを加えた画像は圧縮が効きにくく、圧縮レベルを上げても縮む量は小さい。
+# zlib の戦略（compress_type）は Z_RLE / Z_FILTERED の方が既定より速く、サイズもほぼ同じになる。
+# WebP可逆の quality は圧縮の手間を表し、method と合わせて時間が大きく変わる。
+OUTPUT_PROFILES = {
+    # outputProfile 未指定時：従来の Image.save の引数をそのまま使う（既存の出力を変えない）
+    'default': {
+        'png': {},
+        'webp': {'lossless': True, 'quality': 100},
+    },
+    'fast': {
+        'png': {'compress_level': 1, 'compress_type': zlib.Z_RLE},
+        'webp': {'lossless': True, 'method': 0, 'quality': 0},
+    },
+    'balanced': {
+        'png': {'compress_level': 6, 'compress_type': zlib.Z_FILTERED},
+        'webp': {'lossless': True, 'method': 4, 'quality': 50},
+    },
+    'smallest': {
+        'png': {'compress_level': 9, 'compress_type': zlib.Z_FILTERED},
+        'webp': {'lossless': True, 'method': 6, 'quality': 100},
+    },
+    # プレビュー用：圧縮も行フィルタも行わずに書き出す（ファイルは大きくなるが、エンコード時間が最も短い）
+    'preview': {
+        'png': {'compress_level': 0},
+        'webp': {'lossless': True, 'method': 0, 'quality': 0},
+    },
+}
+
+DEFAULT_OUTPUT_PROFILE = 'default'
+
+# 非可逆出力（JPEG、または targetBytes 指定時のWebP）の品質
+DEFAULT_LOSSY_QUALITY = 90
+MIN_LOSSY_QUALITY = 5
+MAX_LOSSY_QUALITY = 95
+
+# 目標サイズの探索で「十分近い」とみなす割合（目標の95%以上に収まれば打ち切る）
+TARGET_BYTES_TOLERANCE = 0.05
+
+# 行ごとに書き出すPNGのカラータイプ（8bit）
+PNG_COLOR_TYPES = {'L': 0, 'RGB': 2, 'LA': 4, 'RGBA': 6}
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# 行フィルタの計算中に、帯1バイトあたりに確保される一時配列のバイト数の目安（5種類の候補と評価値）
+PNG_FILTER_WORKING_FACTOR = 48
+
+def resolve_output_path(output_path, output_format):
+    """
+    出力形式に合わせて出力ファイルの拡張子を揃える関数
+
+    Returns:
+    - 拡張子を修正した出力パス
+    """
+    output_ext = os.path.splitext(output_path)[1].lower()
+    if output_format == 'webp' and output_ext != '.webp':
+        return os.path.splitext(output_path)[0] + '.webp'
+    if output_format == 'jpeg' and output_ext not in ('.jpg', '.jpeg'):
+        return os.path.splitext(output_path)[0] + '.jpg'
+    if output_format == 'png' and output_ext != '.png':
+        return os.path.splitext(output_path)[0] + '.png'
+    return output_path
+
+def encoder_options(output_format='png', profile=None):
+    """
+    出力形式とプロファイルから Image.save に渡す引数を作る関数
+
+    Parameters:
+    - output_format: 出力形式（'png' または 'webp'）
+    - profile: 出力プロファイル（'default', 'fast', 'balanced', 'smallest', 'preview'、省略時は従来の設定の 'default'）
+
+    Returns:
+    - Image.save のキーワード引数（format を含む辞書）
+
+    Raises:
+    - ValueError: 未対応のプロファイルが指定された場合
+    """
+    profile = profile or DEFAULT_OUTPUT_PROFILE
+    if profile not in OUTPUT_PROFILES:
+        raise ValueError(f"Unsupported output profile: {profile}. Supported profiles: {tuple(OUTPUT_PROFILES)}")
+    if output_format == 'webp':
+        return {'format': 'WEBP', **OUTPUT_PROFILES[profile]['webp']}
+    return {'format': 'PNG', **OUTPUT_PROFILES[profile]['png']}
+
+def lossy_encoder_options(output_format, quality):
+    """
+    非可逆エンコード（JPEG / WebP）の Image.save 引数を作る関数
+    """
+    if output_format == 'jpeg':
+        return {'format': 'JPEG', 'quality': int(quality), 'optimize': False}
+    return {'format': 'WEBP', 'lossless': False, 'quality': int(quality), 'method': 4}
+
+def _prepare_for_format(image, output_format):
+    """JPEGはアルファを持てないため、RGB / L に変換する"""
+    if output_format == 'jpeg' and image.mode not in ('RGB', 'L'):
+        return image.convert('L' if image.mode in ('L', 'LA') else 'RGB')
+    return image
+
+def encode_to_target(image, output_format, target_bytes, min_quality=MIN_LOSSY_QUALITY, max_quality=MAX_LOSSY_QUALITY, tolerance=TARGET_BYTES_TOLERANCE):
+    """
+    目標バイト数に収まる最も高い品質を二分探索し、エンコード結果を返す関数
+    エンコードはメモリ上（BytesIO）で行い、ファイルには書き出さない。
+    最高品質で収まる場合はそのまま、目標の (1 - tolerance) 以上に収まった時点で探索を打ち切る。
+
+    Parameters:
+    - image: エンコードする画像（PIL.Image）
+    - output_format: 'jpeg' または 'webp'
+    - target_bytes: 目標のファイルサイズ（バイト）
+    - min_quality, max_quality: 探索する品質の範囲
+    - tolerance: 打ち切りの許容幅（目標に対する割合）
+
+    Returns:
+    - (エンコード結果のbytes, 採用した品質, エンコード回数)
+    最低品質でも収まらない場合は最低品質の結果を返す
+    """
+    image = _prepare_for_format(image, output_format)
+
+    def encode(quality):
+        buffer = io.BytesIO()
+        image.save(buffer, **lossy_encoder_options(output_format, quality))
+        return buffer.getvalue()
+
+    # 最高品質で収まる場合は探索しない
+    data = encode(max_quality)
+    if len(data) <= target_bytes:
+        return data, max_quality, 1
+
+    best = None
+    smallest = (data, max_quality)
+    encodes = 1
+    low, high = min_quality, max_quality - 1
+    while low <= high:
+        quality = (low + high) // 2
+        data = encode(quality)
+        encodes += 1
+        if len(data) <= target_bytes:
+            best = (data, quality)
+            if len(data) >= target_bytes * (1.0 - tolerance):
+                break
+            low = quality + 1
+        else:
+            if quality < smallest[1]:
+                smallest = (data, quality)
+            high = quality - 1
+    if best is None:
+        # 最低品質でも目標を超える場合
+        if smallest[1] != min_quality:
+            smallest = (encode(min_quality), min_quality)
+            encodes += 1
+        best = smallest
+    return best[0], best[1], encodes
+
+def _png_chunk(output_file, tag, data):
+    """PNGのチャンク（長さ、種類、データ、CRC）を書き出す"""
+    output_file.write(struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data)))
+
+def _filter_png_rows(rows, previous, bpp):
+    """
+    PNGの行フィルタを適用する（行ごとに None / Sub / Up / Average / Paeth から、符号付きの絶対値和が最小のものを選ぶ）
+    フィルタは元の画素値から計算するため、行の間の依存が無く、帯単位でまとめてベクトル化できる
+
+    Parameters:
+    - rows: uint8 の (行数, 1行のバイト数)
+    - previous: 直前の行（uint8 の (1行のバイト数,)、先頭の帯ではゼロ）
+    - bpp: 1画素のバイト数
+
+    Returns:
+    - 各行の先頭にフィルタの種類を付けた bytes
+    """
+    x = rows.astype(np.int16)
+    up = np.concatenate([previous.astype(np.int16)[None], x[:-1]])
+    left = np.zeros_like(x)
+    left[:, bpp:] = x[:, :-bpp]
+    up_left = np.zeros_like(x)
+    up_left[:, bpp:] = up[:, :-bpp]
+    estimate = left + up - up_left
+    distance_left = np.abs(estimate - left)
+    distance_up = np.abs(estimate - up)
+    distance_up_left = np.abs(estimate - up_left)
+    paeth = np.where((distance_left <= distance_up) & (distance_left <= distance_up_left), left,
+                     np.where(distance_up <= distance_up_left, up, up_left))
+    candidates = np.stack([x, x - left, x - up, x - (left + up) // 2, x - paeth]).astype(np.uint8)
+    # libpng と同じ判定（各バイトを符号付きとみなした絶対値の和）
+    costs = np.abs(candidates.view(np.int8).astype(np.int16)).sum(axis=2)
+    chosen = costs.argmin(axis=0)
+    filtered = candidates[chosen, np.arange(len(rows))]
+    return np.concatenate([chosen.astype(np.uint8)[:, None], filtered], axis=1).tobytes()
+
+def _unfiltered_png_rows(rows):
+    """各行の先頭にフィルタの種類 None（0）を付けた bytes を返す（圧縮しない場合はフィルタで縮まないため計算を省く）"""
+    return np.concatenate([np.zeros((len(rows), 1), np.uint8), rows], axis=1).tobytes()
+
+def save_png_bands(bands, output_path, size, mode, profile=None):
+    """
+    行方向の帯（uint8 のNumPy配列）を順にPNGとして書き出す関数
+    画像全体の画像を作らずにエンコードするため、タイル処理の出力に使う（メモリは帯1つ分）
+    圧縮レベルと戦略は出力プロファイルの PNG の設定に従う（画素値は Image.save と同じで、ファイルのバイト列は異なる）
+    圧縮レベル0（'preview'）では行フィルタを掛けない
+
+    Parameters:
+    - bands: 上から順の帯のイテレータ（(行数, 幅) または (行数, 幅, チャンネル数)）
+    - output_path: 出力先のパス（拡張子は .png に揃える）
+    - size: 画像のサイズ（幅, 高さ）
+    - mode: 画像のモード（'L', 'LA', 'RGB', 'RGBA'）
+    - profile: 出力プロファイル（省略時は 'default'）
+
+    Returns:
+    - 実際に書き出した出力ファイルのパス
+    """
+    output_path = resolve_output_path(output_path, 'png')
+    settings = encoder_options('png', profile)
+    compressor = zlib.compressobj(
+        settings.get('compress_level', zlib.Z_DEFAULT_COMPRESSION), zlib.DEFLATED, zlib.MAX_WBITS,
+        zlib.DEF_MEM_LEVEL, settings.get('compress_type', zlib.Z_DEFAULT_STRATEGY)
+    )
+    filter_rows = _filter_png_rows if settings.get('compress_level') != 0 else None
+    width, height = size
+    bpp = len(mode)
+    previous = np.zeros(width * bpp, np.uint8)
+    written_rows = 0
+    with open(output_path, 'wb') as output_file:
+        output_file.write(PNG_SIGNATURE)
+        _png_chunk(output_file, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, PNG_COLOR_TYPES[mode], 0, 0, 0))
+        for band in bands:
+            rows = np.ascontiguousarray(band, dtype=np.uint8).reshape(len(band), width * bpp)
+            if filter_rows is None:
+                data = compressor.compress(_unfiltered_png_rows(rows))
+            else:
+                data = compressor.compress(filter_rows(rows, previous, bpp))
+            if data:
+                _png_chunk(output_file, b'IDAT', data)
+            previous = rows[-1].copy()
+            written_rows += len(rows)
+        _png_chunk(output_file, b'IDAT', compressor.flush())
+        _png_chunk(output_file, b'IEND', b'')
+    if written_rows != height:
+        raise ValueError(f"PNG bands cover {written_rows} rows, expected {height}")
+    return output_path
+
+def save_image(image, output_path, output_format='png', profile=None, target_bytes=None, quality=None):
+    """
+    画像を出力プロファイルに従って保存する関数
+    target_bytes を指定した場合、またはJPEGの場合は非可逆で保存する
+
+    Parameters:
+    - image: 保存する画像（PIL.Image）
+    - output_path: 出力先のパス（拡張子は出力形式に合わせて修正される）
+    - output_format: 出力形式（'png'、'webp' または 'jpeg'）
+    - profile: 出力プロファイル（'default', 'fast', 'balanced', 'smallest', 'preview'、可逆出力のみ）
+    - target_bytes: 目標のファイルサイズ（バイト、WebP / JPEG のみ）。品質を探索して収める
+    - quality: 非可逆出力の品質（target_bytes 未指定時、省略時は90）
+
+    Returns:
+    - 実際に書き出した出力ファイルのパス
+
+    Raises:
+    - ValueError: PNGで target_bytes を指定した場合
+    """
+    output_path = resolve_output_path(output_path, output_format)
+    if target_bytes:
+        if output_format not in ('webp', 'jpeg'):
+            raise ValueError(f"targetBytes requires a lossy output format (webp or jpeg), got: {output_format}")
+        data, chosen_quality, encodes = encode_to_target(image, output_format, int(target_bytes))
+        logger.info("Target size %d bytes: quality=%d, %d bytes, %d encodes", int(target_bytes), chosen_quality, len(data), encodes)
+        with open(output_path, 'wb') as output_file:
+            output_file.write(data)
+        return output_path
+    if output_format == 'jpeg':
+        image = _prepare_for_format(image, output_format)
+        image.save(output_path, **lossy_encoder_options(output_format, quality or DEFAULT_LOSSY_QUALITY))
+        return output_path
+    settings = encoder_options(output_format, profile)
+    if output_format == 'png' and settings.get('compress_level') == 0 and image.mode in PNG_COLOR_TYPES:
+        # 無圧縮のPNG（'preview'）は、Pillow が圧縮しない場合にも計算する適応フィルタを省いて書き出す
+        return save_png_bands([np.asarray(image)], output_path, image.size, image.mode, profile)
+    image.save(output_path, **settings)
+    return output_path
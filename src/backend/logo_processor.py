@@ -1,79 +1,180 @@
 import os
-import random
+import threading
 from PIL import Image
+from noise.rng import make_rng
+from asset_cache import LRUCache, file_signature
+from malice_logging import get_logger
 
-def apply_logo_if_needed(image, options=None):
+logger = get_logger('logo')
+
+APP_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+# アプリ同梱のロゴの場所と、ロゴが指定されなかった場合のフォールバック
+BUNDLED_LOGO_DIR = os.path.join(APP_ROOT, 'src', 'logo')
+DEFAULT_LOGO_PATH = os.path.join(BUNDLED_LOGO_DIR, 'logo.png')
+
+# ロゴの長辺の、画像の短辺に対する割合
+LOGO_SCALE = 0.2
+
+# デコード済みのロゴ（RGBA）と、リサイズ済みロゴのキャッシュ
+_logo_source_cache = LRUCache(max_entries=8)
+_logo_sprite_cache = LRUCache(max_entries=32)
+
+# 指定されたロゴパス → 解決済みの絶対パス（存在したもののみ記録する）
+_resolved_logo_paths = {}
+_resolved_logo_paths_lock = threading.Lock()
+
+def resolve_logo_path(candidate):
+    """
+    フロントエンドから渡されたロゴパスを絶対パスに解決する関数（結果はメモ化）
+    相対パスはアプリのルートを基準にする
+
+    Returns:
+    - 存在するロゴファイルの絶対パス（見つからない場合はNone）
+    """
+    if not candidate:
+        return None
+    with _resolved_logo_paths_lock:
+        resolved = _resolved_logo_paths.get(candidate)
+    if resolved is not None:
+        return resolved
+    if os.path.isabs(candidate):
+        resolved = os.path.normpath(candidate)
+    else:
+        resolved = os.path.normpath(os.path.join(APP_ROOT, candidate))
+    if not os.path.exists(resolved):
+        return None
+    with _resolved_logo_paths_lock:
+        _resolved_logo_paths[candidate] = resolved
+    return resolved
+
+def _forget_logo_path(logo_path):
+    """ファイルが消えた場合などに、メモ化した解決結果を破棄する"""
+    with _resolved_logo_paths_lock:
+        for candidate in [key for key, value in _resolved_logo_paths.items() if value == logo_path]:
+            del _resolved_logo_paths[candidate]
+
+def _load_logo_source(logo_path, signature):
+    """
+    ロゴ画像をデコードしてRGBAで返す（ファイルの識別子ごとにキャッシュ）
+    """
+    source = _logo_source_cache.get(signature)
+    if source is None:
+        with Image.open(logo_path) as logo:
+            source = logo.convert('RGBA')
+        _logo_source_cache.put(signature, source)
+    return source
+
+def get_logo_sprite(logo_path, max_size, signature=None):
     """
-    必要に応じてロゴを画像に配置する関数
+    長辺を max_size に合わせてLANCZOSでリサイズしたロゴ（RGBA）を返す関数
+    キーは（解決済みパス、更新時刻、サイズ）と目標サイズで、同じ設定のバッチではデコードとリサンプルを1回だけ行う
+
+    Parameters:
+    - logo_path: ロゴ画像の絶対パス
+    - max_size: リサイズ後の長辺のピクセル数
+    - signature: file_signature の結果（省略時はここで取得）
+
+    Returns:
+    - リサイズ済みのロゴ（PIL.Image, RGBA、キャッシュ上の共有オブジェクトなので変更しないこと）
+    """
+    if signature is None:
+        signature = file_signature(logo_path)
+    key = (signature, int(max_size))
+    sprite = _logo_sprite_cache.get(key)
+    if sprite is not None:
+        return sprite
+    logo = _load_logo_source(logo_path, signature)
+    logo_width, logo_height = logo.size
+    aspect_ratio = logo_width / logo_height
+    if logo_width > logo_height:
+        new_width = max_size
+        new_height = int(max_size / aspect_ratio)
+    else:
+        new_height = max_size
+        new_width = int(max_size * aspect_ratio)
+    sprite = logo.resize((new_width, new_height), Image.LANCZOS)
+    _logo_sprite_cache.put(key, sprite)
+    return sprite
+
+def prewarm_logos(directory=BUNDLED_LOGO_DIR, sizes=()):
     """
-    app_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
-    logo_path = None
-    # optionsからlogoPathを優先的に取得
-    if options and 'logoPath' in options and options['logoPath']:
-        candidate = options['logoPath']
-        if os.path.isabs(candidate):
-            if os.path.exists(candidate):
-                logo_path = candidate
-        else:
-            abs_candidate = os.path.join(app_root, candidate)
-            if os.path.exists(abs_candidate):
-                logo_path = abs_candidate
-    # フォールバック: src/logo/logo.png
+    ディレクトリ内のロゴPNGを事前にデコード（必要なら指定サイズにリサイズ）してキャッシュしておく関数
+    常駐ワーカーの起動時に呼び出し、最初のジョブでのデコード待ちをなくす
+
+    Parameters:
+    - directory: ロゴのディレクトリ（省略時は同梱のロゴ）
+    - sizes: 事前に作っておくロゴの長辺サイズ
+
+    Returns:
+    - キャッシュに載せたファイル数
+    """
+    count = 0
+    if not os.path.isdir(directory):
+        return count
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith('.png'):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            signature = file_signature(path)
+            _load_logo_source(path, signature)
+            for size in sizes:
+                get_logo_sprite(path, size, signature=signature)
+            count += 1
+        except Exception as e:
+            logger.warning("Failed to prewarm logo %s: %s", path, e)
+    return count
+
+def resolve_logo_for_options(options=None):
+    """
+    処理オプションから使用するロゴの絶対パスを決める関数
+    optionsのlogoPathを優先し、無ければ src/logo/logo.png にフォールバックする
+
+    Returns:
+    - ロゴファイルの絶対パス（見つからない場合はNone）
+    """
+    logo_path = resolve_logo_path(options.get('logoPath') if options else None)
     if not logo_path:
-        logo_path = os.path.join(app_root, 'src', 'logo', 'logo.png')
-    if os.path.exists(logo_path):
-        logo_position = options.get('logoPosition') if options and 'logoPosition' in options else 'random'
-        return apply_marice_logo(image, logo_path, position=logo_position)
-    return image
+        logo_path = resolve_logo_path(DEFAULT_LOGO_PATH)
+    return logo_path
 
+def logo_size_for(base_size):
+    """
+    画像のサイズ（幅, 高さ）に対するロゴの長辺のピクセル数を返す関数（短辺 × LOGO_SCALE）
+    """
+    return int(min(base_size) * LOGO_SCALE)
 
-def apply_marice_logo(base_image, logo_path, margin=24, position='random'):
+def prepare_logo(base_size, logo_path, margin=24, position='random', rng=None):
     """
-    ベース画像にロゴを指定位置またはランダムに配置する関数
+    ベース画像のサイズに合わせたロゴと配置位置を求める関数（合成そのものは行わない）
+    rng: ランダム配置に使う乱数生成器（numpy.random.Generator、省略時は新規に作成）
+
+    Returns:
+    - (リサイズ済みのロゴ（PIL.Image, RGBA）, 左上の位置（x, y）)、配置できない場合はNone
     """
     try:
-        with Image.open(logo_path) as logo:
-            if logo.mode != 'RGBA':
-                logo = logo.convert('RGBA')
-            base_width, base_height = base_image.size
-            short_edge = min(base_width, base_height)
-            logo_max_size = int(short_edge * 0.2)
-            logo_width, logo_height = logo.size
-            aspect_ratio = logo_width / logo_height
-            if logo_width > logo_height:
-                new_width = logo_max_size
-                new_height = int(logo_max_size / aspect_ratio)
-            else:
-                new_height = logo_max_size
-                new_width = int(logo_max_size * aspect_ratio)
-            logo = logo.resize((new_width, new_height), Image.LANCZOS)
-            if base_width < new_width + margin * 2 or base_height < new_height + margin * 2:
-                print("Image too small to place logo")
-                return base_image
-            positions = {
-                'top-left': (margin, margin),
-                'top-right': (base_width - new_width - margin, margin),
-                'bottom-left': (margin, base_height - new_height - margin),
-                'bottom-right': (base_width - new_width - margin, base_height - new_height - margin)
-            }
-            if position == 'random':
-                position_key = random.choice(list(positions.keys()))
-                paste_position = positions[position_key]
-            elif position in positions:
-                paste_position = positions[position]
-            else:
-                position_key = random.choice(list(positions.keys()))
-                paste_position = positions[position_key]
-            if base_image.mode != 'RGBA':
-                base_with_alpha = base_image.convert('RGBA')
-            else:
-                base_with_alpha = base_image.copy()
-            composite = Image.new('RGBA', base_image.size, (0, 0, 0, 0))
-            composite.paste(logo, paste_position, logo)
-            result = Image.alpha_composite(base_with_alpha, composite)
-            if base_image.mode != 'RGBA':
-                result = result.convert(base_image.mode)
-            return result
-    except Exception as e:
-        print(f"Logo application error: {e}")
-        return base_image
\ No newline at end of file
+        signature = file_signature(logo_path)
+    except OSError:
+        _forget_logo_path(logo_path)
+        raise
+    base_width, base_height = base_size
+    logo = get_logo_sprite(logo_path, logo_size_for(base_size), signature=signature)
+    new_width, new_height = logo.size
+    if base_width < new_width + margin * 2 or base_height < new_height + margin * 2:
+        logger.info("Image too small to place logo: %dx%d", base_width, base_height)
+        return None
+    positions = {
+        'top-left': (margin, margin),
+        'top-right': (base_width - new_width - margin, margin),
+        'bottom-left': (margin, base_height - new_height - margin),
+        'bottom-right': (base_width - new_width - margin, base_height - new_height - margin)
+    }
+    if position in positions:
+        paste_position = positions[position]
+    else:
+        # 'random' または不明な指定はランダムに配置
+        position_keys = list(positions.keys())
+        position_key = position_keys[make_rng(rng).integers(len(position_keys))]
+        paste_position = positions[position_key]
+    return logo, paste_position
@@ -0,0 +1,82 @@
+import os
+import sys
+import logging
+
+# バックエンド全体のロガー階層の根（各モジュールは get_logger で 'malice.<名前>' を使う）
+LOGGER_NAME = 'malice'
+
+# ログレベルを指定する環境変数（CLI の --log-level とオプションの logLevel が優先される）
+LOG_LEVEL_ENV = 'MALICE_LOG_LEVEL'
+
+# 既定のログレベル（警告とエラーのみ）
+DEFAULT_LOG_LEVEL = logging.WARNING
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+# ライブラリとして読み込まれた場合は何も出力しない（ハンドラの設定は呼び出し側が行う）
+logging.getLogger(LOGGER_NAME).addHandler(logging.NullHandler())
+
+def get_logger(name):
+    """
+    'malice' 階層のロガーを返す関数（例：get_logger('watermark') → 'malice.watermark'）
+    """
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+def parse_log_level(value, default=DEFAULT_LOG_LEVEL):
+    """
+    ログレベルの指定（'debug'、'INFO'、'quiet'、数値など）を logging のレベルに変換する関数
+    'quiet' はエラーのみ、'verbose' は INFO として扱う。解釈できない場合は default を返す
+    """
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return logging.DEBUG if value else default
+    if isinstance(value, int):
+        return value
+    name = str(value).strip().upper()
+    if name.isdigit():
+        return int(name)
+    aliases = {'QUIET': logging.ERROR, 'VERBOSE': logging.INFO, 'WARN': logging.WARNING}
+    if name in aliases:
+        return aliases[name]
+    level = logging.getLevelName(name)
+    return level if isinstance(level, int) else default
+
+def configure_logging(level=None, stream=None):
+    """
+    'malice' 階層のログ出力を設定する関数（エントリポイントから1回呼び出す）
+    出力は標準エラー出力に送り、結果のチャネル（標準出力）とは分ける。
+    上位（ルートロガー）には伝播させないため、basicConfig の設定とは干渉しない。
+
+    Parameters:
+    - level: ログレベル（省略時は環境変数 MALICE_LOG_LEVEL、未設定なら WARNING）
+    - stream: 出力先のストリーム（省略時は標準エラー出力）
+
+    Returns:
+    - 設定したログレベル（int）
+    """
+    if level is None:
+        level = os.environ.get(LOG_LEVEL_ENV)
+    level = parse_log_level(level)
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in list(logger.handlers):
+        if not isinstance(handler, logging.NullHandler):
+            logger.removeHandler(handler)
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    return level
+
+def set_log_level(level):
+    """
+    'malice' 階層のログレベルだけを変更する関数（ジョブ単位の logLevel 用）
+
+    Returns:
+    - 変更前のログレベル（元に戻す場合に使う）
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    previous = logger.level
+    logger.setLevel(parse_log_level(level, default=previous))
+    return previous
@@ -1,17 +1,108 @@
-# ガウシアンノイズ
-from .gaussian import apply_gaussian_noise
+import numpy as np
+from .registry import (
+    NoiseKernel, NOISE_KERNELS, register_noise_kernel, get_noise_kernel, get_noise_function
+)
+from .fusion import (
+    FUSED_SEPARATOR, plan_fused_stages, fuse_trailing_stage, is_fused_stage, stage_kernel_options, apply_fused_noise
+)
 
-# DCTノイズ
-from .dct import apply_dct_noise
+# パッケージの公開名（registry.py と fusion.py から再エクスポートするものを含む）
+# apply_xxx_noise は __getattr__ で初回参照時に読み込むため、ここには含めない
+__all__ = [
+    'NoiseKernel', 'NOISE_KERNELS', 'NOISE_TYPES', 'register_noise_kernel', 'get_noise_kernel', 'get_noise_function',
+    'FUSED_SEPARATOR', 'plan_fused_stages', 'fuse_trailing_stage', 'is_fused_stage', 'stage_kernel_options',
+    'apply_fused_noise',
+    'requires_color', 'parallel_safe', 'buffer_dtype', 'plan_noise_stages', 'apply_noise_array',
+]
 
-# ショットノイズ
-from .shot import apply_shot_noise
+# ノイズカーネルの実装と性質は registry.py に登録している
+# モジュールは最初に使う時にインポートする（DCT系はSciPyを読み込むため、使わないジョブでは読み込まない）
 
-# ヒマラヤンショットノイズ
-from .himalayan_shot import apply_himalayan_shot_noise
+# 組み込みのノイズタイプ名（登録順）
+NOISE_TYPES = tuple(NOISE_KERNELS)
 
-# スペックルノイズ
-from .speckle import apply_speckle_noise
+# 関数名 → ノイズタイプ名（from noise import apply_gaussian_noise のような参照用）
+_FUNCTION_NAMES = {
+    kernel.function[1]: name for name, kernel in NOISE_KERNELS.items() if isinstance(kernel.function, tuple)
+}
 
-# マスタードノイズ
-from .mustard import apply_mustard_noise
\ No newline at end of file
+def __getattr__(name):
+    # from noise import apply_xxx_noise の互換（参照された時点でモジュールを読み込む）
+    if name in _FUNCTION_NAMES:
+        return get_noise_function(_FUNCTION_NAMES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def requires_color(noise_types):
+    """
+    指定したノイズの中に、RGBの作業バッファが必要なものがあるかどうかを返す関数
+    """
+    for noise_type in noise_types:
+        kernel = get_noise_kernel(noise_type)
+        if kernel is not None and kernel.requires_color:
+            return True
+    return False
+
+def parallel_safe(noise_type):
+    """
+    ノイズステージ（融合したステージ名も可）を、重ならない行範囲ごとに別スレッドで処理できるかどうかを返す関数
+    融合したステージは、構成するすべてのカーネルが parallel_safe の場合だけ並列に処理できる
+    """
+    kernels = [get_noise_kernel(name) for name in noise_type.split(FUSED_SEPARATOR)]
+    return all(kernel is not None and kernel.parallel_safe for kernel in kernels)
+
+def buffer_dtype(noise_types):
+    """
+    指定したノイズだけを適用する場合の作業バッファの型を返す関数
+    すべて dtype='any' のカーネル（ショットなど）なら uint8 のまま処理し、float32 への変換と量子化を省く
+
+    Returns:
+    - numpy.uint8 または numpy.float32
+    """
+    kernels = [get_noise_kernel(noise_type) for noise_type in noise_types]
+    if kernels and all(kernel is not None and kernel.dtype == 'any' for kernel in kernels):
+        return np.uint8
+    return np.float32
+
+def plan_noise_stages(noise_types, rng=None):
+    """
+    指定されたノイズタイプを、登録情報の phase に従って適用順に並べる関数
+    'pre' → 'shuffle'（rng があれば順序を入れ替える）→ 'post' の順で、同じ phase の中は登録順になる
+
+    Parameters:
+    - noise_types: 適用するノイズタイプ名のリスト（未登録の名前は無視する）
+    - rng: 'shuffle' のステージの順序を決める乱数生成器（省略時は登録順のまま）
+
+    Returns:
+    - ノイズステージのリスト
+    """
+    phases = {'pre': [], 'shuffle': [], 'post': []}
+    for name, kernel in NOISE_KERNELS.items():
+        if name in noise_types:
+            phases[kernel.phase].append(name)
+    if rng is not None:
+        rng.shuffle(phases['shuffle'])
+    return phases['pre'] + phases['shuffle'] + phases['post']
+
+def apply_noise_array(img_array, noise_type, noise_level=0.5, **kernel_options):
+    """
+    作業バッファ（float32のNumPy配列）に単一のノイズを適用する関数
+    クリップや量子化は行わず、可能な限りバッファをその場で更新する
+    dtype='float' のカーネルに整数のバッファを渡した場合は float32 に変換してから適用する（戻り値が新しい配列になる）
+
+    Parameters:
+    - img_array: 作業バッファ（NumPy配列）
+    - noise_type: 適用するノイズの種類（NOISE_KERNELS に登録されている名前、または plan_fused_stages が融合したステージ名）
+    - noise_level: ノイズの強度（0.0〜1.0）
+    - kernel_options: ノイズ関数に渡す追加の引数（例：blockdct の block_size、融合したステージの levels）
+
+    Returns:
+    - ノイズが適用された作業バッファ（NumPy配列）
+    """
+    if is_fused_stage(noise_type):
+        return apply_fused_noise(img_array, noise_level, noise_types=noise_type.split(FUSED_SEPARATOR), **kernel_options)
+    kernel = get_noise_kernel(noise_type)
+    if kernel is None:
+        return img_array
+    if kernel.dtype == 'float' and not np.issubdtype(img_array.dtype, np.floating):
+        img_array = img_array.astype(np.float32)
+    return get_noise_function(noise_type)(img_array, noise_level, **kernel_options)
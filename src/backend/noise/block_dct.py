@@ -0,0 +1,75 @@
+import os
+import math
+import numpy as np
+from scipy.fft import dctn, idctn
+
+# 対応するブロックサイズ（8はJPEGの8x8グリッドと一致）
+BLOCK_SIZES = (8, 16, 64)
+
+def scaled_block_size(block_size, pixel_scale):
+    """
+    縮小プレビューでのブロックの一辺を返す関数
+    縮尺を掛けた大きさに最も近い2のべき乗（2〜最大のブロックサイズ）に丸める。
+    どの大きさも最大のブロックサイズ（タイル処理の乱数単位の行数と同じ64）を割り切るため、
+    タイル処理でもブロックが乱数単位の境界をまたがない
+    """
+    if pixel_scale == 1.0:
+        return block_size
+    exponent = round(math.log2(max(block_size * pixel_scale, 1)))
+    return 2 ** min(max(1, exponent), int(math.log2(max(BLOCK_SIZES))))
+
+def apply_block_dct_noise(img_array, noise_level, block_size=8, workers=None, rng=None, pixel_scale=1.0):
+    """
+    ブロックDCTノイズを適用する関数
+    画像を左上基準の固定ブロックに分割し、(ブロック行, b, ブロック列, b, c) の配列として
+    全ブロックを1回のバッチDCTで変換、ブロック内の中間周波数帯を強調/減衰して逆変換する。
+    計算量は画像サイズに比例し、ブロック単位で独立しているためタイル処理や並列化にも向く。
+
+    Parameters:
+    - img_array: ノイズを適用する画像（NumPy配列、(h, w) または (h, w, c)）
+    - noise_level: ノイズレベル（0.0〜1.0）
+    - block_size: ブロックの一辺（8, 16, 64のいずれか）
+    - workers: FFTのスレッド数（省略時は環境変数 MALICE_FFT_WORKERS、未設定なら全コア）
+    - rng: 乱数生成器（numpy.random.Generator、省略時は新規に作成）
+    - pixel_scale: 元の画像に対する縮尺（縮小プレビュー用）。ブロックの一辺に掛け、元の画像と同じ大きさの模様にする（scaled_block_size を参照）
+
+    Returns:
+    - ノイズが適用された画像（NumPy配列、入力をその場で更新したもの）
+    """
+    if block_size not in BLOCK_SIZES:
+        raise ValueError(f"Unsupported DCT block size: {block_size}. Supported sizes: {BLOCK_SIZES}")
+    if rng is None:
+        rng = np.random.default_rng()
+    if workers is None:
+        workers = int(os.environ.get('MALICE_FFT_WORKERS', -1))
+    amplify_factor = 1.0 + noise_level * 4.0  # 0.0→1.0, 1.0→5.0
+    block_size = scaled_block_size(block_size, pixel_scale)
+
+    # (h, w) の画像は (h, w, 1) のビューとして扱う（書き込みは元の配列に反映される）
+    channels = img_array if img_array.ndim == 3 else img_array[:, :, None]
+    h, w, c = channels.shape
+
+    # ブロックの倍数に満たない端は対称パディングで埋める
+    padded_h = -(-h // block_size) * block_size
+    padded_w = -(-w // block_size) * block_size
+    if (padded_h, padded_w) != (h, w):
+        source = np.pad(channels, ((0, padded_h - h), (0, padded_w - w), (0, 0)), mode='symmetric')
+    else:
+        source = np.ascontiguousarray(channels)
+
+    # (ブロック行, b, ブロック列, b, c) の4次元ブロックスタックとして一括変換
+    rows, cols = padded_h // block_size, padded_w // block_size
+    blocks = source.reshape(rows, block_size, cols, block_size, c)
+    dct_coeffs = dctn(blocks, axes=(1, 3), norm='ortho', workers=workers)
+
+    # ブロック・チャンネルごとにランダムで中間周波数帯を強調または減衰（DC成分は変更しない）
+    freq_threshold = max(1, int((1.0 - noise_level * 0.5) * block_size / 3))
+    amplify = rng.random((rows, 1, cols, 1, c)) > 0.5
+    factors = np.where(amplify, amplify_factor, 1.0 / amplify_factor).astype(dct_coeffs.dtype)
+    band = slice(freq_threshold, block_size - freq_threshold)
+    dct_coeffs[:, band, :, band, :] *= factors
+
+    # 逆DCT変換してブロックを元の並びに戻す
+    restored = idctn(dct_coeffs, axes=(1, 3), norm='ortho', workers=workers, overwrite_x=True)
+    channels[...] = restored.reshape(padded_h, padded_w, c)[:h, :w]
+    return img_array
@@ -1,31 +1,55 @@
+import os
 import numpy as np
-import random
-from scipy.fft import dct, idct
+from scipy.fft import dctn, idctn, next_fast_len
 
-def apply_dct_noise(img_array, noise_level):
+def apply_dct_noise(img_array, noise_level, workers=None, pad_to_fast_len=False, rng=None):
     """
     DCT（離散コサイン変換）ノイズを適用する関数
+    全チャンネルをまとめて2次元DCTし、中間周波数帯をその場で強調/減衰してから逆変換する
 
     Parameters:
-    - img_array: ノイズを適用する画像（NumPy配列）
+    - img_array: ノイズを適用する画像（NumPy配列、(h, w) または (h, w, c)）
     - noise_level: ノイズレベル（0.0〜1.0）
+    - workers: FFTのスレッド数（省略時は環境変数 MALICE_FFT_WORKERS、未設定なら全コア）
+    - pad_to_fast_len: 素数などの変換に不利な辺長を next_fast_len まで対称パディングするかどうか（既定はしない）。
+                       パディングした領域も変換に含まれるため、結果はパディングしない場合と一致しない
+    - rng: 乱数生成器（numpy.random.Generator、省略時は新規に作成）
 
     Returns:
-    - ノイズが適用された画像（NumPy配列）
+    - ノイズが適用された画像（NumPy配列、入力をその場で更新したもの）
     """
+    if rng is None:
+        rng = np.random.default_rng()
+    if workers is None:
+        workers = int(os.environ.get('MALICE_FFT_WORKERS', -1))
     amplify_factor = 1.0 + noise_level * 4.0  # 0.0→1.0, 1.0→5.0
-    h, w, c = img_array.shape
-    for i in range(c):
-        # 2D DCT変換
-        dct_coeffs = dct(dct(img_array[:, :, i].T, norm='ortho').T, norm='ortho')
-        # 高周波成分を強調するマスク
-        mask = np.ones_like(dct_coeffs)
-        freq_threshold = int((1.0 - noise_level * 0.5) * min(h, w) / 3)
-        if random.random() > 0.5:
-            mask[freq_threshold:h-freq_threshold, freq_threshold:w-freq_threshold] = amplify_factor
-        else:
-            mask[freq_threshold:h-freq_threshold, freq_threshold:w-freq_threshold] = 1.0 / amplify_factor
-        # マスク適用と逆DCT変換
-        dct_coeffs = dct_coeffs * mask
-        img_array[:, :, i] = idct(idct(dct_coeffs, norm='ortho').T, norm='ortho').T
-    return img_array
\ No newline at end of file
+
+    # (h, w) の画像は (h, w, 1) のビューとして扱う（書き込みは元の配列に反映される）
+    channels = img_array if img_array.ndim == 3 else img_array[:, :, None]
+    h, w, c = channels.shape
+
+    # 変換サイズを高速な長さに揃える（DCT-IIの対称拡張と整合する symmetric パディング）
+    if pad_to_fast_len:
+        fast_h, fast_w = next_fast_len(h, real=True), next_fast_len(w, real=True)
+    else:
+        fast_h, fast_w = h, w
+    if (fast_h, fast_w) != (h, w):
+        source = np.pad(channels, ((0, fast_h - h), (0, fast_w - w), (0, 0)), mode='symmetric')
+    else:
+        source = channels
+
+    # 2D DCT変換（float32はfloat32のまま計算される）
+    dct_coeffs = dctn(source, axes=(0, 1), norm='ortho', workers=workers)
+
+    # 中間周波数帯をチャンネルごとにランダムで強調または減衰（マスクは作らずスライスをその場で更新）
+    # 帯域は元の画像サイズで決め、パディング後の周波数インデックスに換算する
+    freq_threshold = int((1.0 - noise_level * 0.5) * min(h, w) / 3)
+    band_y = slice(round(freq_threshold * fast_h / h), round((h - freq_threshold) * fast_h / h))
+    band_x = slice(round(freq_threshold * fast_w / w), round((w - freq_threshold) * fast_w / w))
+    factors = np.where(rng.random(c) > 0.5, amplify_factor, 1.0 / amplify_factor).astype(dct_coeffs.dtype)
+    dct_coeffs[band_y, band_x] *= factors
+
+    # 逆DCT変換（係数配列は使い捨てなので上書きを許可）
+    restored = idctn(dct_coeffs, axes=(0, 1), norm='ortho', workers=workers, overwrite_x=True)
+    channels[...] = restored[:h, :w]
+    return img_array
@@ -0,0 +1,148 @@
+import numpy as np
+from .registry import get_noise_kernel, resolve_function
+
+# 融合したステージ名の区切り（例：'speckle+gaussian'）
+FUSED_SEPARATOR = '+'
+
+# 融合したステージで、乱数場と標準偏差の配列を作る行数の単位（作業用の配列をこの行数分に抑える）
+FUSION_CHUNK_ROWS = 256
+
+def _fusion_form(noise_type):
+    kernel = get_noise_kernel(noise_type)
+    return kernel.fusion[0] if kernel is not None and kernel.fusion else None
+
+def plan_fused_stages(noise_stages):
+    """
+    ノイズステージの列から、1つの正規乱数場にまとめられる連続したステージを探して融合する関数
+
+    融合できるのは、乗法（スペックル）を高々1つ先頭に置き、その後に加法（ガウシアン）が続く並びだけで、
+    間にクリップは入らない前提（ステージ列の中ではクリップしない）。
+    - 加法 → 加法: x + s1·z1 + s2·z2 は x + sqrt(s1² + s2²)·z と同じ分布
+    - 乗法 → 加法: x·(1 + i·z1) + s·z2 は、各画素で x + sqrt((x·i)² + s²)·z と同じ分布
+    - 加法 → 乗法、乗法 → 乗法: z1·z2 の項が残り正規分布にならないため、ここで区切る
+
+    Parameters:
+    - noise_stages: ノイズタイプ名のリスト（適用順）
+
+    Returns:
+    - ステージ名のリスト（融合したものは 'speckle+gaussian' のように FUSED_SEPARATOR で連結した名前）
+    """
+    planned = []
+    run = []
+
+    def flush():
+        if len(run) > 1:
+            planned.append(FUSED_SEPARATOR.join(run))
+        else:
+            planned.extend(run)
+        run.clear()
+
+    for noise_type in noise_stages:
+        form = _fusion_form(noise_type)
+        if form == 'multiplicative':
+            flush()
+            run.append(noise_type)
+        elif form == 'additive':
+            run.append(noise_type)
+        else:
+            flush()
+            planned.append(noise_type)
+    flush()
+    return planned
+
+def fuse_trailing_stage(planned_stages, noise_type):
+    """
+    plan_fused_stages の結果の末尾のステージに、後から適用するステージ（仕上げノイズなど）を融合する関数
+    間にクリップやウォーターマークが入らない場合だけ呼び出す
+
+    Parameters:
+    - planned_stages: plan_fused_stages の結果
+    - noise_type: 末尾に追加するノイズタイプ名
+
+    Returns:
+    - (ステージ名のリスト, 融合したかどうか)。融合できない場合は planned_stages をそのまま返す
+    """
+    if not planned_stages:
+        return list(planned_stages), False
+    merged = plan_fused_stages(planned_stages[-1].split(FUSED_SEPARATOR) + [noise_type])
+    if len(merged) != 1:
+        return list(planned_stages), False
+    return list(planned_stages[:-1]) + merged, True
+
+def is_fused_stage(noise_type):
+    """
+    plan_fused_stages で融合したステージ名かどうかを返す関数
+    """
+    return FUSED_SEPARATOR in noise_type
+
+def stage_kernel_options(noise_type, stage_options):
+    """
+    ステージに渡す追加パラメータを、ステージ固有の追加パラメータ（stage_options）から求める関数
+    融合したステージには、構成するステージの pixel_scale（縮小プレビューの縮尺）を引き継ぐ
+
+    Parameters:
+    - noise_type: ノイズタイプ名（融合したステージ名も可）
+    - stage_options: ノイズタイプ名 → 追加パラメータの辞書
+
+    Returns:
+    - 追加パラメータの辞書（新しく作ったもの）
+    """
+    kernel_options = dict(stage_options.get(noise_type, {}))
+    if is_fused_stage(noise_type):
+        for part in noise_type.split(FUSED_SEPARATOR):
+            part_options = stage_options.get(part, {})
+            if 'pixel_scale' in part_options:
+                kernel_options['pixel_scale'] = part_options['pixel_scale']
+                break
+    return kernel_options
+
+def apply_fused_noise(img_array, noise_level, rng=None, noise_types=(), levels=None, pixel_scale=1.0):
+    """
+    融合したステージ（乗法を高々1つ＋加法の並び）を、1つの正規乱数場でまとめて適用する関数
+    各画素に x + sqrt((x·i)² + Σs²)·z を加える（i は乗法の強度、s は加法の標準偏差、z は標準正規乱数）
+
+    Parameters:
+    - img_array: 作業バッファ（float32のNumPy配列）
+    - noise_level: ノイズレベル（0.0〜1.0、各ステージの強度の関数に渡す）
+    - rng: 乱数生成器（numpy.random.Generator、省略時は新規に作成）
+    - noise_types: 融合するノイズタイプ名の並び（plan_fused_stages が作ったもの）
+    - levels: ステージごとのノイズレベル（noise_types と同じ並び。省略時や None の要素は noise_level を使う）
+    - pixel_scale: 元の画像に対する縮尺（縮小プレビュー用。各ステージの強度に掛ける）
+
+    Returns:
+    - ノイズが適用された作業バッファ（NumPy配列、float配列の場合は入力をその場で更新したもの）
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    if not np.issubdtype(img_array.dtype, np.floating):
+        img_array = img_array.astype(np.float32)
+
+    levels = levels or ()
+    gain = 0.0
+    variance = 0.0
+    for index, noise_type in enumerate(noise_types):
+        level = levels[index] if index < len(levels) and levels[index] is not None else noise_level
+        form, scale_function = get_noise_kernel(noise_type).fusion
+        scale = resolve_function(scale_function)(level) * pixel_scale
+        if form == 'multiplicative':
+            gain = scale
+        else:
+            variance += scale * scale
+
+    if not gain:
+        noise = rng.standard_normal(img_array.shape, dtype=img_array.dtype)
+        noise *= np.sqrt(variance)
+        img_array += noise
+        return img_array
+
+    # 標準偏差が画素値に依存するため、行の単位で乱数場と標準偏差を作って加える
+    # （乱数は先頭から順に消費するため、単位の大きさを変えても結果は同じ）
+    for top in range(0, img_array.shape[0], FUSION_CHUNK_ROWS):
+        rows = img_array[top:top + FUSION_CHUNK_ROWS]
+        spread = np.multiply(rows, gain, dtype=rows.dtype)
+        spread *= spread
+        spread += variance
+        np.sqrt(spread, out=spread)
+        spread *= rng.standard_normal(rows.shape, dtype=rows.dtype)
+        rows += spread
+    return img_array
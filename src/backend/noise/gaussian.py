@@ -1,23 +1,37 @@
 import numpy as np
 
-def apply_gaussian_noise(img_array, noise_level):
+def gaussian_std(noise_level):
+    """
+    ノイズレベルに対応するガウシアンノイズの標準偏差を返す関数（0.0→2.0, 1.0→11.0）
+    """
+    return 2.0 + noise_level * 9.0
+
+def apply_gaussian_noise(img_array, noise_level, rng=None, pixel_scale=1.0):
     """
     ガウシアンノイズを適用する関数
 
     Parameters:
     - img_array: ノイズを適用する画像（NumPy配列）
     - noise_level: ノイズレベル（0.0〜1.0）
+    - rng: 乱数生成器（numpy.random.Generator、省略時は新規に作成）
+    - pixel_scale: 元の画像に対する縮尺（縮小プレビュー用）。1/縮尺 四方の画素の平均と同じ見え方になるよう、標準偏差に掛ける
 
     Returns:
-    - ノイズが適用された画像（NumPy配列）
+    - ノイズが適用された画像（NumPy配列、float配列の場合は入力をその場で更新したもの）
     """
+    if rng is None:
+        rng = np.random.default_rng()
+    if not np.issubdtype(img_array.dtype, np.floating):
+        img_array = img_array.astype(np.float32)
+
     # ノイズレベルを2-11の範囲にマッピング
-    std_dev = 2.0 + noise_level * 9.0  # 0.0→2.0, 1.0→11.0
+    std_dev = gaussian_std(noise_level) * pixel_scale
 
-    # ガウシアンノイズを生成
-    noise = np.random.normal(0, std_dev, img_array.shape)
+    # ガウシアンノイズを画像と同じ精度で生成（float32ならfloat32で直接サンプリング）
+    noise = rng.standard_normal(img_array.shape, dtype=img_array.dtype)
+    noise *= std_dev
 
-    # 画像にノイズを追加
-    noisy_img = img_array + noise
+    # 画像にノイズをその場で追加
+    img_array += noise
 
-    return noisy_img
\ No newline at end of file
+    return img_array
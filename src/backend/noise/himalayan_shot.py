@@ -1,6 +1,10 @@
 import numpy as np
+from .impulse import scatter_impulses
 
-def apply_himalayan_shot_noise(img_array, noise_level):
+# 塩（白）、胡椒（黒）、ヒマラヤンピンクソルトの色
+HIMALAYAN_COLORS = ((255, 255, 255), (0, 0, 0), (255, 180, 190))
+
+def apply_himalayan_shot_noise(img_array, noise_level, rng=None, pixel_scale=1.0):
     """
     ヒマラヤソルト＆ペッパーノイズを適用する関数
     通常のソルト＆ペッパーノイズにヒマラヤピンクソルトの色を追加
@@ -8,19 +12,14 @@ def apply_himalayan_shot_noise(img_array, noise_level):
     Parameters:
     - img_array: ノイズを適用する画像（NumPy配列）
     - noise_level: ノイズレベル（0.0〜1.0）
+    - rng: 乱数生成器（numpy.random.Generator、省略時は新規に作成）
+    - pixel_scale: 元の画像に対する縮尺（縮小プレビュー用、scatter_impulses を参照）
 
     Returns:
-    - ノイズが適用された画像（NumPy配列）
+    - ノイズが適用された画像（NumPy配列、入力をその場で更新したもの）
     """
+    if rng is None:
+        rng = np.random.default_rng()
     density = 0.0001 + noise_level * 0.0019  # 0.0→0.01%, 1.0→0.2%
-    salt_mask = np.random.random(img_array.shape[:2]) < density / 3
-    pepper_mask = np.random.random(img_array.shape[:2]) < density / 3
-    himalayan_mask = np.random.random(img_array.shape[:2]) < density / 3
-    noisy_img = img_array.copy()
-    for i in range(img_array.shape[2]):
-        noisy_img[:, :, i][salt_mask] = 255
-        noisy_img[:, :, i][pepper_mask] = 0
-    noisy_img[:, :, 0][himalayan_mask] = 255
-    noisy_img[:, :, 1][himalayan_mask] = 180
-    noisy_img[:, :, 2][himalayan_mask] = 190
-    return noisy_img
\ No newline at end of file
+    # 塩・胡椒・ヒマラヤンピンクを3分の1ずつ
+    return scatter_impulses(img_array, density, HIMALAYAN_COLORS, rng, pixel_scale)
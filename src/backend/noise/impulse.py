@@ -0,0 +1,64 @@
+import numpy as np
+
+def sample_pixels(shape, density, rng):
+    """
+    各画素を確率 density で選んだ場合と同じ分布で、重複しない画素の位置を選ぶ関数
+    画素ごとの乱数やマスクは作らず、選ぶ数を二項分布で決めてから平坦化した位置を選ぶため、
+    時間とメモリは画素数ではなく選んだ数に比例する
+
+    Parameters:
+    - shape: 画像の形（先頭の2要素が (h, w)）
+    - density: 選ぶ画素の割合（0.0〜1.0）
+    - rng: 乱数生成器（numpy.random.Generator）
+
+    Returns:
+    - (行の配列, 列の配列)
+    """
+    height, width = shape[:2]
+    pixel_count = height * width
+    count = rng.binomial(pixel_count, density)
+    if count == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    # 重複しない位置を選ぶ（密度が低いため、全画素の並べ替えではなく選んだ数に比例する方法が使われる）
+    positions = rng.choice(pixel_count, size=count, replace=False)
+    return np.divmod(positions, width)
+
+def scatter_impulses(img_array, density, colors, rng, pixel_scale=1.0):
+    """
+    ランダムに選んだ画素に、指定した色のどれかを書き込む関数（ショットノイズ系の共通処理）
+    位置は sample_pixels で選ぶため、時間とメモリは画素数ではなくインパルスの数に比例する。
+    書き込みは1回のファンシーインデックスで行う。
+    縮小プレビュー（pixel_scale < 1）では、1画素が元の画像の 1/縮尺² 画素分を表すため、
+    選ぶ割合を 1/縮尺² 倍（上限1）にし、その分だけ薄く重ねる（1画素あたりの平均の寄与は同じ）
+
+    Parameters:
+    - img_array: ノイズを適用する画像（NumPy配列、(h, w) または (h, w, c)。型は変換しない）
+    - density: インパルスになる画素の割合（0.0〜1.0）
+    - colors: 書き込む色のリスト（各要素はスカラー、またはチャンネル数と同じ長さの色。等確率で選ぶ）
+    - rng: 乱数生成器（numpy.random.Generator）
+    - pixel_scale: 元の画像に対する縮尺（縮小プレビュー用）
+
+    Returns:
+    - 入力をその場で更新した画像（NumPy配列）
+    """
+    strength = 1.0
+    if pixel_scale < 1.0:
+        scaled_density = min(1.0, density / (pixel_scale * pixel_scale))
+        strength = density / scaled_density
+        density = scaled_density
+    rows, cols = sample_pixels(img_array.shape, density, rng)
+    count = rows.size
+    if count == 0:
+        return img_array
+    palette = np.asarray(colors, dtype=img_array.dtype)
+    values = palette[rng.integers(0, len(palette), size=count)]
+    if img_array.ndim == 3 and values.ndim == 1:
+        values = values[:, np.newaxis]
+    if strength < 1.0:
+        # 元の画素と色を strength の割合で混ぜる（uint8 のバッファは丸めて書き込む）
+        current = img_array[rows, cols].astype(np.float32)
+        current += strength * (values - current)
+        values = np.rint(current) if not np.issubdtype(img_array.dtype, np.floating) else current
+    img_array[rows, cols] = values
+    return img_array
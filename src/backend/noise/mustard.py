@@ -1,6 +1,7 @@
 import numpy as np
+from .impulse import sample_pixels
 
-def apply_mustard_noise(img_array, noise_level):
+def apply_mustard_noise(img_array, noise_level, rng=None, pixel_scale=1.0):
     """
     改良版マスタードノイズを適用する関数
     マスタード色と黒の複合ショットノイズ、サイズの異なる点、ランダムな長さと位置の直線を組み合わせ
@@ -8,12 +9,16 @@ def apply_mustard_noise(img_array, noise_level):
     Parameters:
     - img_array: ノイズを適用する画像（NumPy配列）
     - noise_level: ノイズレベル（0.0〜1.0）
+    - rng: 乱数生成器（numpy.random.Generator、省略時は新規に作成）
+    - pixel_scale: スポット・線・ブロックの大きさ（ピクセル）に掛ける倍率（縮小プレビュー用、乱数の消費は変わらない）
     
     Returns:
-    - ノイズが適用された画像（NumPy配列）
+    - ノイズが適用された画像（NumPy配列、入力をその場で更新したもの）
     """
-    # 画像のコピーを作成
-    noisy_img = img_array.copy()
+    if rng is None:
+        rng = np.random.default_rng()
+    # 入力バッファをその場で更新する
+    noisy_img = img_array
     
     # 画像のサイズを取得
     h, w, c = noisy_img.shape
@@ -21,20 +26,21 @@ def apply_mustard_noise(img_array, noise_level):
     # 1. マスタード色のスポットノイズ (小さいサイズ)
     spot_density_small = 0.0001 + noise_level * 0.0012  # 増加: 0.0→0.01%, 1.0→0.13%
     
-    # 小さいマスタード色のスポットマスク
-    mustard_mask_small = np.random.random(img_array.shape[:2]) < spot_density_small
+    # 小さいマスタード色のスポットの位置（画素ごとのマスクは作らず、選ぶ数に比例する方法で選ぶ）
+    mustard_rows, mustard_cols = sample_pixels(noisy_img.shape, spot_density_small, rng)
     
-    # 黒点のマスク (コントラスト向上のため)
-    black_mask = np.random.random(img_array.shape[:2]) < spot_density_small * 0.4  # 比率増加
+    # 黒点の位置 (コントラスト向上のため)
+    black_rows, black_cols = sample_pixels(noisy_img.shape, spot_density_small * 0.4, rng)  # 比率増加
     
     # マスタード色と黒点を適用
-    noisy_img[:, :, 0][mustard_mask_small] = 250  # R - 黄色がかった色（明るく）
-    noisy_img[:, :, 1][mustard_mask_small] = 220  # G（明るく）
-    noisy_img[:, :, 2][mustard_mask_small] = 60   # B - 青みを抑えた色（少し明るく）
+    # R - 黄色がかった色（明るく）、G（明るく）、B - 青みを抑えた色（少し明るく）
+    noisy_img[mustard_rows, mustard_cols, :3] = (250, 220, 60)
     
     # 黒点を適用 (AI学習の妨害に効果的)
-    for i in range(img_array.shape[2]):
-        noisy_img[:, :, i][black_mask] = 20  # ほぼ黒だが完全な黒ではない
+    noisy_img[black_rows, black_cols] = 20  # ほぼ黒だが完全な黒ではない
+    
+    # 2〜4. スポット・直線・ブロックは形状ごとに、形状を覆う範囲（直線は覆う画素）だけを画像へ直接ブレンドする
+    # 画像全体の層は作らないため、時間とメモリは画素数ではなく形状の大きさに比例する
     
     # 2. 大きめのマスタード色スポット (局所的な特徴を破壊するため)
     # 大きなスポットの数 (ノイズレベルに応じて20〜80に増加)
@@ -42,16 +48,17 @@ def apply_mustard_noise(img_array, noise_level):
     
     for _ in range(num_large_spots):
         # ランダムな位置
-        x = np.random.randint(0, w)
-        y = np.random.randint(0, h)
+        x = rng.integers(0, w)
+        y = rng.integers(0, h)
         
         # スポットの半径 (2〜9ピクセル - 拡大)
-        radius = np.random.randint(2, max(3, int(9 * noise_level) + 1))
+        radius = rng.integers(2, max(3, int(9 * noise_level) + 1))
+        radius = max(1, int(round(radius * pixel_scale)))
         
         # ランダムなマスタード色のバリエーション (より多様なバリエーション)
-        mustard_r = 250 + np.random.randint(-40, 41)  # 210-290の範囲(255でクリップ)
-        mustard_g = 220 + np.random.randint(-35, 36)  # 185-255の範囲
-        mustard_b = 60 + np.random.randint(-25, 26)   # 35-85の範囲
+        mustard_r = 250 + rng.integers(-40, 41)  # 210-290の範囲(255でクリップ)
+        mustard_g = 220 + rng.integers(-35, 36)  # 185-255の範囲
+        mustard_b = 60 + rng.integers(-25, 26)   # 35-85の範囲
         
         # 色の範囲を0-255に制限
         mustard_r = min(255, max(0, mustard_r))
@@ -59,27 +66,27 @@ def apply_mustard_noise(img_array, noise_level):
         mustard_b = min(255, max(0, mustard_b))
         
         # 楕円形のスポットを描画（よりランダムな形状）
-        stretch_x = np.random.uniform(0.8, 1.2)  # X方向の伸縮
-        stretch_y = np.random.uniform(0.8, 1.2)  # Y方向の伸縮
-        
-        for dy in range(-int(radius * stretch_y), int(radius * stretch_y) + 1):
-            for dx in range(-int(radius * stretch_x), int(radius * stretch_x) + 1):
-                # 楕円の方程式
-                if (dx**2 / stretch_x**2 + dy**2 / stretch_y**2) <= radius**2:
-                    ny, nx = y + dy, x + dx
-                    if 0 <= ny < h and 0 <= nx < w:
-                        # マスタード色をランダムに少し変化させる
-                        r_var = np.random.randint(-15, 16)  # バリエーション増加
-                        g_var = np.random.randint(-15, 16)  # バリエーション増加
-                        
-                        # エッジをぼかすためのアルファブレンド率
-                        distance = np.sqrt((dx/stretch_x)**2 + (dy/stretch_y)**2)
-                        alpha = 1.0 - (distance / radius)**1.7  # エッジをよりソフトに
-                        
-                        # 色をブレンド (自然なグラデーション効果)
-                        noisy_img[ny, nx, 0] = (1 - alpha) * noisy_img[ny, nx, 0] + alpha * min(255, max(0, mustard_r + r_var))
-                        noisy_img[ny, nx, 1] = (1 - alpha) * noisy_img[ny, nx, 1] + alpha * min(255, max(0, mustard_g + g_var))
-                        noisy_img[ny, nx, 2] = (1 - alpha) * noisy_img[ny, nx, 2] + alpha * min(255, max(0, mustard_b))
+        stretch_x = rng.uniform(0.8, 1.2)  # X方向の伸縮
+        stretch_y = rng.uniform(0.8, 1.2)  # Y方向の伸縮
+        
+        # スポットを覆う座標グリッド
+        reach_x = int(radius * stretch_x)
+        reach_y = int(radius * stretch_y)
+        dy = np.arange(-reach_y, reach_y + 1)[:, None]
+        dx = np.arange(-reach_x, reach_x + 1)[None, :]
+        
+        # 楕円の方程式とエッジをぼかすためのアルファ
+        distance = np.sqrt((dx / stretch_x) ** 2 + (dy / stretch_y) ** 2)
+        alpha = np.where(distance <= radius, 1.0 - (distance / radius) ** 1.7, 0.0)  # エッジをよりソフトに
+        
+        # マスタード色をピクセルごとにランダムに少し変化させる
+        stamp_shape = alpha.shape
+        color = np.empty(stamp_shape + (3,), dtype=np.float32)
+        color[..., 0] = np.clip(mustard_r + rng.integers(-15, 16, stamp_shape), 0, 255)
+        color[..., 1] = np.clip(mustard_g + rng.integers(-15, 16, stamp_shape), 0, 255)
+        color[..., 2] = mustard_b
+        
+        _blend_region(noisy_img, y - reach_y, x - reach_x, alpha, color)
     
     # 3. マスタード色の直線パターン (ランダムな長さと位置)
     # 線の本数 (ノイズレベルに応じて10〜30本に増加)
@@ -91,65 +98,46 @@ def apply_mustard_noise(img_array, noise_level):
     
     for _ in range(num_angle_groups):
         # 各グループの主な傾き角度を決定
-        main_angle = np.random.uniform(-0.3, 0.3)  # より広い角度範囲
+        main_angle = rng.uniform(-0.3, 0.3)  # より広い角度範囲
         angle_groups.append(main_angle)
     
+    # 線の長さ (ノイズレベルに応じて調整、より長く)
+    line_length = int(min(h, w) * (0.15 + noise_level * 0.5))  # 画像短辺の15%〜65%
+    
+    # 線の太さ (1〜4ピクセル、ノイズレベルに応じて太くなる)
+    thickness = max(1, int(1 + noise_level * 3))
+    thickness = max(1, int(round(thickness * pixel_scale)))
+    offsets = np.arange(-thickness // 2, thickness // 2 + 1)
+    
+    # 半透明の線 (0.6〜0.9)、垂直方向のオフセットに応じてエッジをぼかす
+    alpha = 0.6 + noise_level * 0.3
+    offset_alpha = alpha * (1.0 - np.abs(offsets) / (thickness // 2 + 1))
+    
     # 線を描画
     for i in range(num_lines):
         # 使用する角度グループをランダムに選択
-        group_idx = np.random.randint(0, len(angle_groups))
+        group_idx = rng.integers(0, len(angle_groups))
         main_angle = angle_groups[group_idx]
         
         # 線の開始位置
-        start_x = np.random.randint(0, w)
-        start_y = np.random.randint(0, h)
-        
-        # 線の長さ (ノイズレベルに応じて調整、より長く)
-        line_length = int(min(h, w) * (0.15 + noise_level * 0.5))  # 画像短辺の15%〜65%
+        start_x = rng.integers(0, w)
+        start_y = rng.integers(0, h)
         
         # 線の角度 (主な傾きにランダムなバリエーションを加える)
-        angle = main_angle + np.random.uniform(0.3, 0.8)
+        angle = main_angle + rng.uniform(0.3, 0.8)
         
         # マスタード色のバリエーション
-        line_r = 250 + np.random.randint(-25, 26)
-        line_g = 220 + np.random.randint(-25, 26)
-        line_b = 60 + np.random.randint(-15, 16)
+        line_r = 250 + rng.integers(-25, 26)
+        line_g = 220 + rng.integers(-25, 26)
+        line_b = 60 + rng.integers(-15, 16)
         
         # 色の範囲を0-255に制限
         line_r = min(255, max(0, line_r))
         line_g = min(255, max(0, line_g))
         line_b = min(255, max(0, line_b))
         
-        # 半透明の線を描画
-        alpha = 0.6 + noise_level * 0.3  # 透明度 (0.6〜0.9)
-        
-        # 線を描画
-        for t in range(line_length):
-            # 線上の点を計算（sin/cosを使用して任意の角度の線を描画）
-            dx = int(t * np.cos(angle))
-            dy = int(t * np.sin(angle))
-            x = start_x + dx
-            y = start_y + dy
-            
-            # 画像の境界内かチェック
-            if 0 <= x < w and 0 <= y < h:
-                # 線の太さ (1〜4ピクセル、ノイズレベルに応じて太くなる)
-                thickness = max(1, int(1 + noise_level * 3))
-                
-                # 太さ分の点を描画
-                for offset in range(-thickness//2, thickness//2 + 1):
-                    # 線の垂直方向にオフセット
-                    nx = int(x - offset * np.sin(angle))
-                    ny = int(y + offset * np.cos(angle))
-                    
-                    if 0 <= nx < w and 0 <= ny < h:
-                        # エッジをぼかすためのグラデーション
-                        edge_alpha = alpha * (1.0 - abs(offset) / (thickness//2 + 1))
-                        
-                        # 色をブレンド
-                        noisy_img[ny, nx, 0] = (1 - edge_alpha) * noisy_img[ny, nx, 0] + edge_alpha * line_r
-                        noisy_img[ny, nx, 1] = (1 - edge_alpha) * noisy_img[ny, nx, 1] + edge_alpha * line_g
-                        noisy_img[ny, nx, 2] = (1 - edge_alpha) * noisy_img[ny, nx, 2] + edge_alpha * line_b
+        _blend_line(noisy_img, start_x, start_y, angle, line_length,
+                    offsets, offset_alpha, (line_r, line_g, line_b))
     
     # 4. マスタードブロックノイズ (新機能: 画像に小さな矩形ブロックのノイズを追加)
     if noise_level > 0.3:  # 中〜高ノイズレベルでのみ適用
@@ -158,17 +146,19 @@ def apply_mustard_noise(img_array, noise_level):
         
         for _ in range(num_blocks):
             # ブロックのサイズ (4〜12ピクセル)
-            block_width = np.random.randint(4, max(5, int(12 * noise_level) + 1))
-            block_height = np.random.randint(4, max(5, int(12 * noise_level) + 1))
+            block_width = rng.integers(4, max(5, int(12 * noise_level) + 1))
+            block_height = rng.integers(4, max(5, int(12 * noise_level) + 1))
+            block_width = max(1, int(round(block_width * pixel_scale)))
+            block_height = max(1, int(round(block_height * pixel_scale)))
             
             # ブロックの位置
-            block_x = np.random.randint(0, w - block_width + 1)
-            block_y = np.random.randint(0, h - block_height + 1)
+            block_x = rng.integers(0, w - block_width + 1)
+            block_y = rng.integers(0, h - block_height + 1)
             
             # マスタード色のバリエーション
-            block_r = 250 + np.random.randint(-30, 31)
-            block_g = 220 + np.random.randint(-30, 31)
-            block_b = 60 + np.random.randint(-20, 21)
+            block_r = 250 + rng.integers(-30, 31)
+            block_g = 220 + rng.integers(-30, 31)
+            block_b = 60 + rng.integers(-20, 21)
             
             # 色の範囲を0-255に制限
             block_r = min(255, max(0, block_r))
@@ -176,64 +166,113 @@ def apply_mustard_noise(img_array, noise_level):
             block_b = min(255, max(0, block_b))
             
             # ブロックの透明度 (0.4〜0.7)
-            block_alpha = 0.4 + np.random.random() * 0.3
+            block_alpha = 0.4 + rng.random() * 0.3
             
             # ブロック内にテクスチャを生成（完全に均一にならないように）
-            texture = np.random.normal(1.0, 0.1, (block_height, block_width))
+            texture = rng.normal(1.0, 0.1, (block_height, block_width))
             
-            # ブロックを描画
-            for y in range(block_height):
-                for x in range(block_width):
-                    # 境界ぼかし効果（エッジに近いほど透明に）
-                    edge_x = min(x, block_width - 1 - x) / (block_width * 0.25)
-                    edge_y = min(y, block_height - 1 - y) / (block_height * 0.25)
-                    edge_factor = min(1.0, min(edge_x, edge_y))
-                    
-                    # 位置にテクスチャを適用
-                    local_alpha = block_alpha * edge_factor * texture[y, x]
-                    local_alpha = max(0.0, min(1.0, local_alpha))  # 0-1の範囲に収める
-                    
-                    # ピクセル座標
-                    px, py = block_x + x, block_y + y
-                    
-                    # 境界チェック
-                    if 0 <= px < w and 0 <= py < h:
-                        # 色をブレンド
-                        noisy_img[py, px, 0] = (1 - local_alpha) * noisy_img[py, px, 0] + local_alpha * block_r
-                        noisy_img[py, px, 1] = (1 - local_alpha) * noisy_img[py, px, 1] + local_alpha * block_g
-                        noisy_img[py, px, 2] = (1 - local_alpha) * noisy_img[py, px, 2] + local_alpha * block_b
+            # 境界ぼかし効果（エッジに近いほど透明に）
+            ys = np.arange(block_height)[:, None]
+            xs = np.arange(block_width)[None, :]
+            edge_x = np.minimum(xs, block_width - 1 - xs) / (block_width * 0.25)
+            edge_y = np.minimum(ys, block_height - 1 - ys) / (block_height * 0.25)
+            edge_factor = np.minimum(1.0, np.minimum(edge_x, edge_y))
+            
+            # 位置にテクスチャを適用
+            local_alpha = np.clip(block_alpha * edge_factor * texture, 0.0, 1.0)
+            
+            _blend_region(noisy_img, block_y, block_x, local_alpha,
+                          np.array([block_r, block_g, block_b], dtype=np.float32))
     
     # 5. 微細テクスチャ（新機能: より細かいノイズパターン）
     if noise_level > 0.2:  # 低〜高ノイズレベルで適用
         # マスタード色の微細テクスチャのマスク密度
         texture_density = 0.001 + noise_level * 0.009  # 0.2→0.003, 1.0→0.01
         
-        # テクスチャマスク
-        texture_mask = np.random.random(img_array.shape[:2]) < texture_density
-        
-        # ランダムなマスタード色バリエーションを生成
-        texture_variations = []
-        for _ in range(5):  # 5種類のバリエーション
-            variation = {
-                'r': min(255, max(0, 250 + np.random.randint(-40, 41))),
-                'g': min(255, max(0, 220 + np.random.randint(-40, 41))),
-                'b': min(255, max(0, 60 + np.random.randint(-20, 21)))
-            }
-            texture_variations.append(variation)
-        
-        # テクスチャの各ピクセルに対して処理
-        for y in range(h):
-            for x in range(w):
-                if texture_mask[y, x]:
-                    # ランダムな色バリエーションを選択
-                    variation = texture_variations[np.random.randint(0, len(texture_variations))]
-                    
-                    # 半透明でブレンド (20〜40%)
-                    alpha = 0.2 + np.random.random() * 0.2
-                    
-                    # 色をブレンド
-                    noisy_img[y, x, 0] = (1 - alpha) * noisy_img[y, x, 0] + alpha * variation['r']
-                    noisy_img[y, x, 1] = (1 - alpha) * noisy_img[y, x, 1] + alpha * variation['g']
-                    noisy_img[y, x, 2] = (1 - alpha) * noisy_img[y, x, 2] + alpha * variation['b']
-    
-    return noisy_img
\ No newline at end of file
+        # テクスチャを置く画素の位置（画素ごとのマスクは作らない）
+        ys, xs = sample_pixels(noisy_img.shape, texture_density, rng)
+        
+        # ランダムなマスタード色バリエーションを生成（5種類のパレット）
+        palette = np.empty((5, 3), dtype=np.float32)
+        for i in range(len(palette)):
+            palette[i, 0] = min(255, max(0, 250 + rng.integers(-40, 41)))
+            palette[i, 1] = min(255, max(0, 220 + rng.integers(-40, 41)))
+            palette[i, 2] = min(255, max(0, 60 + rng.integers(-20, 21)))
+        
+        # 選んだ画素の色とアルファを配列でまとめて抽選
+        colors = palette[rng.integers(0, len(palette), ys.size)]
+        
+        # 半透明でブレンド (20〜40%)
+        alpha = (0.2 + rng.random(ys.size) * 0.2).astype(np.float32)[:, None]
+        
+        # 選択された画素をまとめてブレンド
+        noisy_img[ys, xs, :3] = (1 - alpha) * noisy_img[ys, xs, :3] + alpha * colors
+    
+    return noisy_img
+
+def _blend_region(img_array, top, left, alpha, color):
+    """
+    形状（アルファと色）を、形状を覆う矩形の範囲だけ画像にブレンドする
+
+    Parameters:
+    - img_array: 作業バッファ（h, w, c）。先頭の3チャンネルをその場で更新する
+    - top, left: 形状の左上の座標（画像外にはみ出してもよい）
+    - alpha: 形状のアルファ（2次元配列）
+    - color: 形状の色（RGB、または形状と同じ大きさの (…, 3) 配列）
+    """
+    h, w = img_array.shape[:2]
+    sh, sw = alpha.shape
+    # 画像の範囲内に切り詰める
+    y0, x0 = max(top, 0), max(left, 0)
+    y1, x1 = min(top + sh, h), min(left + sw, w)
+    if y0 >= y1 or x0 >= x1:
+        return
+    a = alpha[y0 - top:y1 - top, x0 - left:x1 - left, None].astype(np.float32)
+    color = np.asarray(color, dtype=np.float32)
+    if color.ndim == 3:
+        color = color[y0 - top:y1 - top, x0 - left:x1 - left]
+    # over合成: region = (1 - a) * region + a * color
+    region = img_array[y0:y1, x0:x1, :3]
+    region += a * (color - region)
+
+def _blend_line(img_array, start_x, start_y, angle, length, offsets, offset_alpha, color):
+    """
+    太さを持つ直線をラスタライズし、線が覆う画素だけを画像にブレンドする
+
+    Parameters:
+    - img_array: 作業バッファ（h, w, c）。先頭の3チャンネルをその場で更新する
+    - start_x, start_y: 線の開始位置
+    - angle: 線の角度（ラジアン）
+    - length: 線の長さ（ピクセル）
+    - offsets: 線の垂直方向のオフセット（太さ分）
+    - offset_alpha: オフセットごとのアルファ（エッジほど薄くなる）
+    - color: 線の色（RGB）
+    """
+    h, w = img_array.shape[:2]
+    cos_a, sin_a = np.cos(angle), np.sin(angle)
+    t = np.arange(length)
+    x = start_x + (t * cos_a).astype(np.int64)
+    y = start_y + (t * sin_a).astype(np.int64)
+    # 線の中心が画像内にある点だけを描画
+    inside = (x >= 0) & (x < w) & (y >= 0) & (y < h)
+    x, y = x[inside], y[inside]
+    if x.size == 0:
+        return
+    # 太さ分の点を (点数, オフセット数) の格子で計算
+    nx = (x[:, None] - offsets[None, :] * sin_a).astype(np.int64)
+    ny = (y[:, None] + offsets[None, :] * cos_a).astype(np.int64)
+    point_alpha = np.broadcast_to(offset_alpha[None, :], nx.shape)
+    valid = (nx >= 0) & (nx < w) & (ny >= 0) & (ny < h)
+    nx, ny, point_alpha = nx[valid], ny[valid], point_alpha[valid]
+    if nx.size == 0:
+        return
+    # 同じ画素に複数の点が落ちた場合は、点を順番に重ねた場合と同じになるようアルファをまとめる
+    # （色が同じなので、重ねた結果は 1 - Π(1 - a) のアルファで1回ブレンドしたものと等しい）
+    flat = ny * w + nx
+    order = np.argsort(flat, kind='stable')
+    flat, point_alpha = flat[order], point_alpha[order]
+    starts = np.flatnonzero(np.append(True, flat[1:] != flat[:-1]))
+    rows, cols = np.divmod(flat[starts], w)
+    a = (1.0 - np.multiply.reduceat(1.0 - point_alpha, starts))[:, None].astype(np.float32)
+    region = img_array[rows, cols, :3]
+    img_array[rows, cols, :3] = region + a * (np.asarray(color, dtype=np.float32) - region)
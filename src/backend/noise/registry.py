@@ -0,0 +1,103 @@
+import importlib
+from collections import namedtuple
+
+# ノイズカーネルの登録情報
+# 呼び出し側（apply_noise_array、タイル処理、ステージの融合など）はこの情報から実行方法を選ぶ
+#
+# - name: ノイズタイプ名（オプションの noiseTypes で指定する名前）
+# - function: カーネル関数、または noise パッケージ内のモジュール名と関数名のタプル（初回使用時にインポートする）
+# - in_place: 渡したバッファをその場で更新するか（False の場合は戻り値だけが結果で、タイル処理では書き戻す）
+# - dtype: 入力の型の要件（'float' は浮動小数点が必要で、apply_noise_array が float32 に変換してから渡す。
+#          'any' は uint8 のままでも動き、このカーネルだけの処理では uint8 のバッファを使う）
+# - tileable: 行方向のタイル（UNIT_ROWS の倍数の高さ）に分けて、タイルごとの乱数で処理できるか
+# - parallel_safe: 重ならない行範囲を別々のスレッドで同時に処理できるか（共有状態を持たず、NumPy/SciPy が GIL を解放する）。
+#                  タイル処理では、タイル内の乱数単位（UNIT_ROWS 行）をスレッドプールで並列に処理する
+# - requires_color: RGBの作業バッファが必要か（グレースケールでは扱えない）
+# - tiled_fallback: タイル処理できない場合に代わりに使うノイズタイプ名（無い場合は None で、そのステージを除外する）
+# - phase: パイプライン内での位置（'pre' は先頭、'shuffle' はジョブごとの乱数で順序を入れ替える、'post' は末尾）
+# - fusion: 正規乱数1つで表せるノイズの形と強度の関数（'additive' は x + s·z、'multiplicative' は x·(1 + s·z)）。
+#           (形, 関数) の s を返す関数は function と同じく、関数または (モジュール名, 関数名) で指定する。
+#           連続するステージを1つの乱数場にまとめる（noise/fusion.py）ために使い、融合できない場合は None
+NoiseKernel = namedtuple(
+    'NoiseKernel',
+    ['name', 'function', 'in_place', 'dtype', 'tileable', 'parallel_safe', 'requires_color', 'tiled_fallback', 'phase',
+     'fusion'],
+    defaults=(True, 'float', True, True, False, None, 'shuffle', None)
+)
+
+# 登録済みのカーネル（登録順がステージの既定の並び順になる）
+NOISE_KERNELS = {}
+
+# 読み込み済みのカーネル関数
+_loaded_functions = {}
+
+def register_noise_kernel(name, function, **metadata):
+    """
+    ノイズカーネルを登録する関数（同じ名前で登録し直すと上書きする）
+
+    Parameters:
+    - name: ノイズタイプ名
+    - function: カーネル関数 fn(img_array, noise_level, rng=None, **kernel_options)、
+                または noise パッケージ内の (モジュール名, 関数名)
+    - metadata: NoiseKernel のその他のフィールド（省略時はその場更新・float32・タイル処理可・並列実行可）
+
+    Returns:
+    - 登録した NoiseKernel
+    """
+    kernel = NoiseKernel(name, function, **metadata)
+    NOISE_KERNELS[name] = kernel
+    _loaded_functions.pop(name, None)
+    return kernel
+
+def get_noise_kernel(noise_type):
+    """
+    ノイズタイプ名に対応する NoiseKernel を返す関数（未登録の場合はNone）
+    """
+    return NOISE_KERNELS.get(noise_type)
+
+def get_noise_function(noise_type):
+    """
+    ノイズタイプ名に対応するカーネル関数を返す関数（モジュールは初回だけインポートする）
+
+    Returns:
+    - カーネル関数（未登録のノイズタイプの場合はNone）
+    """
+    noise_function = _loaded_functions.get(noise_type)
+    if noise_function is not None:
+        return noise_function
+    kernel = NOISE_KERNELS.get(noise_type)
+    if kernel is None:
+        return None
+    noise_function = resolve_function(kernel.function)
+    _loaded_functions[noise_type] = noise_function
+    return noise_function
+
+def resolve_function(reference):
+    """
+    関数、または noise パッケージ内の (モジュール名, 関数名) から関数を返す関数（モジュールはここでインポートする）
+    """
+    if isinstance(reference, tuple):
+        module_name, function_name = reference
+        module = importlib.import_module(f'.{module_name}', __package__)
+        return getattr(module, function_name)
+    return reference
+
+# 組み込みのノイズカーネル
+# ガウシアンノイズ（加法、チャンネルごとに独立した正規乱数）
+register_noise_kernel('gaussian', ('gaussian', 'apply_gaussian_noise'),
+                      fusion=('additive', ('gaussian', 'gaussian_std')))
+# DCTノイズ（画像全体の2次元DCT。タイル処理ではブロックDCTに置き換える）
+register_noise_kernel('dct', ('dct', 'apply_dct_noise'), tileable=False, parallel_safe=False, tiled_fallback='blockdct',
+                      phase='pre')
+# ブロックDCTノイズ（ブロック単位で独立しているため、ブロック境界に揃えたタイルに分けられる）
+register_noise_kernel('blockdct', ('block_dct', 'apply_block_dct_noise'), phase='pre')
+# スペックルノイズ（乗法、チャンネルごとに独立した正規乱数）
+register_noise_kernel('speckle', ('speckle', 'apply_speckle_noise'),
+                      fusion=('multiplicative', ('speckle', 'speckle_intensity')))
+# ショットノイズ（画素単位で全チャンネルに同じ値を書き込む。uint8 のままでも動く）
+register_noise_kernel('shot', ('shot', 'apply_shot_noise'), dtype='any')
+# ヒマラヤンショットノイズ（画素単位で色を書き込む）
+register_noise_kernel('himalayan', ('himalayan_shot', 'apply_himalayan_shot_noise'), dtype='any', requires_color=True)
+# マスタードノイズ（画像全体に図形を描くため、タイル処理はできない）
+register_noise_kernel('mustard', ('mustard', 'apply_mustard_noise'), tileable=False, parallel_safe=False,
+                      requires_color=True, phase='post')
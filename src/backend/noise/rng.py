@@ -0,0 +1,43 @@
+import zlib
+import numpy as np
+
+def make_rng(seed=None):
+    """
+    ジョブのシードから乱数生成器（numpy.random.Generator / PCG64）を作る関数
+
+    Parameters:
+    - seed: シード（int、intのリスト、None、または既存のGenerator）
+            Noneの場合はOSのエントロピーから初期化する
+
+    Returns:
+    - numpy.random.Generator
+    """
+    if isinstance(seed, np.random.Generator):
+        return seed
+    return np.random.Generator(np.random.PCG64(np.random.SeedSequence(seed)))
+
+def derive_rng(rng, *key):
+    """
+    親の乱数生成器からキーで識別される独立した子ストリームを作る関数
+    同じ親と同じキーからは常に同じストリームが得られるため、タイル・スレッド・ワーカーへの
+    分割方法や呼び出し順に関係なく結果が再現できる
+
+    Parameters:
+    - rng: 親のGenerator（make_rng で作成したもの）
+    - key: 子ストリームを識別する非負の整数、または文字列（ステージ名など）
+
+    Returns:
+    - 子のnumpy.random.Generator
+    """
+    bit_generator = rng.bit_generator
+    seed_seq = getattr(bit_generator, 'seed_seq', None) or bit_generator._seed_seq
+    spawn_key = tuple(
+        zlib.crc32(part.encode('utf-8')) if isinstance(part, str) else int(part)
+        for part in key
+    )
+    child = np.random.SeedSequence(
+        seed_seq.entropy,
+        spawn_key=tuple(seed_seq.spawn_key) + spawn_key,
+        pool_size=seed_seq.pool_size,
+    )
+    return np.random.Generator(type(bit_generator)(child))
@@ -1,22 +1,21 @@
 import numpy as np
+from .impulse import scatter_impulses
 
-def apply_shot_noise(img_array, noise_level):
+def apply_shot_noise(img_array, noise_level, rng=None, pixel_scale=1.0):
     """
     ショットノイズ（塩胡椒ノイズ）を適用する関数
 
     Parameters:
     - img_array: ノイズを適用する画像（NumPy配列）
     - noise_level: ノイズレベル（0.0〜1.0）
+    - rng: 乱数生成器（numpy.random.Generator、省略時は新規に作成）
+    - pixel_scale: 元の画像に対する縮尺（縮小プレビュー用、scatter_impulses を参照）
 
     Returns:
-    - ノイズが適用された画像（NumPy配列）
+    - ノイズが適用された画像（NumPy配列、入力をその場で更新したもの）
     """
+    if rng is None:
+        rng = np.random.default_rng()
     density = 0.0001 + noise_level * 0.0014  # 0.0→0.01%, 1.0→0.15%
-    salt_mask = np.random.random(img_array.shape[:2]) < density / 2
-    pepper_mask = np.random.random(img_array.shape[:2]) < density / 2
-    noisy_img = img_array.copy()
-    # 塩と胡椒のノイズを適用
-    for i in range(img_array.shape[2]):
-        noisy_img[:, :, i][salt_mask] = 255
-        noisy_img[:, :, i][pepper_mask] = 0
-    return noisy_img
\ No newline at end of file
+    # 塩（255）と胡椒（0）を半分ずつ（全チャンネルに同じ値を書き込むため、グレースケールにも対応）
+    return scatter_impulses(img_array, density, (255, 0), rng, pixel_scale)
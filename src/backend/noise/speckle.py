@@ -1,23 +1,38 @@
 import numpy as np
 
-def apply_speckle_noise(img_array, noise_level):
+def speckle_intensity(noise_level):
+    """
+    ノイズレベルに対応するスペックルノイズの強度（乗数の標準偏差）を返す関数（0.0→0.1%, 1.0→1.5%）
+    """
+    return 0.001 + noise_level * 0.014
+
+def apply_speckle_noise(img_array, noise_level, rng=None, pixel_scale=1.0):
     """
     スペックルノイズを適用する関数
     
     Parameters:
     - img_array: ノイズを適用する画像（NumPy配列）
     - noise_level: ノイズレベル（0.0〜1.0）
+    - rng: 乱数生成器（numpy.random.Generator、省略時は新規に作成）
+    - pixel_scale: 元の画像に対する縮尺（縮小プレビュー用）。ガウシアンと同じく強度に掛ける
     
     Returns:
-    - ノイズが適用された画像（NumPy配列）
+    - ノイズが適用された画像（NumPy配列、float配列の場合は入力をその場で更新したもの）
     """
+    if rng is None:
+        rng = np.random.default_rng()
+    if not np.issubdtype(img_array.dtype, np.floating):
+        img_array = img_array.astype(np.float32)
+
     # ノイズの強度を0.1%～1.5%の範囲にマッピング
-    intensity = 0.001 + noise_level * 0.014  # 0.0→0.1%, 1.0→1.5%
+    intensity = speckle_intensity(noise_level) * pixel_scale
     
     # ノイズを生成（平均1、分散に強度を反映）
-    noise = np.random.normal(1, intensity, img_array.shape)
+    noise = rng.standard_normal(img_array.shape, dtype=img_array.dtype)
+    noise *= intensity
+    noise += 1
     
-    # 乗法的ノイズ（画素値にノイズを乗算）
-    noisy_img = img_array * noise
+    # 乗法的ノイズ（画素値にノイズをその場で乗算）
+    img_array *= noise
     
-    return noisy_img
\ No newline at end of file
+    return img_array
@@ -1,22 +1,9 @@
 import sys
 import os
-import random
-import logging
-from PIL import Image, ImageDraw, ImageOps, ImageEnhance
+import contextlib
+from PIL import Image
 import numpy as np
-try:
-    from scipy.fft import dct, idct  # modern SciPy
-except ImportError:
-    try:
-        from scipy.fftpack import dct, idct  # fallback for older SciPy
-    except ImportError:
-        raise ImportError("scipy is required for DCT operations; please install scipy via pip")
-import piexif
 import json
-import datetime
-
-# ロギング設定
-logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(message)s')
 
 # スクリプトの場所を取得してパスを追加
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -24,327 +11,417 @@ if (script_dir not in sys.path):
     sys.path.append(script_dir)
 
 # 絶対インポートに変更
-from watermark_processor import apply_watermark
-from metadata_processor import process_metadata
-from image_resizer import resize_image
-from logo_processor import apply_logo_if_needed
+# SciPy（DCT、距離変換）や piexif（メタデータ）を使うモジュールは、そのステージを実行する時に読み込む
+from watermark_processor import apply_watermark, prepare_watermark, prewarm_watermarks
+from image_resizer import resize_image, downscale_for_preview
+from logo_processor import prepare_logo, prewarm_logos, resolve_logo_for_options, resolve_logo_path, logo_size_for
 
-# noiseモジュールの関数を明示的に絶対パスでインポート
+# noiseパッケージを絶対パスでインポート（各ノイズのモジュールは最初に使う時に読み込まれる）
 sys.path.insert(0, script_dir)  # noiseディレクトリを最優先に
-from noise.gaussian import apply_gaussian_noise
-from noise.dct import apply_dct_noise
-from noise.shot import apply_shot_noise
-from noise.himalayan_shot import apply_himalayan_shot_noise
-from noise.speckle import apply_speckle_noise
-from noise.mustard import apply_mustard_noise
+from noise import (
+    apply_noise_array, requires_color, get_noise_function, plan_noise_stages, plan_fused_stages,
+    fuse_trailing_stage, stage_kernel_options, FUSED_SEPARATOR
+)
+from noise.rng import make_rng, derive_rng
+from image_buffer import image_to_buffer, buffer_to_image, composite_sprite, placements_require_color
+from image_encoder import save_image
+from asset_cache import LRUCache, file_signature
+from tiled_processor import (
+    should_use_tiled, process_tiled_to_scratch, tile_memory_limit_mb, TiledImage, DEFAULT_MEMORY_LIMIT_MB
+)
+from stage_metrics import StageMetrics
+from malice_logging import get_logger, configure_logging, set_log_level
+
+logger = get_logger('process')
+
+# 仕上げのガウシアンノイズの強度（Lv.2相当の弱いノイズ）
+FINAL_NOISE_LEVEL = 0.2
+
+# 縮小プレビューで縮尺（pixel_scale）を渡すノイズ（強さや粒の大きさがピクセル単位のもの。DCTは画像全体に対する周波数のため不要）
+PIXEL_SCALED_NOISE_TYPES = ('gaussian', 'speckle', 'shot', 'himalayan', 'blockdct', 'mustard')
+
+# ロゴと画像の端との余白（ピクセル、最終出力のサイズ基準）
+LOGO_MARGIN = 24
+
+# プレビューモードの長辺の既定値（ピクセル）
+PREVIEW_MAX_EDGE = 1024
+
+# 常駐ワーカーの起動時に、プレビュー用のロゴを用意しておく縦横比（長辺 / 短辺）
+# GUIは画像を選択すると最初にプレビューを送るため、最初のジョブのロゴのサイズはほぼこのいずれかになる
+PREWARM_ASPECT_RATIOS = (1.0, 4 / 3, 3 / 2, 16 / 9)
+
+# 縮小済みのプレビュー画像（(元の画像ファイルの識別子, resize, previewSize) → (画像, 縮尺)）
+# 常駐ワーカーでは同じ画像の設定を変えてプレビューを繰り返すため、2回目以降はデコードと縮小を省く
+_preview_cache = LRUCache(max_entries=4)
 
 def process_image(input_path, output_path, options=None):
     """
     画像処理のメイン関数
     options: 処理オプションを含む辞書
+    ステージごとの計測結果を1行のJSON（{"event": "metrics", ...}）として出力した後、SUCCESS / ERROR を出力する
     """
+    metrics = StageMetrics().start()
     try:
-        # 入力ファイルの拡張子を確認
-        input_ext = os.path.splitext(input_path)[1].lower()
-        if input_ext not in ['.png', '.jpg', '.jpeg', '.webp']:
-            raise ValueError(f"Unsupported file format: {input_ext}. Only PNG, JPG, and WEBP are supported.")
-        # 画像を開く
-        with Image.open(input_path) as img:
-            processed_img = img.copy()
-
-            # 1. リサイズ処理
+        _process_image(input_path, output_path, options, metrics=metrics)
+        success = True
+    except Exception as e:
+        error = e
+        success = False
+    print(json.dumps({"event": "metrics", **metrics.to_record()}, ensure_ascii=False))
+    if success:
+        print("SUCCESS")
+        return True
+    print(f"ERROR: {error}")
+    return False
+
+def _process_image(input_path, output_path, options=None, metrics=None):
+    """
+    画像処理の本体（例外はそのまま送出する）
+
+    Parameters:
+    - input_path: 入力画像のパス
+    - output_path: 出力先のパス
+    - options: 処理オプションの辞書
+    - metrics: ステージごとの計測結果を記録する StageMetrics（省略時は記録を捨てる）
+
+    Returns:
+    - 実際に書き出した出力ファイルのパス（出力形式に応じて拡張子が変わる場合がある）
+    """
+    if metrics is None:
+        metrics = StageMetrics(track_memory=False)
+    metrics.set('options', options or {})
+    # 入力ファイルの拡張子を確認
+    input_ext = os.path.splitext(input_path)[1].lower()
+    if input_ext not in ['.png', '.jpg', '.jpeg', '.webp']:
+        raise ValueError(f"Unsupported file format: {input_ext}. Only PNG, JPG, and WEBP are supported.")
+    # ジョブの乱数生成器（seed オプションを指定すると結果を再現できる）
+    # ステージ順のシャッフル、各ノイズ、ロゴ配置はここから派生した独立ストリームを使う
+    rng = make_rng(options.get('seed') if options else None)
+
+    # 画像を開く
+    with Image.open(input_path) as img:
+        processed_img = img
+        metrics.set('input', {'format': img.format, 'mode': img.mode, 'width': img.width, 'height': img.height})
+
+        # 1. リサイズ処理（デコード前に呼び出し、JPEGは縮小しながら読み込む）
+        # リサイズする場合はデコードもこのステージに含まれる
+        # プレビューでは、同じ元画像を縮小した画像がキャッシュにあればリサイズ・縮小・デコードを省く
+        preview = bool(options and options.get('preview'))
+        preview_key = _preview_cache_key(input_path, options) if preview else None
+        cached_preview = _preview_cache.get(preview_key) if preview_key is not None else None
+        if preview:
+            metrics.set('previewCached', cached_preview is not None)
+        # キャッシュが持つ画像（タイル処理は入力を閉じるため、複製を渡す）
+        cache_owned = cached_preview is not None
+        geometry_scale = 1.0
+        if cached_preview is not None:
+            with metrics.stage('preview'):
+                processed_img, geometry_scale = cached_preview
+        else:
             if options and options.get('resize'):
                 resize_option = options.get('resize')
-                processed_img = resize_image(processed_img, resize_option)
-
-            # 2. 各ノイズの適用（DCT→ランダム→マスタード）
-            if options and 'noiseLevel' in options and 'dct' in options.get('noiseTypes', []):
-                noise_level = options.get('noiseLevel', 0.5)
-                processed_img = apply_single_noise(
-                    processed_img,
-                    noise_type='dct',
-                    noise_level=noise_level
-                )
-            random_noise_types = []
-            if options and 'noiseLevel' in options:
-                noise_types = options.get('noiseTypes', [])
-                if 'gaussian' in noise_types:
-                    random_noise_types.append('gaussian')
-                if 'speckle' in noise_types:
-                    random_noise_types.append('speckle')
-                if 'shot' in noise_types:
-                    random_noise_types.append('shot')
-                if 'himalayan' in noise_types:
-                    random_noise_types.append('himalayan')
-                random.shuffle(random_noise_types)
-                for noise_type in random_noise_types:
-                    noise_level = options.get('noiseLevel', 0.5)
-                    processed_img = apply_single_noise(
-                        processed_img,
-                        noise_type=noise_type,
-                        noise_level=noise_level
+                with metrics.stage('resize'):
+                    processed_img = resize_image(processed_img, resize_option)
+            # プレビューモードでは縮小した画像で同じ処理を行う（シード、ウォーターマーク・ロゴの配置は同じ）
+            # 縮尺は、ピクセル単位の大きさを持つパラメータ（線の太さ、余白など）を合わせるために使い、
+            # ノイズの強さと粒の大きさも合わせて、プレビューの見え方を本番の出力を縮小したものに近づける
+            if preview:
+                with metrics.stage('preview'):
+                    processed_img, geometry_scale = downscale_for_preview(
+                        processed_img, int(options.get('previewSize', PREVIEW_MAX_EDGE))
                     )
-            if options and 'noiseLevel' in options and 'mustard' in options.get('noiseTypes', []):
-                noise_level = options.get('noiseLevel', 0.5)
-                processed_img = apply_single_noise(
-                    processed_img,
-                    noise_type='mustard',
-                    noise_level=noise_level
+                    # 縮小した画像だけを保持する（縮小しない場合はファイルを閉じると使えなくなるため保持しない）
+                    if preview_key is not None and processed_img is not img:
+                        _preview_cache.put(preview_key, (processed_img, geometry_scale))
+                        cache_owned = True
+        # タイル処理では画素をスクラッチへ直接デコードするため、ここでは読み込まない（tiled ステージに含まれる）
+        tiled = should_use_tiled(processed_img.size, options)
+        metrics.set('tiled', tiled)
+        if not tiled:
+            # ファイルを閉じる前に画素を読み込んでおく（複製はしない）
+            with metrics.stage('decode'):
+                processed_img.load()
+
+        # 2. 各ノイズの適用（DCT→ランダム→マスタード。順序は noise の登録情報で決まる）
+        # ノイズからロゴまではfloat32の作業バッファを使い回し、クリップ・量子化は保存前の1回だけ行う
+        # noiseLevel が無い場合はノイズステージを行わない（タイル処理にも既定の強度を渡す）
+        noise_stages = []
+        noise_level = options.get('noiseLevel', 0.5) if options else 0.5
+        if options and 'noiseLevel' in options:
+            noise_types = options.get('noiseTypes', [])
+            noise_stages = plan_noise_stages(noise_types, derive_rng(rng, 'stage-order'))
+        # ステージ固有の追加パラメータ（プレビューでは、縮尺に依存するカーネルに pixel_scale を渡す）
+        stage_options = {
+            'blockdct': {'block_size': int(options.get('dctBlockSize', 8))} if options else {},
+        }
+        if geometry_scale != 1.0:
+            for noise_type in PIXEL_SCALED_NOISE_TYPES:
+                stage_options.setdefault(noise_type, {})['pixel_scale'] = geometry_scale
+        # 3. ウォーターマークと5. ロゴの配置を先に求める（画素には依存しない）
+        image_size = processed_img.size
+        metrics.set('working', {'mode': processed_img.mode, 'width': image_size[0], 'height': image_size[1]})
+        metrics.set('noiseStages', noise_stages)
+        with metrics.stage('watermark'):
+            watermark_placement = _prepare_watermark_placement(options, image_size, geometry_scale)
+        with metrics.stage('logo'):
+            logo_placement = _prepare_logo_placement(options, image_size, rng=derive_rng(rng, 'logo'), geometry_scale=geometry_scale)
+
+        if tiled:
+            # 巨大な画像はタイルに分けて、タイル作業領域の上限の範囲でデコードと2〜5をまとめて処理する
+            # 結果はスクラッチファイル上の TiledImage で、PNGは画像全体を作らずにエンコードする
+            # （ステージがタイルごとに交互に進むため、まとめて1つのステージとして計測する）
+            with metrics.stage('tiled'):
+                processed_img = process_tiled_to_scratch(
+                    processed_img.copy() if cache_owned else processed_img,
+                    noise_stages, noise_level, stage_options, rng,
+                    watermark=watermark_placement, logo=logo_placement,
+                    final_noise_level=FINAL_NOISE_LEVEL,
+                    memory_limit_mb=tile_memory_limit_mb(options) or DEFAULT_MEMORY_LIMIT_MB,
+                    scratch_dir=options.get('scratchDir'),
+                    fuse_stages=options.get('fuseNoise', True)
                 )
+        else:
+            # モードは1回だけ正規化し、色チャンネルだけを処理する（アルファは別持ちにして最後に戻す）
+            with metrics.stage('buffer'):
+                # 色を使うノイズに加え、色のあるウォーターマーク（アウトライン）やロゴを合成する場合もRGBで処理する
+                require_color = requires_color(noise_stages) or placements_require_color(watermark_placement, logo_placement)
+                buffer, alpha = image_to_buffer(processed_img, require_color=require_color)
+            # 連続するガウシアン・スペックルは1つの乱数場にまとめる（分布は同じ。fuseNoise: false で無効）
+            # ウォーターマークが無い場合は間でクリップしないため、4. 仕上げノイズも末尾のステージに融合できる
+            fuse_noise = not options or options.get('fuseNoise', True)
+            final_fused = False
+            if fuse_noise:
+                noise_stages = plan_fused_stages(noise_stages)
+                if watermark_placement is None:
+                    noise_stages, final_fused = fuse_trailing_stage(noise_stages, 'gaussian')
+            for index, noise_type in enumerate(noise_stages):
+                kernel_options = stage_kernel_options(noise_type, stage_options)
+                if final_fused and index == len(noise_stages) - 1:
+                    # 融合した仕上げノイズ（最後の要素）だけ強度が異なる
+                    fused_count = noise_type.count(FUSED_SEPARATOR)
+                    kernel_options['levels'] = [noise_level] * fused_count + [FINAL_NOISE_LEVEL]
+                with metrics.stage(f'noise:{noise_type}'):
+                    buffer = apply_noise_array(
+                        buffer, noise_type, noise_level,
+                        rng=derive_rng(rng, 'noise', noise_type),
+                        **kernel_options
+                    )
+            # ウォーターマークとロゴは0-255の範囲の画素に重ね、重なる範囲だけを合成する
+            if watermark_placement is not None:
+                with metrics.stage('watermark'):
+                    np.clip(buffer, 0, 255, out=buffer)
+                    composite_sprite(buffer, *watermark_placement, alpha=alpha)
 
-            # 3. ウォーターマークの付与
-            if options and options.get('applyWatermark'):
-                watermarkPath = options.get('watermarkPath')
-                watermarkOpacity = options.get('watermarkOpacity', 0.6)
-                watermarkOpacityMin = options.get('watermarkOpacityMin', 0.05)
-                invertWatermark = options.get('invertWatermark', False)
-                enableOutline = options.get('enableOutline', True)
-                watermarkSize = options.get('watermarkSize', 0.5)
-                outlineColor = options.get('outlineColor', [255, 255, 255])
-                watermarkOpacity = max(watermarkOpacityMin, watermarkOpacity)
-                # ウォーターマークのパラメータを取得（キャメルケースに統一）
-                watermarkPath = options.get('watermarkPath')
-                watermarkOpacity = options.get('watermarkOpacity', 0.6)
-                # フロントエンドのHTMLから取得した最小値を使用
-                watermarkOpacityMin = options.get('watermarkOpacityMin', 0.05)
-                invertWatermark = options.get('invertWatermark', False)
-                enableOutline = options.get('enableOutline', True)
-                watermarkSize = options.get('watermarkSize', 0.5)
-                outlineColor = options.get('outlineColor', [255, 255, 255])  # デフォルト白色
-                
-                # HTMLから取得した最小値を適用
-                watermarkOpacity = max(watermarkOpacityMin, watermarkOpacity)
-                
-                # 詳細なログ出力
-                print(f"\n\n===== WATERMARK PROCESSING START =====")
-                print(f"Options received from frontend: {options}")
-                print(f"Watermark path: {watermarkPath}")
-                print(f"All watermark params:")
-                print(f"- path: {watermarkPath}")
-                print(f"- opacity: {watermarkOpacity}")
-                print(f"- invert: {invertWatermark}")
-                print(f"- enableOutline: {enableOutline}")
-                print(f"- size: {watermarkSize}")
-                print(f"- outlineColor: {outlineColor}")
-                
-                # パラメータ型チェック
-                print(f"Parameter types:")
-                print(f"- path: {type(watermarkPath)}")
-                print(f"- opacity: {type(watermarkOpacity)}")
-                print(f"- invert: {type(invertWatermark)}")
-                print(f"- enableOutline: {type(enableOutline)}")
-                print(f"- size: {type(watermarkSize)}")
-                print(f"- outlineColor: {type(outlineColor)}")
-                
-                # パスの正規化と絶対パス化
-                if watermarkPath:                    # 相対パスを絶対パスに変換（必要な場合）
-                    if not os.path.isabs(watermarkPath):
-                        # 相対パスの場合、基準ディレクトリからの絶対パスに変換
-                        base_dir = os.path.dirname(os.path.abspath(__file__))  # 現在のスクリプトの場所
-                        watermarkPath = os.path.normpath(os.path.join(base_dir, '..', '..', watermarkPath))
-                    else:
-                        watermarkPath = os.path.normpath(watermarkPath)
-                    
-                    print(f"Normalized watermark path: {watermarkPath}")
-                    print(f"File exists: {os.path.exists(watermarkPath) if watermarkPath else False}")
-                    if os.path.exists(watermarkPath):
-                        print(f"File is readable: {os.access(watermarkPath, os.R_OK)}")
-                        print(f"File size: {os.path.getsize(watermarkPath)} bytes")
-                    else:
-                        # パス解決の試行（異なるベースディレクトリからの相対パスの可能性を試す）
-                        possible_bases = [
-                            os.path.join(base_dir, '..', '..', 'watermark'),
-                            os.path.join(base_dir, '..', '..', 'src', 'watermark'),
-                            os.path.join(base_dir, '..', '..', 'user_data', 'watermark')
-                        ]
-                        print(f"File not found, trying alternative paths")
-                        
-                        # 元のパスからファイル名部分を抽出
-                        filename = os.path.basename(watermarkPath)
-                        for base in possible_bases:
-                            alt_path = os.path.join(base, filename)
-                            if os.path.exists(alt_path):
-                                print(f"Found alternative path: {alt_path}")
-                                watermarkPath = alt_path
-                                break
-                        
-                        print(f"After path resolution: {watermarkPath}")
-                        print(f"File exists: {os.path.exists(watermarkPath)}")
-                  # アウトラインの色の型チェック
-                if outlineColor is None:
-                    print("outlineColor is None, setting default")
-                    outlineColor = [255, 255, 255]  # デフォルト白色
-                elif not isinstance(outlineColor, list):
-                    print(f"outlineColor is not a list, converting: {outlineColor}")
-                    try:
-                        # 文字列の場合は変換を試みる
-                        if isinstance(outlineColor, str):
-                            if ',' in outlineColor:
-                                outlineColor = [int(c.strip()) for c in outlineColor.split(',')[:3]]
-                            elif outlineColor.startswith('#'):
-                                color = outlineColor.lstrip('#')
-                                outlineColor = [int(color[i:i+2], 16) for i in (0, 2, 4)]
-                        else:
-                            # その他の型の場合は白色をデフォルトとする
-                            outlineColor = [255, 255, 255]
-                    except Exception as e:
-                        print(f"Error converting outlineColor: {e}")
-                        outlineColor = [255, 255, 255]  # エラー時のデフォルト
-                  # 有効なウォーターマークパスがある場合のみ適用
-                if watermarkPath and os.path.exists(watermarkPath):
-                    print(f"Watermark file exists, proceeding to apply watermark")
-                    try:
-                        processed_img = apply_watermark(
-                            processed_img,
-                            watermarkPath,
-                            opacity=watermarkOpacity,
-                            invert=invertWatermark,
-                            enableOutline=enableOutline,
-                            sizeFactor=watermarkSize,
-                            outlineColor=outlineColor
-                        )
-                        print(f"Watermark application completed")
-                    except Exception as e:
-                        print(f"ERROR: Exception during watermark application: {str(e)}")
-                        import traceback
-                        print(f"TRACE: {traceback.format_exc()}")
-                else:
-                    print(f"Watermark path invalid or file not found: {watermarkPath}")
-                
-                print(f"===== WATERMARK PROCESSING FINISHED =====\n")
-
-            # 4. 仕上げノイズ処理（ガウシアン）
-            final_noise_level = 0.2  # Lv.2相当の弱いノイズ
-            processed_img = apply_single_noise(
-                processed_img,
-                noise_type='gaussian',
-                noise_level=final_noise_level
-            )
-
-            # 5. ロゴの追加
-            # logoPathのパス解決と存在確認
-            logoPath = options.get('logoPath') if options else None
-            if logoPath:
-                print(f"Logo path received from frontend: {logoPath}")
-                if not os.path.isabs(logoPath):
-                    base_dir = os.path.dirname(os.path.abspath(__file__))
-                    abs_logo_path = os.path.normpath(os.path.join(base_dir, '..', '..', logoPath))
-                else:
-                    abs_logo_path = os.path.normpath(logoPath)
-                print(f"Normalized logo path: {abs_logo_path}")
-                print(f"Logo file exists: {os.path.exists(abs_logo_path)}")
-                if os.path.exists(abs_logo_path):
-                    options['logoPath'] = abs_logo_path
-                else:
-                    print(f"Logo file not found, fallback to default in logo_processor.py")
-            processed_img = apply_logo_if_needed(processed_img, options)
-
-            # 6. メタデータ改竄処理（現在はオミット）
-            # if options and (options.get('removeMetadata', True) or 
-            #             options.get('addFakeMetadata', True) or 
-            #             options.get('addNoAIFlag', True)):
-            #     
-            #     metadata_options = {
-            #         'removeMetadata': options.get('removeMetadata', True),
-            #         'addFakeMetadata': options.get('addFakeMetadata', True),
-            #         'fakeMetadataType': options.get('fakeMetadataType', 'random'),
-            #         'addNoAIFlag': options.get('addNoAIFlag', True),
-            #     }
-            #     
-            #     process_metadata(output_path, output_path, metadata_options)
-
-            # 出力形式の設定を処理
-            output_format = options.get('outputFormat', 'png') if options else 'png'
-            output_ext = os.path.splitext(output_path)[1].lower()
-            if output_format == 'webp' and output_ext != '.webp':
-                output_path = os.path.splitext(output_path)[0] + '.webp'
-            elif output_format == 'png' and output_ext != '.png':
-                output_path = os.path.splitext(output_path)[0] + '.png'
-            if output_format == 'webp':
-                processed_img.save(output_path, format='WEBP', lossless=True, quality=100)
+            # 4. 仕上げノイズ処理（ガウシアン。末尾のステージに融合した場合は適用済み）
+            if not final_fused:
+                with metrics.stage('final_noise'):
+                    buffer = apply_noise_array(
+                        buffer, 'gaussian', FINAL_NOISE_LEVEL,
+                        rng=derive_rng(rng, 'final', 'gaussian'),
+                        **stage_options.get('gaussian', {})
+                    )
+
+            # 5. ロゴの追加（仕上げノイズで範囲外になった画素を戻してから合成する）
+            if logo_placement is not None:
+                with metrics.stage('logo'):
+                    np.clip(buffer, 0, 255, out=buffer)
+                    composite_sprite(buffer, *logo_placement, alpha=alpha)
+            with metrics.stage('buffer'):
+                processed_img = buffer_to_image(buffer, alpha)
+
+        # 6. メタデータ改竄処理（現在はオミット。戻す場合は piexif を読み込まないよう、ここでインポートする）
+        # from metadata_processor import process_metadata
+        # if options and (options.get('removeMetadata', True) or 
+        #             options.get('addFakeMetadata', True) or 
+        #             options.get('addNoAIFlag', True)):
+        #     
+        #     metadata_options = {
+        #         'removeMetadata': options.get('removeMetadata', True),
+        #         'addFakeMetadata': options.get('addFakeMetadata', True),
+        #         'fakeMetadataType': options.get('fakeMetadataType', 'random'),
+        #         'addNoAIFlag': options.get('addNoAIFlag', True),
+        #     }
+        #     
+        #     process_metadata(output_path, output_path, metadata_options)
+
+        # 出力形式と出力プロファイル（エンコードの速さとサイズのバランス）に従って保存
+        output_format = options.get('outputFormat', 'png') if options else 'png'
+        output_profile = options.get('outputProfile') if options else None
+        target_bytes = options.get('targetBytes') if options else None
+        if options and options.get('preview'):
+            # プレビューは最速の設定でエンコードし、目標サイズの探索も行わない
+            output_profile = 'preview'
+            target_bytes = None
+        # targetBytes を指定すると、非可逆（WebP / JPEG）で目標サイズに収まる品質を探索する
+        if output_format == 'jpg':
+            output_format = 'jpeg'
+        quality = options.get('outputQuality') if options else None
+        with metrics.stage('encode'):
+            if isinstance(processed_img, TiledImage):
+                # タイル処理の結果はスクラッチから保存し、保存後にスクラッチを削除する
+                with processed_img:
+                    output_path = processed_img.save(
+                        output_path, output_format, output_profile, target_bytes=target_bytes, quality=quality
+                    )
             else:
-                processed_img.save(output_path, format='PNG')
-        print("SUCCESS")
-        return True
-    except Exception as e:
-        print(f"ERROR: {e}")
-        return False
+                output_path = save_image(
+                    processed_img, output_path, output_format, output_profile,
+                    target_bytes=target_bytes, quality=quality
+                )
+        metrics.set('output', {
+            'path': output_path,
+            'format': output_format,
+            'mode': processed_img.mode,
+            'width': processed_img.width,
+            'height': processed_img.height,
+            'bytes': os.path.getsize(output_path),
+        })
+    return output_path
 
-def apply_noise(image, noise_level=0.5, noise_types=None):
+def _preview_cache_key(input_path, options):
     """
-    画像にノイズを適用する関数
-    
-    Parameters:
-    - image: ノイズを適用する画像（PIL.Image）
-    - noise_level: ノイズの強度（0.0〜1.0）
-    - noise_types: 適用するノイズの種類のリスト（例：['gaussian', 'dct', 'shot', 'speckle', 'himalayan', 'mustard']）
-    
+    プレビューの縮小画像のキャッシュキーを返す関数
+    GUIは元の画像を一時ファイルにコピーしてから送るため、sourcePath（元の画像のパス）があればその識別子を使う
+
     Returns:
-    - ノイズが適用された画像（PIL.Image）
+    - (ファイルの識別子, resize, previewSize)、識別子を取得できない場合はNone（キャッシュしない）
     """
-    if noise_types is None:
-        noise_types = ['gaussian', 'dct']  # デフォルトのノイズタイプ
-    
-    # PIL画像をNumPy配列に変換
-    img_array = np.array(image).astype(np.float32)
-    
-    # ガウシアンノイズ
-    if 'gaussian' in noise_types:
-        img_array = apply_gaussian_noise(img_array, noise_level)
-    
-    # DCTノイズ
-    if 'dct' in noise_types:
-        img_array = apply_dct_noise(img_array, noise_level)
-    
-    # ショットノイズ
-    if 'shot' in noise_types:
-        img_array = apply_shot_noise(img_array, noise_level)
-    
-    # ヒマラヤソルト＆ペッパーノイズ
-    if 'himalayan' in noise_types:
-        img_array = apply_himalayan_shot_noise(img_array, noise_level)
-    
-    # スペックルノイズ
-    if 'speckle' in noise_types:
-        img_array = apply_speckle_noise(img_array, noise_level)
-    
-    # マスタードノイズ
-    if 'mustard' in noise_types:
-        img_array = apply_mustard_noise(img_array, noise_level)
-    
-    # NumPy配列をPIL画像に戻す
-    img_array = np.clip(img_array, 0, 255).astype(np.uint8)
-    return Image.fromarray(img_array)
+    try:
+        signature = file_signature(options.get('sourcePath') or input_path)
+    except OSError:
+        return None
+    return (signature, options.get('resize'), int(options.get('previewSize', PREVIEW_MAX_EDGE)))
 
-def apply_single_noise(image, noise_type, noise_level=0.5):
+def _prepare_watermark_placement(options, image_size, geometry_scale=1.0):
     """
-    画像に単一のノイズを適用する関数
-    
-    Parameters:
-    - image: ノイズを適用する画像（PIL.Image）
-    - noise_type: 適用するノイズの種類（'gaussian', 'dct', 'shot', 'speckle', 'himalayan', 'mustard'）
-    - noise_level: ノイズの強度（0.0〜1.0）
-    
+    オプションに従ってウォーターマークのレイヤーと配置位置を求める関数（合成は呼び出し側で行う）
+
     Returns:
-    - ノイズが適用された画像（PIL.Image）
+    - (ウォーターマークレイヤー, 位置)、適用しない場合はNone
     """
-    img_array = np.array(image).astype(np.float32)
-    
-    if noise_type == 'gaussian':
-        img_array = apply_gaussian_noise(img_array, noise_level)
-    elif noise_type == 'dct':
-        img_array = apply_dct_noise(img_array, noise_level)
-    elif noise_type == 'shot':
-        img_array = apply_shot_noise(img_array, noise_level)
-    elif noise_type == 'himalayan':
-        img_array = apply_himalayan_shot_noise(img_array, noise_level)
-    elif noise_type == 'speckle':
-        img_array = apply_speckle_noise(img_array, noise_level)
-    elif noise_type == 'mustard':
-        img_array = apply_mustard_noise(img_array, noise_level)
-    
-    img_array = np.clip(img_array, 0, 255).astype(np.uint8)
-    return Image.fromarray(img_array)
+    placement = None
+    if options and options.get('applyWatermark'):
+        # ウォーターマークのパラメータを取得（キャメルケースに統一）
+        watermarkPath = options.get('watermarkPath')
+        watermarkOpacity = options.get('watermarkOpacity', 0.6)
+        # フロントエンドのHTMLから取得した最小値を使用
+        watermarkOpacityMin = options.get('watermarkOpacityMin', 0.05)
+        invertWatermark = options.get('invertWatermark', False)
+        enableOutline = options.get('enableOutline', True)
+        watermarkSize = options.get('watermarkSize', 0.5)
+        outlineColor = options.get('outlineColor', [255, 255, 255])  # デフォルト白色
+        smoothOutline = options.get('smoothOutline', False)
+
+        # HTMLから取得した最小値を適用
+        watermarkOpacity = max(watermarkOpacityMin, watermarkOpacity)
+
+        # 詳細なログ出力（DEBUGレベルの場合のみ）
+        logger.debug("Watermark params: path=%r, opacity=%r, invert=%r, enableOutline=%r, size=%r, outlineColor=%r",
+                     watermarkPath, watermarkOpacity, invertWatermark, enableOutline, watermarkSize, outlineColor)
+
+        # パスの正規化と絶対パス化
+        # 存在確認は file_signature の stat 1回で行い、その結果を prepare_watermark にも渡す
+        signature = None
+        if watermarkPath:                    # 相対パスを絶対パスに変換（必要な場合）
+            base_dir = os.path.dirname(os.path.abspath(__file__))  # 現在のスクリプトの場所
+            if not os.path.isabs(watermarkPath):
+                # 相対パスの場合、基準ディレクトリからの絶対パスに変換
+                watermarkPath = os.path.normpath(os.path.join(base_dir, '..', '..', watermarkPath))
+            else:
+                watermarkPath = os.path.normpath(watermarkPath)
+
+            logger.debug("Normalized watermark path: %s", watermarkPath)
+            try:
+                signature = file_signature(watermarkPath)
+            except OSError:
+                # パス解決の試行（異なるベースディレクトリからの相対パスの可能性を試す）
+                possible_bases = [
+                    os.path.join(base_dir, '..', '..', 'watermark'),
+                    os.path.join(base_dir, '..', '..', 'src', 'watermark'),
+                    os.path.join(base_dir, '..', '..', 'user_data', 'watermark')
+                ]
+                logger.info("Watermark not found, trying alternative paths: %s", watermarkPath)
+
+                # 元のパスからファイル名部分を抽出
+                filename = os.path.basename(watermarkPath)
+                for base in possible_bases:
+                    alt_path = os.path.join(base, filename)
+                    try:
+                        signature = file_signature(alt_path)
+                    except OSError:
+                        continue
+                    logger.info("Found alternative watermark path: %s", alt_path)
+                    watermarkPath = alt_path
+                    break
+
+        # アウトラインの色の型チェック
+        if outlineColor is None:
+            outlineColor = [255, 255, 255]  # デフォルト白色
+        elif not isinstance(outlineColor, list):
+            logger.debug("outlineColor is not a list, converting: %r", outlineColor)
+            try:
+                # 文字列の場合は変換を試みる
+                if isinstance(outlineColor, str):
+                    if ',' in outlineColor:
+                        outlineColor = [int(c.strip()) for c in outlineColor.split(',')[:3]]
+                    elif outlineColor.startswith('#'):
+                        color = outlineColor.lstrip('#')
+                        outlineColor = [int(color[i:i+2], 16) for i in (0, 2, 4)]
+                else:
+                    # その他の型の場合は白色をデフォルトとする
+                    outlineColor = [255, 255, 255]
+            except Exception as e:
+                logger.warning("Error converting outlineColor %r: %s", outlineColor, e)
+                outlineColor = [255, 255, 255]  # エラー時のデフォルト
+
+        # 有効なウォーターマークパスがある場合のみ適用
+        if signature is not None:
+            try:
+                # 合成はウォーターマークが重なる範囲だけを作業バッファ（またはタイル）上で行う
+                placement = prepare_watermark(
+                    image_size,
+                    watermarkPath,
+                    opacity=watermarkOpacity,
+                    invert=invertWatermark,
+                    enableOutline=enableOutline,
+                    sizeFactor=watermarkSize,
+                    outlineColor=outlineColor,
+                    smoothOutline=smoothOutline,
+                    geometryScale=geometry_scale,
+                    signature=signature
+                )
+            except Exception as e:
+                logger.exception("Exception during watermark preparation: %s", e)
+        else:
+            logger.warning("Watermark path invalid or file not found: %s", watermarkPath)
+    return placement
+
+def _prepare_logo_placement(options, image_size, rng=None, geometry_scale=1.0):
+    """
+    オプションに従ってロゴと配置位置を求める関数（合成は呼び出し側で行う）
+
+    Returns:
+    - (ロゴ, 位置)、配置しない場合はNone
+    """
+    # logoPathのパス解決と存在確認（解決結果は logo_processor 側でメモ化される）
+    logoPath = options.get('logoPath') if options else None
+    if logoPath:
+        abs_logo_path = resolve_logo_path(logoPath)
+        if abs_logo_path:
+            logger.debug("Normalized logo path: %s", abs_logo_path)
+            options['logoPath'] = abs_logo_path
+        else:
+            logger.warning("Logo file not found, falling back to default: %s", logoPath)
+    logo_path = resolve_logo_for_options(options)
+    if not logo_path:
+        return None
+    logo_position = options.get('logoPosition', 'random') if options else 'random'
+    try:
+        margin = max(1, int(round(LOGO_MARGIN * geometry_scale)))
+        return prepare_logo(image_size, logo_path, margin=margin, position=logo_position, rng=rng)
+    except Exception as e:
+        logger.exception("Logo application error: %s", e)
+        return None
 
 # スタブ: 未実装のエフェクトは入力をそのまま返します
 def apply_moire_pattern(img_array, noise_level):
@@ -389,7 +466,7 @@ def apply_all_effects(img_array, watermarkPath=None, strength=1.0):
     
     # 2. テクスチャ追加フェーズ
     # マスタードノイズを適用
-    processed_img = apply_mustard_noise(processed_img, noise_level=0.5 * strength)
+    processed_img = get_noise_function('mustard')(processed_img, noise_level=0.5 * strength)
     
     # カメラノイズを適用
     processed_img = apply_camera_noise(processed_img, noise_level=0.4 * strength)
@@ -410,7 +487,7 @@ def apply_all_effects(img_array, watermarkPath=None, strength=1.0):
         try:
             processed_img = apply_watermark(processed_img, watermarkPath)
         except Exception as e:
-            print(f"Error applying watermark: {e}")
+            logger.exception("Error applying watermark: %s", e)
     
     # 5. 最終仕上げフェーズ
     # 最終ガウシアンノイズを適用（Lv.2）
@@ -418,13 +495,14 @@ def apply_all_effects(img_array, watermarkPath=None, strength=1.0):
     
     return processed_img
 
-def apply_final_gaussian_noise(img_array, noise_level=0.15):
+def apply_final_gaussian_noise(img_array, noise_level=0.15, rng=None):
     """
     最終仕上げとしてガウシアンノイズを適用する関数
     
     Parameters:
     - img_array: 処理する画像（NumPy配列）
     - noise_level: ノイズの強さ (0.0〜1.0)
+    - rng: 乱数生成器（numpy.random.Generator、省略時は新規に作成）
     
     Returns:
     - 処理後の画像（NumPy配列）
@@ -440,33 +518,133 @@ def apply_final_gaussian_noise(img_array, noise_level=0.15):
     sigma = noise_level * 15  # ノイズレベルに応じた標準偏差
     
     # 画像と同じ形状のガウシアンノイズを生成
-    noise = np.random.normal(mean, sigma, img_array.shape).astype(np.float64)
+    noise = make_rng(rng).normal(mean, sigma, img_array.shape)
     
     # 画像にノイズを追加し、0-255の範囲に収める
     result = np.clip(result + noise, 0, 255).astype(np.uint8)
     
     return result
 
+def _pop_log_level(argv):
+    """
+    コマンドライン引数から --log-level LEVEL（または --log-level=LEVEL）を取り除き、その値を返す
+    """
+    for index, arg in enumerate(argv):
+        if arg == '--log-level' and index + 1 < len(argv):
+            value = argv[index + 1]
+            del argv[index:index + 2]
+            return value
+        if arg.startswith('--log-level='):
+            del argv[index]
+            return arg.split('=', 1)[1]
+    return None
+
+def preview_logo_sizes(max_edge=PREVIEW_MAX_EDGE, aspect_ratios=PREWARM_ASPECT_RATIOS):
+    """
+    長辺 max_edge のプレビューで使うロゴの長辺サイズを、指定した縦横比について返す関数（重複は除く）
+    """
+    return sorted({logo_size_for((max_edge, max(1, round(max_edge / ratio)))) for ratio in aspect_ratios})
+
+def run_worker(input_stream=None, output_stream=None):
+    """
+    常駐ワーカーモード
+    標準入力からJSON Lines形式のジョブを1行ずつ読み込み、ジョブごとに1行のJSON結果を返す。
+    インタプリタ起動とライブラリのインポートを1回で済ませ、複数画像の処理で使い回すためのモード。
+
+    ジョブ: {"id": 任意, "inputPath": str, "outputPath": str, "options": dict}
+    結果: {"id": 任意, "success": bool, "outputPath": str, "error": str, "metrics": dict}
+    metrics はステージごとの実時間・CPU時間・メモリ確保のピーク、画像サイズ、オプションをまとめたもの
+    ログは標準エラー出力に出す。options の logLevel を指定すると、そのジョブの間だけログレベルを変える
+
+    Parameters:
+    - input_stream: ジョブを読み込むストリーム（省略時は標準入力）
+    - output_stream: 結果を書き込むストリーム（省略時は標準出力）
+    """
+    input_stream = input_stream or sys.stdin
+    output_stream = output_stream or sys.stdout
+
+    def emit(record):
+        output_stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+        output_stream.flush()
+
+    # 同梱のウォーターマークとロゴを事前にデコードし、ロゴはプレビューで使うサイズにリサイズしておく
+    with contextlib.redirect_stdout(sys.stderr):
+        prewarm_watermarks()
+        prewarm_logos(sizes=preview_logo_sizes())
+        # DCT系のカーネル（SciPy）も起動時に読み込み、最初のジョブ（プレビューなど）の待ち時間に含めない
+        for noise_type in ('dct', 'blockdct'):
+            get_noise_function(noise_type)
+
+    # 起動完了を通知（呼び出し側はこの行を待ってからジョブを送る）
+    emit({"event": "ready", "pid": os.getpid()})
+
+    for line in input_stream:
+        line = line.strip()
+        if not line:
+            continue
+        job_id = None
+        metrics = None
+        try:
+            job = json.loads(line)
+            job_id = job.get('id')
+            if job.get('command') == 'shutdown':
+                break
+            input_path = os.path.abspath(job['inputPath'])
+            output_path = os.path.abspath(job['outputPath'])
+            job_options = job.get('options') or {}
+            previous_level = set_log_level(job_options.get('logLevel'))
+            metrics = StageMetrics().start()
+            try:
+                # 外部ライブラリの print なども結果チャネル（stdout）を汚さないよう stderr に回す
+                with contextlib.redirect_stdout(sys.stderr):
+                    written_path = _process_image(input_path, output_path, job.get('options'), metrics=metrics)
+            finally:
+                set_log_level(previous_level)
+            emit({"id": job_id, "success": True, "outputPath": written_path, "metrics": metrics.to_record()})
+        except Exception as e:
+            result = {"id": job_id, "success": False, "error": str(e)}
+            if metrics is not None:
+                result["metrics"] = metrics.to_record()
+            emit(result)
+
 if __name__ == "__main__":
+    # ディレクトリ/globのバッチ処理モード（ログの設定は batch_processor 側で行う）
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        from batch_processor import main as batch_main
+        sys.exit(batch_main(sys.argv[2:]))
+
+    # ログレベル（--log-level > オプションの logLevel > 環境変数 MALICE_LOG_LEVEL > WARNING）
+    # ログは標準エラー出力に出し、標準出力は結果（JSON、SUCCESS / ERROR）だけにする
+    argv = sys.argv[1:]
+    log_level = _pop_log_level(argv)
+
+    # 常駐ワーカーモード
+    if argv and argv[0] == '--worker':
+        configure_logging(log_level)
+        run_worker()
+        sys.exit(0)
+
     # コマンドライン引数の解析
-    if len(sys.argv) < 3:
+    if len(argv) < 2:
         print("ERROR: Not enough arguments")
-        print("Usage: python process.py <input_path> <output_path> [options_json]")
+        print("Usage: python process.py <input_path> <output_path> [options_json] [--log-level LEVEL]")
+        print("       python process.py --worker [--log-level LEVEL]")
+        print("       python process.py batch <input_dir_or_glob> <output_dir> [options_json] [--workers N] [--log-level LEVEL]")
         sys.exit(1)
 
-    input_path = os.path.abspath(sys.argv[1])
-    output_path = os.path.abspath(sys.argv[2])
+    input_path = os.path.abspath(argv[0])
+    output_path = os.path.abspath(argv[1])
     
     # オプションのJSONがある場合
     options = None
-    if len(sys.argv) > 3:
-        import json
+    if len(argv) > 2:
         try:
-            options = json.loads(sys.argv[3])
+            options = json.loads(argv[2])
         except json.JSONDecodeError:
             print("ERROR: Invalid JSON options")
             sys.exit(1)
+    configure_logging(log_level if log_level is not None else (options or {}).get('logLevel'))
     
     success = process_image(input_path, output_path, options)
     if not success:
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
@@ -0,0 +1,221 @@
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# tracemalloc によるステージごとのメモリ計測を有効にする環境変数（'1' / 'true' など。既定は無効）
+# 計測中は確保のたびに記録するため、遅延インポートするモジュール（SciPy など）を読み込む最初のジョブが大きく遅くなる
+TRACE_MEMORY_ENV = 'MALICE_TRACE_MEMORY'
+
+def trace_memory_enabled():
+    """
+    環境変数 MALICE_TRACE_MEMORY で tracemalloc の計測が有効になっているかどうかを返す関数
+    """
+    return os.environ.get(TRACE_MEMORY_ENV, '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+# Linux でプロセスのRSSと最大RSS（VmHWM）を読むファイルと、最大RSSをリセットするファイル
+PROC_STATUS_PATH = '/proc/self/status'
+PROC_CLEAR_REFS_PATH = '/proc/self/clear_refs'
+
+# 最大RSSをリセットできるか（初回のリセットで判定する）と、リセット前に観測した最大RSS（バイト）
+_rss_peak_resettable = sys.platform.startswith('linux')
+_observed_peak_rss = 0
+
+def _read_proc_status(*fields):
+    """/proc/self/status から指定した項目（kB 単位）をバイトで読む（読めない場合はNone）"""
+    values = dict.fromkeys(fields)
+    try:
+        with open(PROC_STATUS_PATH) as status:
+            for line in status:
+                key, _, value = line.partition(':')
+                if key in values:
+                    values[key] = int(value.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        return None
+    return None if None in values.values() else tuple(values[field] for field in fields)
+
+def _reset_rss_peak():
+    """
+    プロセスの最大RSS（VmHWM）を現在のRSSまでリセットする（Linux のみ）
+    リセット前の最大値は _observed_peak_rss に残し、peak_rss_bytes がプロセス開始からの最大値を返せるようにする
+
+    Returns:
+    - リセット直後のRSS（バイト）。リセットできない環境ではNone
+    """
+    global _rss_peak_resettable, _observed_peak_rss
+    if not _rss_peak_resettable:
+        return None
+    status = _read_proc_status('VmHWM', 'VmRSS')
+    if status is None:
+        _rss_peak_resettable = False
+        return None
+    _observed_peak_rss = max(_observed_peak_rss, status[0])
+    try:
+        with open(PROC_CLEAR_REFS_PATH, 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        _rss_peak_resettable = False
+        return None
+    return status[1]
+
+def peak_rss_bytes():
+    """
+    プロセスの最大RSS（バイト）を返す関数（プロセス開始からの最大値。取得できない環境ではNone）
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト単位
+    peak = peak if sys.platform == 'darwin' else peak * 1024
+    # ステージの計測で VmHWM をリセットした場合、ru_maxrss もリセット後の値になるため、観測済みの最大値と比べる
+    return max(peak, _observed_peak_rss)
+
+def _current_peak_rss():
+    """
+    ステージ計測用の現在の最大RSS（バイト）を返す（リセットできる環境では最後のリセット以降の最大値）
+    """
+    if _rss_peak_resettable:
+        status = _read_proc_status('VmHWM')
+        if status is not None:
+            return status[0]
+    return peak_rss_bytes()
+
+class StageMetrics:
+    """
+    1回の画像処理について、ステージごとの実時間・CPU時間・メモリ使用量のピークを集計するクラス
+    結果は to_record() で1件のJSON互換の辞書にまとめる
+
+    ステージごとのRSSの増分（rssPeakBytes）は常に計測する。Linux ではステージの開始時に最大RSS（VmHWM）を
+    リセットし、ステージ中の最大RSSと開始時のRSSの差を記録する。リセットできない環境（macOS）では
+    プロセスの最大RSSがステージ中に増えた分を記録する（それまでの最大値を超えなかった場合は0）。
+    Windows では取得できないため None になる。
+    より詳しいメモリ確保のピーク（peakBytes）は tracemalloc で計測する（NumPy の配列も対象）。
+    こちらは track_memory=True、または環境変数 MALICE_TRACE_MEMORY を指定した場合だけ行い、
+    それ以外では peakBytes は None になる（処理全体の最大RSSは常に peakRssBytes に記録する）。
+    呼び出し側で既に tracemalloc が動いている場合（ベンチマークなど）は、その計測を乱さないよう
+    メモリの計測を行わない。
+    """
+
+    def __init__(self, track_memory=None):
+        if track_memory is None:
+            track_memory = trace_memory_enabled()
+        self.track_memory = track_memory and not tracemalloc.is_tracing()
+        self._owns_tracing = False
+        self._stages = []
+        self._by_name = {}
+        self._info = {}
+        self._started_wall = None
+        self._started_cpu = None
+        self._total_wall = None
+        self._total_cpu = None
+        self._peak = None
+        self._rss_peak = None
+        # 計測中のステージ（入れ子の場合に、内側のステージがリセットする前の最大RSSを外側に反映する）
+        self._active_rss = []
+
+    def start(self):
+        """計測を開始する"""
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracing = True
+        self._started_wall = time.perf_counter()
+        self._started_cpu = time.process_time()
+        return self
+
+    def stop(self):
+        """計測を終了する（自分で開始した tracemalloc は止める）"""
+        if self._started_wall is None or self._total_wall is not None:
+            return
+        self._total_wall = time.perf_counter() - self._started_wall
+        self._total_cpu = time.process_time() - self._started_cpu
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+
+    @contextmanager
+    def stage(self, name):
+        """
+        ステージ1つを計測するコンテキストマネージャ
+        同じ名前のステージを複数回計測した場合は時間を合計し、ピークは最大値を取る
+        例外で抜けた場合も計測し、そのステージに failed を付ける
+        """
+        tracing = self._owns_tracing
+        if tracing:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        self._fold_rss_peak()
+        rss = _reset_rss_peak()
+        # [開始時のRSS（または最大RSS）, ステージ中の最大RSS]
+        rss_state = [rss if rss is not None else peak_rss_bytes(), None]
+        self._active_rss.append(rss_state)
+        started_wall = time.perf_counter()
+        started_cpu = time.process_time()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            wall = time.perf_counter() - started_wall
+            cpu = time.process_time() - started_cpu
+            peak = tracemalloc.get_traced_memory()[1] - baseline if tracing else None
+            self._fold_rss_peak()
+            self._active_rss.pop()
+            rss_start, rss_peak = rss_state
+            rss_peak = max(0, rss_peak - rss_start) if rss_start is not None and rss_peak is not None else None
+            self._add(name, wall, cpu, peak, rss_peak, failed)
+
+    def _fold_rss_peak(self):
+        """現在の最大RSSを、計測中のすべてのステージのピークに反映する"""
+        if not self._active_rss:
+            return
+        current = _current_peak_rss()
+        if current is None:
+            return
+        for state in self._active_rss:
+            state[1] = max(state[1] or 0, current)
+
+    def _add(self, name, wall, cpu, peak, rss_peak, failed):
+        entry = self._by_name.get(name)
+        if entry is None:
+            entry = {'name': name, 'wallMs': 0.0, 'cpuMs': 0.0, 'peakBytes': None, 'rssPeakBytes': None}
+            self._by_name[name] = entry
+            self._stages.append(entry)
+        entry['wallMs'] += wall * 1000
+        entry['cpuMs'] += cpu * 1000
+        if peak is not None:
+            entry['peakBytes'] = max(entry['peakBytes'] or 0, peak)
+            self._peak = max(self._peak or 0, peak)
+        if rss_peak is not None:
+            entry['rssPeakBytes'] = max(entry['rssPeakBytes'] or 0, rss_peak)
+            self._rss_peak = max(self._rss_peak or 0, rss_peak)
+        if failed:
+            entry['failed'] = True
+
+    def set(self, key, value):
+        """レコードに含める情報（画像サイズ、オプションなど）を設定する"""
+        self._info[key] = value
+
+    def to_record(self):
+        """
+        計測結果を1件の辞書にまとめる（時間はミリ秒、メモリはバイト）
+        peakRssBytes はプロセスの最大RSSで、常駐ワーカーではそれまでのジョブを含めた最大値になる
+        """
+        self.stop()
+        record = dict(self._info)
+        record['stages'] = [
+            {**entry, 'wallMs': round(entry['wallMs'], 3), 'cpuMs': round(entry['cpuMs'], 3)}
+            for entry in self._stages
+        ]
+        if self._total_wall is not None:
+            record['totalWallMs'] = round(self._total_wall * 1000, 3)
+            record['totalCpuMs'] = round(self._total_cpu * 1000, 3)
+        record['peakBytes'] = self._peak
+        record['rssPeakBytes'] = self._rss_peak
+        record['peakRssBytes'] = peak_rss_bytes()
+        return record
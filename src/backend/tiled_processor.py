@@ -0,0 +1,477 @@
+import os
+import mmap
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import PIL
+from PIL import Image
+from noise import (
+    apply_noise_array, requires_color, parallel_safe, get_noise_kernel, plan_fused_stages, fuse_trailing_stage,
+    stage_kernel_options, FUSED_SEPARATOR
+)
+from noise.rng import derive_rng
+from image_buffer import normalize_mode, composite_sprite, placements_require_color
+from image_encoder import save_image, save_png_bands, PNG_FILTER_WORKING_FACTOR
+from malice_logging import get_logger
+
+logger = get_logger('tiled')
+
+# 乱数ストリームを割り当てる行の単位（ブロックDCTの最大ブロックサイズの倍数）
+# タイルの高さはこの倍数にするため、作業領域の上限を変えても同じシードなら同じ結果になる
+UNIT_ROWS = 64
+
+# 既定のタイル作業領域の上限（MB）。タイルの高さを決める
+# 入力は画素をスクラッチへ直接デコードし、PNG出力はスクラッチから帯ごとにエンコードするため、
+# 画像全体の画素はメモリに載らず、最大RSSはおおむねこの上限と固定の使用量（インタプリタ、ライブラリ）に収まる。
+# 例外（画像全体を作る場合）は DIRECT_DECODE_MODES 以外のモードの入力、リサイズ済みの入力、PNG以外の出力
+DEFAULT_MEMORY_LIMIT_MB = 512
+
+# タイル作業領域の上限を指定するオプション名と、以前の名前（互換のため読み取る）
+TILE_MEMORY_OPTION = 'tileMemoryLimitMB'
+LEGACY_MEMORY_OPTION = 'memoryLimitMB'
+
+# スクラッチへ直接デコードできる画像のモードと、Pillow の内部バッファの1画素のバイト数（RGB も4バイト）
+DIRECT_DECODE_MODES = {'L': 1, 'RGB': 4, 'RGBA': 4}
+
+# 直接デコードは Pillow の内部API（Image.core.map_buffer と、ImageFile の im / fp の差し替え）を使うため、
+# 確認済みのバージョンの範囲（[下限, 上限)）でだけ行う。範囲外や内部APIが無い場合は公開APIの経路
+# （デコードしてから帯ごとに crop してスクラッチへ移す。デコード中は画像全体がメモリに載る）を使う
+DIRECT_DECODE_PILLOW_VERSIONS = ((9, 0), (13, 0))
+
+# 作業バッファ（float32）1枚に対する、処理中に同時に確保される配列の倍率の目安
+# （ノイズ配列、DCT係数、パディングなど）
+WORKING_SET_FACTOR = 4
+
+def estimate_full_frame_bytes(size, channels=3):
+    """
+    画像全体を作業バッファで処理した場合のおおよそのメモリ使用量（バイト）を返す関数
+    """
+    width, height = size
+    return width * height * channels * 4 * WORKING_SET_FACTOR
+
+def tile_memory_limit_mb(options=None):
+    """
+    オプションからタイル作業領域の上限（MB）を返す関数（未指定の場合はNone）
+    以前の名前の memoryLimitMB も受け付ける
+    """
+    if not options:
+        return None
+    if options.get(TILE_MEMORY_OPTION):
+        return options[TILE_MEMORY_OPTION]
+    if options.get(LEGACY_MEMORY_OPTION):
+        logger.warning("%s is deprecated, use %s (it limits tile working memory, not peak RSS)",
+                       LEGACY_MEMORY_OPTION, TILE_MEMORY_OPTION)
+        return options[LEGACY_MEMORY_OPTION]
+    return None
+
+def should_use_tiled(size, options=None):
+    """
+    タイル処理モードを使うかどうかを判定する関数
+    options の tiled が True の場合、または画像全体の作業バッファが tileMemoryLimitMB を超えると見込まれる場合に使う
+    """
+    if not options:
+        return False
+    if options.get('tiled'):
+        return True
+    memory_limit_mb = tile_memory_limit_mb(options)
+    if memory_limit_mb:
+        return estimate_full_frame_bytes(size) > memory_limit_mb * 1024 * 1024
+    return False
+
+def plan_tiled_stages(noise_stages):
+    """
+    ノイズステージの列をタイル処理できる形に変換する関数
+    登録情報の tileable が False のステージは tiled_fallback に置き換え（DCT → ブロックDCT）、
+    代わりが無いもの（画像全体に図形を描くマスタードなど）は除外する
+
+    Returns:
+    - (タイル処理するステージのリスト, 除外したステージのリスト)
+    """
+    planned = []
+    skipped = []
+    for noise_type in noise_stages:
+        kernel = get_noise_kernel(noise_type)
+        if kernel is not None and not kernel.tileable and kernel.tiled_fallback:
+            kernel = get_noise_kernel(kernel.tiled_fallback)
+        if kernel is None or not kernel.tileable:
+            skipped.append(noise_type)
+            continue
+        noise_type = kernel.name
+        if noise_type not in planned:
+            planned.append(noise_type)
+    return planned, skipped
+
+def tile_rows_for_limit(width, channels, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB):
+    """
+    タイル作業領域の上限に収まるタイルの高さ（UNIT_ROWS の倍数）を返す関数
+    """
+    bytes_per_row = width * channels * 4 * WORKING_SET_FACTOR
+    rows = int(memory_limit_mb * 1024 * 1024 // max(bytes_per_row, 1))
+    return max(UNIT_ROWS, rows // UNIT_ROWS * UNIT_ROWS)
+
+def tile_workers(workers=None):
+    """
+    タイル内の乱数単位を並列に処理するスレッド数を返す関数
+    省略時は環境変数 MALICE_TILE_WORKERS、未設定ならCPUコア数
+    """
+    if workers is None:
+        workers = int(os.environ.get('MALICE_TILE_WORKERS', 0)) or os.cpu_count() or 1
+    return max(1, workers)
+
+def _apply_to_units(executor, tile, top, units, noise_type, noise_level, rng, key, in_place=True, **kernel_options):
+    """
+    タイル内の乱数単位（UNIT_ROWS 行）ごとに、単位ごとの乱数ストリームでノイズを適用する
+    executor が渡された場合は単位をスレッドプールで並列に処理する（乱数は単位ごとに派生させるため結果は変わらない）
+    """
+    def apply_unit(bounds):
+        unit_top, unit_bottom = bounds
+        unit = tile[unit_top - top:unit_bottom - top]
+        result = apply_noise_array(
+            unit, noise_type, noise_level,
+            rng=derive_rng(rng, *key, 'rows', unit_top // UNIT_ROWS),
+            **kernel_options
+        )
+        # その場で更新しないカーネル（in_place=False）は結果をタイルに書き戻す
+        if not in_place:
+            unit[...] = result
+
+    if executor is not None and len(units) > 1:
+        # map の結果を消費して、スレッド内の例外をここで送出させる
+        list(executor.map(apply_unit, units))
+    else:
+        for bounds in units:
+            apply_unit(bounds)
+
+def png_band_rows_for_limit(width, channels, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB):
+    """
+    PNGを帯ごとにエンコードする場合に、タイル作業領域の上限に収まる帯の高さ（1〜UNIT_ROWS）を返す関数
+    """
+    bytes_per_row = width * channels * PNG_FILTER_WORKING_FACTOR
+    rows = int(memory_limit_mb * 1024 * 1024 // max(bytes_per_row, 1))
+    return max(1, min(UNIT_ROWS, rows))
+
+def _create_scratch(shape, scratch_dir=None):
+    """
+    uint8 の np.memmap スクラッチファイルを作る（ファイルは閉じた時点で削除される）
+    """
+    scratch_file = tempfile.NamedTemporaryFile(prefix='malice-', suffix='.scratch', dir=scratch_dir)
+    return scratch_file, np.memmap(scratch_file, dtype=np.uint8, mode='w+', shape=shape)
+
+def _release_pages(*arrays):
+    """
+    スクラッチ（np.memmap）の読み書きしたページをプロセスのRSSから外す（内容はファイルとページキャッシュに残る）
+    madvise が使えない環境（Windows）では何もしない
+    """
+    for array in arrays:
+        mapping = getattr(array, '_mmap', None)
+        if mapping is not None and hasattr(mapping, 'madvise') and hasattr(mmap, 'MADV_DONTNEED'):
+            mapping.madvise(mmap.MADV_DONTNEED)
+
+class _ReleasingReader:
+    """
+    入力ファイルを読むたびにスクラッチのページをRSSから外すファイルのラッパー（デコード中の最大RSSを抑える）
+    """
+
+    def __init__(self, fp, scratch):
+        self._fp = fp
+        self._scratch = scratch
+
+    def read(self, *args):
+        _release_pages(self._scratch)
+        return self._fp.read(*args)
+
+    def __getattr__(self, name):
+        return getattr(self._fp, name)
+
+def _direct_decode_available():
+    """
+    スクラッチへの直接デコードに使う Pillow の内部APIが使えるかどうかを返す関数
+    （確認済みのバージョンの範囲内で、Image.core.map_buffer がある場合だけ True）
+    """
+    try:
+        version = tuple(int(part) for part in PIL.__version__.split('.')[:2])
+    except ValueError:
+        return False
+    low, high = DIRECT_DECODE_PILLOW_VERSIONS
+    return low <= version < high and hasattr(Image.core, 'map_buffer')
+
+def _map_scratch(scratch, image):
+    """スクラッチを Pillow の内部バッファとして使うための画像コアを作る関数（内部API）"""
+    return Image.core.map_buffer(scratch, image.size, 'raw', 0, (image.mode, 0, 1))
+
+def _decode_to_scratch(image, scratch_dir=None):
+    """
+    未デコードの画像を、Pillow の内部バッファにスクラッチを割り当てて直接デコードする関数
+    デコーダーは画素をスクラッチに書き込み、入力を読むたびにそのページをRSSから外すため、画像全体がメモリに載らない
+
+    Returns:
+    - (スクラッチファイル, 配列（L は (h, w)、RGB / RGBA は (h, w, 4)）)。
+      デコード済みの画像、対応していないモード、内部APIが使えない場合、または直接デコードできなかった場合は None
+    """
+    bytes_per_pixel = DIRECT_DECODE_MODES.get(image.mode)
+    if bytes_per_pixel is None or not getattr(image, 'tile', None) or getattr(image, 'fp', None) is None:
+        return None
+    if not _direct_decode_available():
+        logger.debug("Tiled mode: direct decode is not available with Pillow %s", PIL.__version__)
+        return None
+    width, height = image.size
+    shape = (height, width) if bytes_per_pixel == 1 else (height, width, bytes_per_pixel)
+    scratch_file, scratch = _create_scratch(shape, scratch_dir)
+    fp = image.fp
+    try:
+        target = _map_scratch(scratch, image)
+        image.im = target
+    except (AttributeError, TypeError, ValueError) as e:
+        # 内部APIの形が変わった場合（デコード前なので画像はそのまま使える）
+        logger.debug("Tiled mode: direct decode is not available: %s", e)
+        scratch_file.close()
+        return None
+    try:
+        image.fp = _ReleasingReader(fp, scratch)
+        image.load()
+        # Pillow が別のバッファを確保してデコードした場合は、画像全体がメモリに載っているので通常の経路に任せる
+        if image.im is not target:
+            logger.debug("Tiled mode: direct decode was not used by the %s decoder", image.format)
+            scratch_file.close()
+            return None
+    except Exception:
+        scratch_file.close()
+        raise
+    finally:
+        if image.fp is not None:
+            image.fp = fp
+    _release_pages(scratch)
+    return scratch_file, scratch
+
+class TiledImage:
+    """
+    タイル処理の結果（画素はスクラッチファイル上にあり、画像全体をメモリに載せない）
+    save() は PNG なら帯ごとにエンコードする。使い終わったら close() でスクラッチを削除する
+    """
+
+    def __init__(self, mode, color, alpha, scratch_files, band_rows=UNIT_ROWS):
+        self.mode = mode
+        self.size = (color.shape[1], color.shape[0])
+        self._color = color
+        self._alpha = alpha
+        self._scratch_files = scratch_files
+        self._band_rows = band_rows
+
+    @property
+    def width(self):
+        return self.size[0]
+
+    @property
+    def height(self):
+        return self.size[1]
+
+    def iter_bands(self):
+        """
+        上から順に、色と透過情報をまとめた uint8 の帯（(行数, 幅[, チャンネル数])）を返すジェネレータ
+        """
+        for top in range(0, self.height, self._band_rows):
+            bottom = min(top + self._band_rows, self.height)
+            band = self._color[top:bottom]
+            if self._alpha is not None:
+                band = np.concatenate([band.reshape(bottom - top, self.width, -1), self._alpha[top:bottom, :, None]], axis=2)
+            yield np.array(band)
+            _release_pages(self._color, self._alpha)
+
+    def to_image(self):
+        """画像全体の PIL.Image を作る（PNG以外の出力や、結果を画像として受け取る場合）"""
+        image = Image.fromarray(np.ascontiguousarray(self._color), self.mode.rstrip('A'))
+        # グレースケールはスクラッチのメモリをそのまま参照する場合があるため、閉じる前に複製する
+        if image.readonly:
+            image = image.copy()
+        if self._alpha is not None:
+            image.putalpha(Image.fromarray(np.ascontiguousarray(self._alpha), 'L'))
+        return image
+
+    def save(self, output_path, output_format='png', profile=None, target_bytes=None, quality=None):
+        """
+        image_encoder.save_image と同じ引数で保存する（可逆のPNGは画像全体を作らずに帯ごとにエンコードする）
+
+        Returns:
+        - 実際に書き出した出力ファイルのパス
+        """
+        if output_format == 'png' and not target_bytes:
+            return save_png_bands(self.iter_bands(), output_path, self.size, self.mode, profile)
+        logger.info("Tiled mode: %s output is encoded from a full-frame image", output_format)
+        image = self.to_image()
+        try:
+            return save_image(image, output_path, output_format, profile, target_bytes=target_bytes, quality=quality)
+        finally:
+            image.close()
+
+    def close(self):
+        """スクラッチファイルを削除する"""
+        self._color = self._alpha = None
+        for scratch_file in self._scratch_files:
+            scratch_file.close()
+        self._scratch_files = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def process_tiled(image, noise_stages, noise_level, stage_options=None, rng=None, **options):
+    """
+    process_tiled_to_scratch の結果を PIL.Image として返す関数（画像全体がメモリに載る。引数は同じ）
+    """
+    with process_tiled_to_scratch(image, noise_stages, noise_level, stage_options, rng, **options) as tiled:
+        return tiled.to_image()
+
+def process_tiled_to_scratch(image, noise_stages, noise_level, stage_options=None, rng=None, watermark=None, logo=None,
+                             final_noise_level=0.2, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB, scratch_dir=None,
+                             fuse_stages=True, workers=None):
+    """
+    巨大な画像を行方向のタイルに分けて処理する関数（アウトオブコア処理）
+    画素は uint8 の np.memmap スクラッチファイルに置き、タイルごとに float32 へ読み込んで
+    ノイズ → ウォーターマーク → 仕上げノイズ → ロゴ の順に処理して書き戻す。
+    画素単位のノイズだけを使うため、タイル間の重なり（のりしろ）は不要。
+    未デコードの入力（Image.open の直後）はスクラッチへ直接デコードし、処理済みのページはタイルごとにRSSから外す。
+
+    Parameters:
+    - image: 入力画像（PIL.Image）。スクラッチへ移した後に close() してメモリを解放する
+    - noise_stages: ノイズステージのリスト（plan_tiled_stages で変換される）
+    - noise_level: ノイズの強度（0.0〜1.0）
+    - stage_options: ステージ固有の追加パラメータ（例：{'blockdct': {'block_size': 8}}）
+    - rng: ジョブの乱数生成器（行単位の独立したストリームを派生させる）
+    - watermark: prepare_watermark の結果（(スプライト, 位置)、無い場合はNone）
+    - logo: prepare_logo の結果（(スプライト, 位置)、無い場合はNone）
+    - final_noise_level: 仕上げのガウシアンノイズの強度
+    - memory_limit_mb: タイルの作業領域の上限（MB）
+    - scratch_dir: スクラッチファイルの置き場所（省略時は一時ディレクトリ）
+    - fuse_stages: 連続するガウシアン・スペックルを1つの乱数場にまとめるかどうか
+    - workers: 登録情報の parallel_safe が True のステージで、タイル内の乱数単位を並列に処理するスレッド数
+               （省略時は tile_workers の既定値。1 の場合は並列化しない）
+
+    Returns:
+    - 処理後の画像（TiledImage、L / LA / RGB / RGBA）。close() するまでスクラッチファイルが残る
+    """
+    stage_options = stage_options or {}
+    stages, skipped = plan_tiled_stages(noise_stages)
+    if skipped:
+        logger.warning("Tiled mode: skipping non-local noise stages: %s", skipped)
+    if 'dct' in noise_stages:
+        logger.info("Tiled mode: using block DCT instead of full-frame DCT")
+
+    # 色を使うノイズに加え、色のあるウォーターマーク（アウトライン）やロゴを合成する場合もRGBで処理する
+    require_color = requires_color(stages) or placements_require_color(watermark, logo)
+    # ウォーターマークが無い場合は間でクリップしないため、仕上げノイズも末尾のステージに融合する
+    final_fused = False
+    if fuse_stages:
+        stages = plan_fused_stages(stages)
+        if watermark is None:
+            stages, final_fused = fuse_trailing_stage(stages, 'gaussian')
+    # 通常の処理と同じ追加パラメータを渡す（融合したステージも構成するステージの縮尺を引き継ぐ）
+    stage_kwargs = {noise_type: stage_kernel_options(noise_type, stage_options) for noise_type in stages}
+    if final_fused:
+        # 融合した仕上げノイズ（最後の要素）だけ強度が異なる
+        stage_kwargs[stages[-1]]['levels'] = [noise_level] * stages[-1].count(FUSED_SEPARATOR) + [final_noise_level]
+    in_place = {noise_type: get_noise_kernel(noise_type).in_place for noise_type in stages if get_noise_kernel(noise_type)}
+    parallel = {noise_type: parallel_safe(noise_type) for noise_type in stages}
+    workers = tile_workers(workers)
+    width, height = image.size
+
+    scratch_files = []
+    executor = None
+    try:
+        # 入力を読み込む元（source_*）と書き戻す先（color / alpha）を決める
+        decoded = _decode_to_scratch(image, scratch_dir)
+        if decoded is not None:
+            # 直接デコードした場合は、スクラッチをそのまま作業領域にする（RGB / RGBA は1画素4バイト）
+            decoded_file, scratch = decoded
+            scratch_files.append(decoded_file)
+            color_mode = 'RGB' if image.mode != 'L' or require_color else 'L'
+            source_color = scratch[..., :3] if scratch.ndim == 3 else scratch
+            alpha = scratch[..., 3] if image.mode == 'RGBA' else None
+        else:
+            # デコード済みの画像やその他のモードは正規化してから、タイル単位でスクラッチへ移す
+            image = normalize_mode(image, require_color=require_color)
+            color_mode = image.mode.rstrip('A')
+            channels = len(color_mode)
+            color_file, source_color = _create_scratch((height, width, channels) if channels > 1 else (height, width),
+                                                       scratch_dir)
+            scratch_files.append(color_file)
+            alpha = None
+            if image.mode.endswith('A'):
+                alpha_file, alpha = _create_scratch((height, width), scratch_dir)
+                scratch_files.append(alpha_file)
+            transfer_rows = tile_rows_for_limit(width, channels, memory_limit_mb)
+            for top in range(0, height, transfer_rows):
+                bottom = min(top + transfer_rows, height)
+                band = image.crop((0, top, width, bottom))
+                source_color[top:bottom] = np.asarray(band.convert(color_mode) if alpha is not None else band)
+                if alpha is not None:
+                    alpha[top:bottom] = np.asarray(band.getchannel('A'))
+                _release_pages(source_color, alpha)
+        image.close()
+
+        channels = len(color_mode)
+        # グレースケールの入力をRGBで処理する場合だけ、書き戻す先を別に用意する
+        expand_gray = source_color.ndim == 2 and channels > 1
+        color = source_color
+        if expand_gray:
+            color_file, color = _create_scratch((height, width, channels), scratch_dir)
+            scratch_files.append(color_file)
+        tile_rows = tile_rows_for_limit(width, channels, memory_limit_mb)
+        logger.info("Tiled mode: %dx%d, %d rows per tile, limit %sMB", width, height, tile_rows, memory_limit_mb)
+
+        has_alpha = False
+        if alpha is not None:
+            for top in range(0, height, tile_rows):
+                has_alpha = has_alpha or alpha[top:top + tile_rows].min() < 255
+                _release_pages(alpha)
+        if not has_alpha:
+            alpha = None
+
+        executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        for top in range(0, height, tile_rows):
+            bottom = min(top + tile_rows, height)
+            tile = source_color[top:bottom].astype(np.float32)
+            if expand_gray:
+                tile = np.repeat(tile[..., None], channels, axis=2)
+            tile_alpha = np.array(alpha[top:bottom]) if alpha is not None else None
+            units = [(row, min(row + UNIT_ROWS, bottom)) for row in range(top, bottom, UNIT_ROWS)]
+
+            for noise_type in stages:
+                _apply_to_units(
+                    executor if parallel[noise_type] else None, tile, top, units, noise_type, noise_level,
+                    rng, ('noise', noise_type), in_place=in_place.get(noise_type, True), **stage_kwargs[noise_type]
+                )
+
+            # ウォーターマークとロゴは画像座標の位置をタイル座標に直して、重なる範囲だけを合成する
+            if watermark is not None:
+                np.clip(tile, 0, 255, out=tile)
+                sprite, (left, sprite_top) = watermark
+                composite_sprite(tile, sprite, (left, sprite_top - top), alpha=tile_alpha)
+            if not final_fused:
+                _apply_to_units(
+                    executor if parallel_safe('gaussian') else None, tile, top, units, 'gaussian', final_noise_level,
+                    rng, ('final', 'gaussian'), **stage_options.get('gaussian', {})
+                )
+            np.clip(tile, 0, 255, out=tile)
+            if logo is not None:
+                sprite, (left, sprite_top) = logo
+                composite_sprite(tile, sprite, (left, sprite_top - top), alpha=tile_alpha)
+                np.clip(tile, 0, 255, out=tile)
+
+            color[top:bottom] = tile.astype(np.uint8)
+            if tile_alpha is not None:
+                alpha[top:bottom] = tile_alpha
+            del tile
+            _release_pages(source_color, color, alpha)
+
+        output_mode = color_mode + ('A' if alpha is not None else '')
+        band_rows = png_band_rows_for_limit(width, len(output_mode), memory_limit_mb)
+        return TiledImage(output_mode, color, alpha, scratch_files, band_rows=band_rows)
+    except BaseException:
+        for scratch_file in scratch_files:
+            scratch_file.close()
+        raise
+    finally:
+        if executor is not None:
+            executor.shutdown()
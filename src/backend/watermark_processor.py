@@ -2,23 +2,17 @@ import os
 import random
 from PIL import Image, ImageDraw, ImageOps, ImageFilter
 import numpy as np
-from scipy.ndimage import binary_dilation, binary_erosion
 import logging
-import traceback
-import sys
+from asset_cache import LRUCache, file_signature, load_cached_image, save_cached_image
+from image_buffer import composite_sprite_image
+from malice_logging import get_logger
 
-# Configure logging for debugging - fix duplicate timestamp and set level to INFO for better visibility
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = get_logger('watermark')
 
-# デバッグログを強制的に標準出力に出す
-def debug_log(message):
-    print(f"DEBUG_WM: {message}")
-    sys.stdout.flush()  # 即座に出力を反映
-    logging.info(message)
-
-def add_simple_outline(watermark, outlineColor, borderWidth=5, opacity=0.8, overlapFactor=0.2):
+def add_simple_outline(watermark, outlineColor, borderWidth=5, opacity=0.8, overlapFactor=0.2, smooth=False):
     """
     ウォーターマークにシンプルな単色アウトラインを追加する
+    アウトラインの形状はユークリッド距離変換から求めるため、処理時間はアウトライン幅に依存しない
     
     Parameters:
     - watermark: ウォーターマーク画像（PIL.Image）
@@ -26,165 +20,262 @@ def add_simple_outline(watermark, outlineColor, borderWidth=5, opacity=0.8, over
     - borderWidth: アウトラインの幅
     - opacity: アウトラインの不透明度
     - overlapFactor: ウォーターマークとアウトラインの重なり係数
+    - smooth: Trueの場合、距離場からアンチエイリアスされた外縁を作る（後段のぼかしが不要になる）
     
     Returns:
     - アウトラインが追加されたウォーターマーク画像（PIL.Image）
     """
-    debug_log(f"----- OUTLINE PROCESSING START -----")
-    debug_log(f"add_simple_outline called with outlineColor: {outlineColor}, borderWidth: {borderWidth}")
+    logger.debug("add_simple_outline: outlineColor=%s, borderWidth=%s, smooth=%s", outlineColor, borderWidth, smooth)
     try:
+        # SciPy はアウトラインを作る時だけ読み込む（キャッシュ済みのレイヤーを使うジョブでは不要）
+        from scipy.ndimage import distance_transform_edt
+
         # アルファチャンネルを取得
         if watermark.mode != 'RGBA':
             watermark = watermark.convert('RGBA')
-            debug_log(f"Converted watermark to RGBA mode in add_simple_outline")
         
-        alpha = watermark.split()[-1]
-        alpha_array = np.array(alpha)
-        debug_log(f"Got alpha channel with shape {alpha_array.shape}")
-          # アウトライン画像を作成
-        outline_image = Image.new("RGBA", watermark.size, (0, 0, 0, 0))
+        alpha_array = np.array(watermark.getchannel('A'))
+        foreground = alpha_array > 0
         
         # ウォーターマークのマスク縮小量（重なり用）
         shrink_amount = int(borderWidth * overlapFactor)
-        debug_log(f"Using shrink amount: {shrink_amount}")
         
-        # ウォーターマークのマスクを少し縮小して重なりを作る
-        if shrink_amount > 0:
-            watermark_mask = binary_erosion(alpha_array > 0, iterations=shrink_amount)
-            debug_log(f"Eroded watermark mask")
-        else:
-            watermark_mask = alpha_array > 0
-            debug_log(f"Using original watermark mask")
-        
-        # 拡張マスクを作成（アウトラインの形状）
-        dilated_mask = binary_dilation(alpha_array > 0, iterations=borderWidth)
-        outline_mask = dilated_mask & ~(watermark_mask)
-        debug_log(f"Created outline mask with shape {outline_mask.shape}, non-zero pixels: {np.sum(outline_mask)}")
+        outline_coverage = np.zeros(alpha_array.shape, dtype=np.float64)
+        rows = np.flatnonzero(foreground.any(axis=1))
+        cols = np.flatnonzero(foreground.any(axis=0))
+        if rows.size > 0:
+            # 距離変換はウォーターマークの外接矩形＋アウトライン幅の範囲だけで行う
+            margin = int(np.ceil(borderWidth)) + 1
+            top, bottom = max(rows[0] - margin, 0), min(rows[-1] + margin + 1, alpha_array.shape[0])
+            left, right = max(cols[0] - margin, 0), min(cols[-1] + margin + 1, alpha_array.shape[1])
+            region = foreground[top:bottom, left:right]
+            
+            # 外側：各画素から最も近いウォーターマーク画素までの距離（1回の距離変換）
+            outside_distance = distance_transform_edt(~region)
+            
+            # ウォーターマークのマスクを少し縮小して重なりを作る
+            # （内側の距離変換。画像の端も背景とみなすため1画素の余白を付けて計算する）
+            if shrink_amount > 0:
+                inside_distance = distance_transform_edt(np.pad(region, 1))[1:-1, 1:-1]
+                watermark_mask = inside_distance > shrink_amount
+            else:
+                watermark_mask = region
+            
+            # アウトラインのアルファ（外縁は距離のしきい値、smooth時は1画素幅で線形に減衰）
+            if smooth:
+                coverage = np.clip(borderWidth + 0.5 - outside_distance, 0.0, 1.0)
+            else:
+                coverage = (outside_distance <= borderWidth).astype(np.float64)
+            coverage[watermark_mask] = 0.0
+            outline_coverage[top:bottom, left:right] = coverage
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Outline mask %s, non-zero pixels: %d", outline_coverage.shape, np.count_nonzero(outline_coverage))
         
-        # アウトラインをRGBA画像に変換
+        # アウトラインをRGBA画像に変換（不透明度もここで掛ける）
         outline_data = np.zeros((watermark.size[1], watermark.size[0], 4), dtype=np.uint8)
-        
-        # 色とアルファ値を設定
         r, g, b = outlineColor
-        debug_log(f"Setting outline color to RGB: {r}, {g}, {b}")
-        outline_data[outline_mask] = [r, g, b, 255]
-        
-        # NumPy配列からPIL画像に変換
+        outline_data[..., 0] = r
+        outline_data[..., 1] = g
+        outline_data[..., 2] = b
+        outline_data[..., 3] = (outline_coverage * (255 * min(opacity, 1.0))).astype(np.uint8)
         outline_pil = Image.fromarray(outline_data, 'RGBA')
-        
-        # アウトラインの不透明度を設定
-        if opacity < 1.0:
-            debug_log(f"Setting outline opacity to {opacity}")
-            outline_alpha = outline_pil.split()[-1]
-            outline_alpha = outline_alpha.point(lambda p: int(p * opacity))
-            outline_pil.putalpha(outline_alpha)
             
         # 元のウォーターマークとアウトラインを合成
-        result = Image.alpha_composite(outline_pil, watermark)
-        debug_log(f"Combined outline with watermark")
-        debug_log(f"----- OUTLINE PROCESSING FINISHED -----")
-    
-        return result
+        return Image.alpha_composite(outline_pil, watermark)
     
     except Exception as e:
-        debug_log(f"ERROR: Error adding outline: {str(e)}")
-        debug_log(f"TRACE: {traceback.format_exc()}")
+        logger.exception("Error adding outline: %s", e)
         return watermark  # エラー時は元のウォーターマークを返す
 
-def apply_watermark(baseImage, watermarkPath, opacity=0.6, invert=False, enableOutline=True, sizeFactor=0.5, outlineColor=None):
+# 前処理済みウォーターマーク（最終的なRGBAレイヤー）と、デコード済みの元画像のキャッシュ
+_watermark_layer_cache = LRUCache(max_entries=32)
+_watermark_source_cache = LRUCache(max_entries=16)
+
+# アプリ同梱のウォーターマークの場所
+BUNDLED_WATERMARK_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'watermark'))
+
+def _parse_outline_color(outlineColor):
     """
-    画像にウォーターマークを適用する関数
-    
+    アウトライン色をRGBタプルに変換する（リスト、カンマ区切り文字列、#RRGGBB に対応）
+    """
+    if isinstance(outlineColor, (list, tuple)) and len(outlineColor) >= 3:
+        # リストからタプルに変換
+        return tuple(int(c) for c in outlineColor[:3])
+    if isinstance(outlineColor, str):
+        # 文字列からタプルに変換（カンマ区切りやRGB文字列など）
+        try:
+            # カンマ区切り文字列を処理
+            if ',' in outlineColor:
+                return tuple(int(c.strip()) for c in outlineColor.split(',')[:3])
+            # 16進数表記を処理
+            if outlineColor.startswith('#'):
+                color = outlineColor.lstrip('#')
+                return tuple(int(color[i:i+2], 16) for i in (0, 2, 4))
+            logger.warning("Invalid color format: %s, using default (255,255,255)", outlineColor)
+        except Exception as color_error:
+            logger.warning("Failed to parse color string %r: %s", outlineColor, color_error)
+        return (255, 255, 255)
+    # デフォルト値を設定
+    logger.warning("Invalid outline color format, using default: %s", outlineColor)
+    return (255, 255, 255)
+
+def _load_watermark_source(watermarkPath, signature):
+    """
+    ウォーターマーク画像をデコードしてRGBAで返す（ファイルの識別子ごとにキャッシュ）
+    """
+    source = _watermark_source_cache.get(signature)
+    if source is None:
+        with Image.open(watermarkPath) as watermark:
+            source = watermark.convert('RGBA')
+        _watermark_source_cache.put(signature, source)
+    return source
+
+def prewarm_watermarks(directory=BUNDLED_WATERMARK_DIR):
+    """
+    ディレクトリ内のウォーターマークPNGを事前にデコードしてキャッシュしておく関数
+    常駐ワーカーの起動時に呼び出し、最初のジョブでのデコード待ちをなくす
+
+    Returns:
+    - キャッシュに載せたファイル数
+    """
+    count = 0
+    if not os.path.isdir(directory):
+        return count
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith('.png'):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            _load_watermark_source(path, file_signature(path))
+            count += 1
+        except Exception as e:
+            logger.warning("Failed to prewarm watermark %s: %s", path, e)
+    return count
+
+def build_watermark_layer(watermarkPath, size, opacity=0.6, invert=False, outlineColor=None, borderWidth=0, smoothOutline=False, signature=None):
+    """
+    合成直前のウォーターマークレイヤー（RGBA）を作る関数
+    反転、不透明度、リサイズ、アウトライン、ぼかしまでを行い、結果をキャッシュする。
+    キーはファイルパスと更新時刻、サイズ、不透明度、反転、アウトライン色、アウトライン幅で、
+    同じ設定のバッチではデコードからぼかしまでを1回だけ行う。
+
     Parameters:
-    - baseImage: ベース画像（PIL.Image）
     - watermarkPath: ウォーターマーク画像のパス
-    - opacity: ウォーターマークの不透明度（0.0〜1.0）
-    - invert: ウォーターマークを反転するかどうか
-    - enableOutline: アウトラインを有効にするかどうか
-    - sizeFactor: ウォーターマークのサイズ係数（0.0〜1.0）
-    - outlineColor: アウトラインの色（RGBリスト）
-    
+    - size: リサイズ後のサイズ（幅, 高さ）
+    - opacity: 不透明度（0.0〜1.0）
+    - invert: 色を反転するかどうか
+    - outlineColor: アウトライン色（RGBタプル、Noneの場合はアウトラインなし）
+    - borderWidth: アウトラインの幅
+    - smoothOutline: アウトラインの外縁を距離場からアンチエイリアスし、仕上げのぼかしを省くかどうか
+    - signature: file_signature の結果（省略時はここで取得）
+
     Returns:
-    - ウォーターマークが適用された画像（PIL.Image）
+    - ウォーターマークレイヤー（PIL.Image, RGBA）
+    """
+    if signature is None:
+        signature = file_signature(watermarkPath)
+    smoothOutline = bool(smoothOutline and outlineColor is not None)
+    key = (signature, tuple(size), float(opacity), bool(invert), outlineColor, int(borderWidth), smoothOutline)
+    layer = _watermark_layer_cache.get(key)
+    if layer is not None:
+        logger.debug("Watermark layer cache hit: %s", key)
+        return layer
+    layer = load_cached_image('watermark', key)
+    if layer is not None:
+        logger.debug("Watermark layer disk cache hit: %s", key)
+        _watermark_layer_cache.put(key, layer)
+        return layer
+
+    watermark = _load_watermark_source(watermarkPath, signature).copy()
+    logger.debug("Building watermark layer: source %s %s, size %s", watermark.size, watermark.mode, size)
+
+    if invert:
+        r, g, b, a = watermark.split()
+        rgb_image = Image.merge('RGB', (r, g, b))
+        inverted_rgb = ImageOps.invert(rgb_image)
+        r, g, b = inverted_rgb.split()
+        watermark = Image.merge('RGBA', (r, g, b, a))
+
+    # ウォーターマークの透明度を適用
+    if 0.0 <= opacity <= 1.0:
+        # フロントエンドから送られた不透明度はそのまま使用する
+        # ユーザーが指定した値を絶対に正しいものとして尊重する
+        alpha = watermark.split()[-1]
+        alpha = alpha.point(lambda p: int(p * opacity))
+        watermark.putalpha(alpha)
+
+    watermark = watermark.resize(tuple(size), Image.LANCZOS)
+
+    # アウトラインの追加
+    if outlineColor is not None:
+        # アウトラインにもフロントエンドで指定された透明度をそのまま適用
+        watermark = add_simple_outline(
+            watermark,
+            outlineColor,
+            borderWidth=borderWidth,
+            opacity=opacity,
+            overlapFactor=0.2,
+            smooth=smoothOutline
+        )
+
+    # 全体的なぼかし処理を追加して自然に見せる（軽度）
+    # アンチエイリアス済みのアウトラインを使う場合は不要
+    if not smoothOutline:
+        watermark = watermark.filter(ImageFilter.GaussianBlur(radius=0.5))
+
+    _watermark_layer_cache.put(key, watermark)
+    save_cached_image('watermark', key, watermark)
+    return watermark
+
+def prepare_watermark(baseSize, watermarkPath, opacity=0.6, invert=False, enableOutline=True, sizeFactor=0.5, outlineColor=None, smoothOutline=False, geometryScale=1.0, signature=None):
     """
-    debug_log(f"===== WATERMARK PROCESSING START =====")
-    debug_log(f"apply_watermark called with following parameters:")
-    debug_log(f"- watermarkPath: {watermarkPath}")
-    debug_log(f"- opacity: {opacity}")
-    debug_log(f"- invert: {invert}")
-    debug_log(f"- enableOutline: {enableOutline}")
-    debug_log(f"- sizeFactor: {sizeFactor}")
-    debug_log(f"- outlineColor: {outlineColor} (type: {type(outlineColor)})")
-    debug_log(f"- baseImage: {baseImage.size if baseImage else 'None'}")
+    ベース画像のサイズに合わせたウォーターマークレイヤーと配置位置を求める関数
+    合成そのものは行わない（作業バッファ上で合成する場合は image_buffer.composite_sprite を使う）
     
+    Parameters:
+    - baseSize: ベース画像のサイズ（幅, 高さ）
+    - geometryScale: 最終出力に対するベース画像の縮尺（縮小プレビュー用、アウトライン幅を最終出力に合わせる）
+    - signature: file_signature の結果（呼び出し側で存在確認済みの場合に渡す。省略時はここで取得）
+    - その他: apply_watermark と同じ
+    
+    Returns:
+    - (ウォーターマークレイヤー（PIL.Image, RGBA）, 左上の位置（x, y）)、適用できない場合はNone
+    """
+    logger.debug("prepare_watermark: path=%s, opacity=%s, invert=%s, enableOutline=%s, sizeFactor=%s, outlineColor=%s, baseSize=%s",
+                 watermarkPath, opacity, invert, enableOutline, sizeFactor, outlineColor, baseSize)
+
     # watermarkPathのバリデーション
     if watermarkPath is None or not isinstance(watermarkPath, str) or len(watermarkPath.strip()) == 0:
-        debug_log(f"ERROR: Invalid watermark path: {watermarkPath}")
-        return baseImage
+        logger.error("Invalid watermark path: %r", watermarkPath)
+        return None
 
     # パスの正規化
     watermarkPath = os.path.normpath(watermarkPath)
-    debug_log(f"Normalized path: {watermarkPath}")
-    
-    # ファイルの存在確認
-    if not os.path.exists(watermarkPath):
-        debug_log(f"ERROR: Watermark file not found: {watermarkPath}")
-        return baseImage
-        
-    # ファイルの読み取り権限確認
-    if not os.access(watermarkPath, os.R_OK):
-        debug_log(f"ERROR: Watermark file is not readable: {watermarkPath}")
-        return baseImage      # ファイルサイズ確認
-    try:
-        file_size = os.path.getsize(watermarkPath)
-        if file_size == 0:
-            debug_log(f"ERROR: Watermark file is empty (0 bytes): {watermarkPath}")
-            return baseImage
-        debug_log(f"File size: {file_size} bytes")
-    except Exception as e:
-        debug_log(f"ERROR: Failed to get file size: {str(e)}")
-        return baseImage
+
+    # ファイルの存在・サイズ確認（stat は1回だけ行い、キャッシュキーにも使う）
+    if signature is None:
+        try:
+            signature = file_signature(watermarkPath)
+        except OSError as e:
+            logger.error("Watermark file not accessible: %s (%s)", watermarkPath, e)
+            return None
+    if signature[2] == 0:
+        logger.error("Watermark file is empty (0 bytes): %s", watermarkPath)
+        return None
     
     try:
-        debug_log(f"Opening watermark file: {watermarkPath}")
-        
-        try:
-            watermark = Image.open(watermarkPath)
-            debug_log(f"Watermark loaded with size: {watermark.size}, mode: {watermark.mode}")
-        except Exception as img_error:
-            debug_log(f"ERROR: Failed to open watermark image: {str(img_error)}")
-            debug_log(f"TRACE: {traceback.format_exc()}")
-            return baseImage
-            
-        if watermark.mode != 'RGBA':
-            watermark = watermark.convert('RGBA')
-            debug_log(f"Converted watermark to RGBA mode")
-
-        if invert:
-            debug_log(f"Inverting watermark colors")
-            r, g, b, a = watermark.split()
-            rgb_image = Image.merge('RGB', (r, g, b))
-            inverted_rgb = ImageOps.invert(rgb_image)
-            r, g, b = inverted_rgb.split()
-            watermark = Image.merge('RGBA', (r, g, b, a))
-            debug_log(f"Watermark colors inverted")        # ウォーターマークの透明度を適用
-        if 0.0 <= opacity <= 1.0:
-            debug_log(f"Applying opacity {opacity} to watermark")
-            # フロントエンドから送られた不透明度はそのまま使用する
-            # ユーザーが指定した値を絶対に正しいものとして尊重する
-            alpha = watermark.split()[-1]
-            alpha = alpha.point(lambda p: int(p * opacity))
-            watermark.putalpha(alpha)
-            debug_log(f"Opacity applied to watermark exactly as specified: {opacity}")
-
-        base_width, base_height = baseImage.size
+        base_width, base_height = baseSize
         short_edge = min(base_width, base_height)
         
         # ウォーターマークのアスペクト比を維持してリサイズ
-        wm_width, wm_height = watermark.size
-        aspect_ratio = wm_width / wm_height        # sizeFactorは0.1から1.0の範囲で制限
+        try:
+            wm_width, wm_height = _load_watermark_source(watermarkPath, signature).size
+        except Exception as img_error:
+            logger.exception("Failed to open watermark image %s: %s", watermarkPath, img_error)
+            return None
+        aspect_ratio = wm_width / wm_height
+        # sizeFactorは0.1から1.0の範囲で制限
         sizeFactor = max(0.1, min(1.0, sizeFactor))
-        debug_log(f"Using size factor: {sizeFactor}, base image size: {base_width}x{base_height}, short edge: {short_edge}")
         
         if base_width / base_height > aspect_ratio:
             new_wm_height = int(short_edge * sizeFactor)
@@ -193,91 +284,70 @@ def apply_watermark(baseImage, watermarkPath, opacity=0.6, invert=False, enableO
             new_wm_width = int(short_edge * sizeFactor)
             new_wm_height = int(new_wm_width / aspect_ratio)
 
-        watermark = watermark.resize((new_wm_width, new_wm_height), Image.LANCZOS)
-        debug_log(f"Resized watermark to: {new_wm_width}x{new_wm_height}")
-        
-        # アウトラインの追加
+        # アウトラインの設定
+        outline_color_tuple = None
+        border_width = 0
         if enableOutline and outlineColor is not None:
-            try:
-                debug_log(f"Processing outline with color: {outlineColor}, type: {type(outlineColor)}")
-                
-                # outlineColorの型チェックと変換
-                if isinstance(outlineColor, list) and len(outlineColor) >= 3:
-                    # リストからタプルに変換
-                    outline_color_tuple = tuple(int(c) for c in outlineColor[:3])
-                elif isinstance(outlineColor, str):
-                    # 文字列からタプルに変換（カンマ区切りやRGB文字列など）
-                    try:
-                        # カンマ区切り文字列を処理
-                        if ',' in outlineColor:
-                            outline_color_tuple = tuple(int(c.strip()) for c in outlineColor.split(',')[:3])
-                        # 16進数表記を処理
-                        elif outlineColor.startswith('#'):
-                            color = outlineColor.lstrip('#')
-                            outline_color_tuple = tuple(int(color[i:i+2], 16) for i in (0, 2, 4))
-                        else:
-                            # デフォルト値を設定
-                            debug_log(f"ERROR: Invalid color format: {outlineColor}, using default (255,255,255)")
-                            outline_color_tuple = (255, 255, 255)
-                    except Exception as color_error:
-                        debug_log(f"ERROR: Failed to parse color string: {str(color_error)}")
-                        outline_color_tuple = (255, 255, 255)
-                else:
-                    # デフォルト値を設定
-                    debug_log(f"ERROR: Invalid outline color format, using default: {outlineColor}")
-                    outline_color_tuple = (255, 255, 255)
-                    debug_log(f"Converted outline color to tuple: {outline_color_tuple}")
-                
-                # 画像サイズに合わせたborder_widthを設定
-                if short_edge <= 512:
-                    border_width = 5   # 小さい画像
-                elif short_edge <= 1024:
-                    border_width = 10  # 中くらいの画像
-                else:
-                    border_width = 15  # 大きい画像
-                    
-                debug_log(f"Using border width: {border_width}px for image with short edge {short_edge}px")
-                # アウトラインにもフロントエンドで指定された透明度をそのまま適用
-                # ユーザーが指定した値を絶対に正しいものとして尊重する
-                watermark = add_simple_outline(
-                    watermark,
-                    outline_color_tuple,
-                    borderWidth=border_width,
-                    opacity=opacity,
-                    overlapFactor=0.2
-                )
-                
-                debug_log(f"Added outline to watermark with color {outline_color_tuple}")
-            except Exception as outline_error:
-                debug_log(f"ERROR: Error applying outline: {str(outline_error)}")
-                debug_log(f"TRACE: {traceback.format_exc()}")
-        else:
-            debug_log(f"Skipping outline: enableOutline={enableOutline}, outlineColor={outlineColor}")
+            outline_color_tuple = _parse_outline_color(outlineColor)
+            # 画像サイズに合わせたborder_widthを設定（縮小プレビューでは最終出力のサイズで決めて縮尺を掛ける）
+            output_short_edge = short_edge / geometryScale
+            if output_short_edge <= 512:
+                border_width = 5   # 小さい画像
+            elif output_short_edge <= 1024:
+                border_width = 10  # 中くらいの画像
+            else:
+                border_width = 15  # 大きい画像
+            border_width = max(1, int(round(border_width * geometryScale)))
+            logger.debug("Using outline color %s, border width: %dpx", outline_color_tuple, border_width)
+
+        watermark = build_watermark_layer(
+            watermarkPath,
+            (new_wm_width, new_wm_height),
+            opacity=opacity,
+            invert=invert,
+            outlineColor=outline_color_tuple,
+            borderWidth=border_width,
+            smoothOutline=smoothOutline,
+            signature=signature
+        )
 
-        # 全体的なぼかし処理を追加して自然に見せる（軽度）
-        watermark = watermark.filter(ImageFilter.GaussianBlur(radius=0.5))
-        debug_log(f"Applied slight blur to watermark edges")
         # ウォーターマークを中央に配置
         paste_x = (base_width - new_wm_width) // 2
         paste_y = (base_height - new_wm_height) // 2
-        
-        # ウォーターマーク画像をベース画像に合成
-        debug_log(f"Pasting watermark at position: ({paste_x}, {paste_y})")
-        composite_with_watermark = Image.new('RGBA', (base_width, base_height), (0, 0, 0, 0))
-        composite_with_watermark.paste(watermark, (paste_x, paste_y), watermark.split()[-1])
+        logger.debug("Watermark position: (%d, %d)", paste_x, paste_y)
+        return watermark, (paste_x, paste_y)
 
-        # 元画像をRGBAモードに変換して保持
-        base_image_rgba = baseImage.convert('RGBA')
-        debug_log(f"Base image converted to RGBA mode")
-
-        # ウォーターマーク画像をベース画像に合成
-        final_composite = Image.alpha_composite(base_image_rgba, composite_with_watermark)
-        debug_log(f"Final composite with watermark completed")
-        debug_log(f"===== WATERMARK PROCESSING FINISHED =====")
-
-        return final_composite
+    except Exception as e:
+        logger.exception("Watermark preparation error: %s", e)
+        return None
 
+def apply_watermark(baseImage, watermarkPath, opacity=0.6, invert=False, enableOutline=True, sizeFactor=0.5, outlineColor=None, smoothOutline=False):
+    """
+    画像にウォーターマークを適用する関数
+    ウォーターマークが重なる矩形範囲だけを合成する（画像全体のRGBAキャンバスは作らない）
+    
+    Parameters:
+    - baseImage: ベース画像（PIL.Image）
+    - watermarkPath: ウォーターマーク画像のパス
+    - opacity: ウォーターマークの不透明度（0.0〜1.0）
+    - invert: ウォーターマークを反転するかどうか
+    - enableOutline: アウトラインを有効にするかどうか
+    - sizeFactor: ウォーターマークのサイズ係数（0.0〜1.0）
+    - outlineColor: アウトラインの色（RGBリスト）
+    - smoothOutline: アウトラインの外縁をアンチエイリアスし、仕上げのぼかしを省くかどうか
+    
+    Returns:
+    - ウォーターマークが適用された画像（PIL.Image）
+    """
+    placement = prepare_watermark(
+        baseImage.size, watermarkPath, opacity=opacity, invert=invert, enableOutline=enableOutline,
+        sizeFactor=sizeFactor, outlineColor=outlineColor, smoothOutline=smoothOutline
+    )
+    if placement is None:
+        return baseImage
+    try:
+        watermark, position = placement
+        return composite_sprite_image(baseImage, watermark, position)
     except Exception as e:
-        debug_log(f"ERROR: Watermark application error: {str(e)}")
-        debug_log(f"TRACE: {traceback.format_exc()}")
-        return baseImage
\ No newline at end of file
+        logger.exception("Watermark application error: %s", e)
+        return baseImage
@@ -13,6 +13,7 @@ const config = require('./modules/config');
 const pythonSetup = require('./modules/python-setup');
 const windowManager = require('./modules/window-manager');
 const ipcHandlers = require('./modules/ipc-handlers');
+const pythonWorker = require('./modules/python-worker');
 
 // ユーザー設定ファイルのパス
 const userSettingsPath = path.join(config.appRoot, 'user_data', 'user-settings.json');
@@ -87,6 +88,13 @@ app.on('ready', async () => {
     // 入出力ディレクトリの確認と作成
     config.ensureDirectoriesExist();
 
+    // 常駐Pythonワーカーを先行起動（初回処理時のインタプリタ起動・インポート待ちを避ける）
+    if (fs.existsSync(config.pythonExePath)) {
+      pythonWorker.startWorker().catch(error => {
+        console.error('Python worker pre-spawn failed:', error);
+      });
+    }
+
     // ローディングウィンドウを閉じる
     if (loadingWindow) {
       loadingWindow.close();
@@ -116,6 +124,9 @@ app.on('ready', async () => {
           event.sender.send('python-setup-progress', percent);
         };
 
+        // セットアップ中はPython環境を差し替えるため、常駐ワーカーを停止しておく
+        pythonWorker.stopWorker();
+
         // Pythonセットアップを実行（進捗通知関数を追加）
         await pythonSetup.setupPython(options, reportProgress);
         // セットアップ完了時にフラグを保存
@@ -165,5 +176,6 @@ app.on('window-all-closed', () => {
 
 // アプリ終了時にもキャッシュ削除
 app.on('before-quit', () => {
+  pythonWorker.stopWorker();
   clearInputCache();
 });
\ No newline at end of file
@@ -11,6 +11,7 @@ const {
   spawn
 } = require('child_process');
 const config = require('./config');
+const pythonWorker = require('./python-worker');
 
 // IPCハンドラーの設定
 function setupIPCHandlers() {
@@ -126,7 +127,9 @@ function setupIPCHandlers() {
       if (!fs.existsSync(inputDir)) {
         fs.mkdirSync(inputDir, { recursive: true });
       }
-      const tempInputPath = path.join(inputDir, 'temp_input' + path.extname(inputFilePath));
+      // プレビューは本番の処理と並行して届くことがあるため、一時ファイルを分ける
+      const tempInputName = options.preview ? 'temp_preview_input' : 'temp_input';
+      const tempInputPath = path.join(inputDir, tempInputName + path.extname(inputFilePath));
       console.log('Input file path:', inputFilePath);
       console.log('Original file name:', originalFileName);
       console.log('Temp input path:', tempInputPath);
@@ -135,12 +138,20 @@ function setupIPCHandlers() {
       fs.copyFileSync(inputFilePath, tempInputPath);
       console.log('Copied input file to temp location');
 
-      // 出力ディレクトリ
+      // 出力ディレクトリ（プレビューは本番の出力を上書きしないよう user_data/preview にPNGで書き出す）
       const userDirs = config.getUserDirs();
-      const outputFormat = options.outputFormat || 'png';
+      const outputFormat = options.preview ? 'png' : options.outputFormat || 'png';
       const filenameWithoutExt = path.parse(originalFileName).name;
-      const outputFileName = `maliced-${filenameWithoutExt}.${outputFormat}`;
-      const outputPath = path.join(userDirs.outputDir, outputFileName);
+      let outputPath;
+      if (options.preview) {
+        const previewDir = path.join(config.appRoot, 'user_data', 'preview');
+        if (!fs.existsSync(previewDir)) {
+          fs.mkdirSync(previewDir, { recursive: true });
+        }
+        outputPath = path.join(previewDir, `preview-${filenameWithoutExt}.png`);
+      } else {
+        outputPath = path.join(userDirs.outputDir, `maliced-${filenameWithoutExt}.${outputFormat}`);
+      }
       console.log('Output path:', outputPath);
 
       // ウォーターマークパス
@@ -186,41 +197,40 @@ function setupIPCHandlers() {
         fakeMetadataType: options.fakeMetadataType,
         addNoAIFlag: options.addNoAIFlag,
         // 出力形式設定を追加
-        outputFormat: options.outputFormat || 'png'
+        outputFormat: outputFormat,
+        // 出力プロファイル（fast / balanced / smallest、未指定時は従来の設定）
+        outputProfile: options.outputProfile,
+        // 非可逆出力（WebP / JPEG）の目標サイズ（バイト）と品質
+        targetBytes: options.targetBytes,
+        outputQuality: options.outputQuality,
+        // 巨大な画像のタイル処理（画像全体の作業バッファが tileMemoryLimitMB を超える見込みの場合は自動で有効）
+        // 上限はタイルの作業領域が対象。PNG出力では入力のデコードと書き出しも画像全体をメモリに載せない
+        tiled: options.tiled,
+        tileMemoryLimitMB: options.tileMemoryLimitMB || options.memoryLimitMB,
+        // 画像ごとのシード（レンダラーが画像の選択時に決め、プレビューと本番で同じ値を送る）
+        seed: options.seed,
+        // 低解像度のプレビュー（同じシード・配置で長辺 previewSize px に縮小して処理）
+        preview: options.preview || false,
+        previewSize: options.previewSize,
+        // 元の画像のパス（入力は毎回コピーし直す一時ファイルのため、プレビューの縮小画像のキャッシュはこのパスで識別する）
+        sourcePath: inputFilePath,
+        // Python側のログレベル（debug / info / warning / error、ログは標準エラー出力）
+        logLevel: options.logLevel
       };
 
-      // JSONとしてシリアライズ
-      const optionsJson = JSON.stringify(processingOptions);
-
-      // Python スクリプトを実行
-      const pythonProcess = spawn(config.pythonExePath, [path.join(config.appRoot, 'src', 'backend', 'process.py'), tempInputPath, outputPath, optionsJson]);
-      const result = await new Promise((resolve, reject) => {
-        let stdoutData = '';
-        let stderrData = '';
-        pythonProcess.stdout.on('data', data => {
-          // Log Python stdout in a cleaner format
-          const cleanData = data.toString().replace(/\r?\n/g, ' ').trim();
-          console.log(`Python stdout: ${cleanData}`);
-        });
-        pythonProcess.stderr.on('data', data => {
-          stderrData += data.toString();
-          console.error(`Python stderr: ${data}`);
-        });
-        pythonProcess.on('close', code => {
-          if (code === 0) {
-            resolve({
-              success: true,
-              outputPath,
-              message: stdoutData
-            });
-          } else {
-            reject(new Error(`Python process exited with code ${code}: ${stderrData}`));
-          }
-        });
-      });
+      // 常駐Pythonワーカーにジョブを送信（未起動の場合はここで起動される）
+      const result = await pythonWorker.runJob(tempInputPath, outputPath, processingOptions);
+      // ステージごとの実時間・CPU時間・メモリのピーク（1行のJSONとして記録する）
+      if (result.metrics) {
+        console.log('Processing metrics:', JSON.stringify(result.metrics));
+      }
+      if (!result.success) {
+        throw new Error(`Python processing failed: ${result.error}`);
+      }
       return {
         success: true,
-        outputPath
+        outputPath: result.outputPath || outputPath,
+        metrics: result.metrics
       };
     } catch (error) {
       console.error('Error processing image:', error);
@@ -126,11 +126,42 @@ const setupPythonLibraries = async reportProgress => {
     if (reportProgress) reportProgress(Math.round(currentProgress));
   }
 
+  // バックエンドのバイトコードを事前にコンパイル（初回起動時のコンパイル待ちをなくす）
+  await precompileBackend();
+
   // 最終進捗報告
   if (reportProgress) reportProgress(90);
   console.log('Python libraries setup complete');
 };
 
+// src/backend の .py を compileall で __pycache__ にコンパイルする関数
+// 書き込めない場所（インストール先の権限など）の場合は失敗しても続行する（起動時にコンパイルされる）
+const precompileBackend = async () => {
+  const backendDir = path.join(config.appRoot, 'src', 'backend');
+  if (!fs.existsSync(backendDir)) {
+    return;
+  }
+  console.log('Precompiling Python backend...');
+  await new Promise(resolve => {
+    const compile = spawn(config.pythonExePath, ['-m', 'compileall', '-q', backendDir]);
+    compile.stderr.on('data', data => {
+      console.error(`compileall stderr: ${data}`);
+    });
+    compile.on('error', error => {
+      console.error('Failed to run compileall:', error);
+      resolve();
+    });
+    compile.on('close', code => {
+      if (code === 0) {
+        console.log('Python backend precompiled');
+      } else {
+        console.error(`compileall failed with code ${code}`);
+      }
+      resolve();
+    });
+  });
+};
+
 // Pythonのセットアップメイン関数
 const setupPython = async (options = {}, reportProgress) => {
   if (options.force) {
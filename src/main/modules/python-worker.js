@@ -0,0 +1,142 @@
+"use strict";
+
+const path = require('path');
+const readline = require('readline');
+const {
+  spawn
+} = require('child_process');
+const config = require('./config');
+
+// 常駐Pythonワーカー（process.py --worker）の管理
+// 画像ごとにインタプリタを起動する代わりに、起動済みのプロセスへJSON Linesでジョブを送る
+let workerProcess = null;
+let readyPromise = null;
+let nextJobId = 1;
+// ワーカーのプロセスごとの待機中のジョブ（id → {resolve, reject}）
+// 再起動した後に古いワーカーが終了しても、新しいワーカーのジョブは失敗させない
+const pendingJobsByWorker = new WeakMap();
+
+// 指定したワーカーの待機中のジョブをすべて失敗として解決する
+const rejectPendingJobs = (child, error) => {
+  const pendingJobs = pendingJobsByWorker.get(child);
+  if (!pendingJobs) {
+    return;
+  }
+  pendingJobsByWorker.delete(child);
+  for (const {
+    reject
+  } of pendingJobs.values()) {
+    reject(error);
+  }
+  pendingJobs.clear();
+};
+
+// ワーカーを起動する（起動済みの場合は何もしない）
+const startWorker = () => {
+  if (workerProcess) {
+    return readyPromise;
+  }
+  const scriptPath = path.join(config.appRoot, 'src', 'backend', 'process.py');
+  console.log('Starting Python worker:', scriptPath);
+  const child = spawn(config.pythonExePath, [scriptPath, '--worker'], {
+    env: {
+      ...process.env,
+      PYTHONIOENCODING: 'utf-8'
+    }
+  });
+  workerProcess = child;
+  const pendingJobs = new Map();
+  pendingJobsByWorker.set(child, pendingJobs);
+  readyPromise = new Promise((resolve, reject) => {
+    const lines = readline.createInterface({
+      input: child.stdout
+    });
+    lines.on('line', line => {
+      let message;
+      try {
+        message = JSON.parse(line);
+      } catch (error) {
+        console.log(`Python worker stdout: ${line}`);
+        return;
+      }
+      if (message.event === 'ready') {
+        console.log('Python worker ready, pid:', message.pid);
+        resolve();
+        return;
+      }
+      const job = pendingJobs.get(message.id);
+      if (!job) {
+        console.warn('Python worker returned unknown job id:', message.id);
+        return;
+      }
+      pendingJobs.delete(message.id);
+      job.resolve(message);
+    });
+    child.stderr.on('data', data => {
+      console.error(`Python worker stderr: ${data}`);
+    });
+    child.on('error', error => {
+      console.error('Failed to start Python worker:', error);
+      reject(error);
+    });
+    child.on('close', code => {
+      console.log(`Python worker exited with code ${code}`);
+      // 次回のジョブで再起動できるよう状態をリセット
+      if (workerProcess === child) {
+        workerProcess = null;
+        readyPromise = null;
+      }
+      reject(new Error(`Python worker exited with code ${code}`));
+      rejectPendingJobs(child, new Error(`Python worker exited with code ${code}`));
+    });
+  });
+  // 未処理のrejectionで落ちないようにする（呼び出し側でawaitした時に改めて扱う）
+  readyPromise.catch(() => {});
+  return readyPromise;
+};
+
+// ワーカーにジョブを送り、結果（{success, outputPath, error}）を返す
+const runJob = async (inputPath, outputPath, options) => {
+  await startWorker();
+  const child = workerProcess;
+  const pendingJobs = child && pendingJobsByWorker.get(child);
+  if (!pendingJobs) {
+    // 起動の完了後、ジョブを送る前にワーカーが終了した場合
+    throw new Error('Python worker is not running');
+  }
+  const id = nextJobId++;
+  return new Promise((resolve, reject) => {
+    pendingJobs.set(id, {
+      resolve,
+      reject
+    });
+    child.stdin.write(JSON.stringify({
+      id,
+      inputPath,
+      outputPath,
+      options
+    }) + '\n');
+  });
+};
+
+// ワーカーを終了する
+const stopWorker = () => {
+  if (!workerProcess) {
+    return;
+  }
+  try {
+    workerProcess.stdin.write(JSON.stringify({
+      command: 'shutdown'
+    }) + '\n');
+    workerProcess.stdin.end();
+  } catch (error) {
+    workerProcess.kill();
+  }
+  workerProcess = null;
+  readyPromise = null;
+};
+module.exports = {
+  startWorker,
+  runJob,
+  stopWorker
+};
@@ -6,6 +6,18 @@
 let selectedImagePath = null;
 let originalFileName = null; // オリジナルのファイル名を保持する変数を追加
 let userSettings = null; // ユーザー設定を保持する変数
+let imageSeed = null; // 画像ごとのシード（プレビューと本番で同じノイズ・配置にするため、画像の選択時に1回だけ決める）
+
+// プレビューを再生成するまでの待ち時間（スライダー操作中に連続で処理しないため）
+const PREVIEW_DEBOUNCE_MS = 250;
+
+/**
+ * 画像ごとのシードを生成する（32bitの符号なし整数、バックエンドの乱数生成器の初期化に使う）
+ * @returns {number}
+ */
+function generateImageSeed() {
+  return window.crypto.getRandomValues(new Uint32Array(1))[0];
+}
 
 // path APIの簡易代替関数
 function basename(filePath) {
@@ -247,6 +259,106 @@ document.addEventListener('DOMContentLoaded', () => {
     });
   }
 
+  /**
+   * 現在のUIの状態から処理オプションを組み立てる（本番の処理とプレビューで共通）
+   * @param {string} outputDir - 出力ディレクトリ
+   * @returns {Object} 処理オプション
+   */
+  function buildProcessingOptions(outputDir) {
+    // マスタードノイズプリセットが選択されているかチェック
+    const isMustardPresetActive = mustardPreset && mustardPreset.checked;
+
+    // Collect processing options
+    const logoSelect = document.getElementById('logoSelect');
+    const options = {
+      imagePath: selectedImagePath,
+      // プレビューと本番で同じシードを使う（ノイズの順序・ロゴの位置・マスタードの図形が一致する）
+      seed: imageSeed,
+      originalFileName: originalFileName,
+      // オリジナルのファイル名を追加
+      noiseLevel: noiseSlider.value,
+      noiseTypes: userSettings ? userSettings.noiseTypes : ["gaussian", "dct"],
+      // ノイズタイプを追加
+      applyWatermark: watermarkToggle.checked,
+      watermarkPath: watermarkToggle.checked ? watermarkSelect.value : null,
+      invertWatermark: watermarkToggle.checked && invertWatermarkToggle.checked,
+      enableOutline: watermarkToggle.checked && enableOutlineToggle.checked,
+      // アウトライン設定を追加
+      watermarkSize: watermarkToggle.checked ? watermarkSize.value / 100 : 0.5,
+      // ウォーターマークサイズを0.3-0.95の範囲で設定
+      resize: document.querySelector('input[name="resize"]:checked').value,
+      // 最小値を0.3に制限
+      watermarkOpacity: Math.max(0.3, watermarkOpacity.value / 100),
+      logoPosition: userSettings ? userSettings.logoPosition : "random",
+      logoFile: logoSelect ? logoSelect.value : 'logo', // 追加: 選択中のロゴファイル名を送信
+      // ロゴ位置の設定を追加
+      // アウトラインカラーを追加
+      outlineColor: watermarkToggle.checked ? [parseInt(redSlider.value), parseInt(greenSlider.value), parseInt(blueSlider.value)] : null,
+      // メタデータオプションを追加
+      // removeMetadata: userSettings ? userSettings.removeMetadata : true,
+      // addFakeMetadata: userSettings ? userSettings.addFakeMetadata : true,
+      // fakeMetadataType: userSettings ? userSettings.fakeMetadataType : "random",
+      // addNoAIFlag: userSettings ? userSettings.addNoAIFlag : true,
+      // マスタードプリセットフラグを追加
+      mustardPreset: isMustardPresetActive,
+      outputDir: outputDir // 必ずデフォルト保証
+    };
+
+    // マスタードプリセットが選択されている場合、ノイズタイプを上書き
+    if (isMustardPresetActive) {
+      options.noiseTypes = ['gaussian', 'dct', 'mustard'];
+    }
+    return options;
+  }
+
+  // プレビューの状態（古いリクエストの結果や、本番の処理中に届いた結果は表示しない）
+  let previewTimer = null;
+  let previewGeneration = 0;
+  let processingInProgress = false;
+
+  /**
+   * 縮小プレビューを処理して afterImage に表示する
+   * 本番と同じオプション・同じシードで、バックエンドの preview モードを使う
+   */
+  async function renderPreview() {
+    if (!selectedImagePath || processingInProgress) {
+      return;
+    }
+    if (!userSettings) await loadSettings();
+    const outputDir = userSettings && userSettings.outputDir ? userSettings.outputDir : 'user_data/output';
+    const generation = ++previewGeneration;
+    try {
+      const options = buildProcessingOptions(outputDir);
+      options.preview = true;
+      const result = await window.api.processImage(options);
+      if (generation !== previewGeneration || processingInProgress) {
+        return;
+      }
+      if (!result.success) {
+        throw new Error(result.message || 'プレビューの生成に失敗しました');
+      }
+      afterImage.innerHTML = '';
+      const img = document.createElement('img');
+      img.src = result.outputPath + '?t=' + new Date().getTime(); // Cache-busting
+      img.classList.add('preview-image');
+      afterImage.appendChild(img);
+    } catch (error) {
+      // プレビューの失敗はログだけに残し、本番の処理は妨げない
+      console.warn('Preview failed:', error);
+    }
+  }
+
+  /**
+   * 設定の変更に合わせてプレビューの再生成を予約する（連続した変更は最後の1回にまとめる）
+   */
+  function schedulePreview() {
+    if (!selectedImagePath) {
+      return;
+    }
+    clearTimeout(previewTimer);
+    previewTimer = setTimeout(renderPreview, PREVIEW_DEBOUNCE_MS);
+  }
+
   // Process button click handler
   processBtn.addEventListener('click', async () => {
     if (!selectedImagePath) {
@@ -256,51 +368,14 @@ document.addEventListener('DOMContentLoaded', () => {
     if (!userSettings) await loadSettings();
     const outputDir = userSettings && userSettings.outputDir ? userSettings.outputDir : 'user_data/output';
     try {
-      // Show processing indication
+      // Show processing indication（処理中はプレビューを更新しない）
+      processingInProgress = true;
+      clearTimeout(previewTimer);
+      previewGeneration++;
       processBtn.disabled = true;
       processBtn.textContent = "Processing...";
 
-      // マスタードノイズプリセットが選択されているかチェック
-      const isMustardPresetActive = mustardPreset && mustardPreset.checked;
-
-      // Collect processing options
-      const logoSelect = document.getElementById('logoSelect');
-      const options = {
-        imagePath: selectedImagePath,
-        originalFileName: originalFileName,
-        // オリジナルのファイル名を追加
-        noiseLevel: noiseSlider.value,
-        noiseTypes: userSettings ? userSettings.noiseTypes : ["gaussian", "dct"],
-        // ノイズタイプを追加
-        applyWatermark: watermarkToggle.checked,
-        watermarkPath: watermarkToggle.checked ? watermarkSelect.value : null,
-        invertWatermark: watermarkToggle.checked && invertWatermarkToggle.checked,
-        enableOutline: watermarkToggle.checked && enableOutlineToggle.checked,
-        // アウトライン設定を追加
-        watermarkSize: watermarkToggle.checked ? watermarkSize.value / 100 : 0.5,
-        // ウォーターマークサイズを0.3-0.95の範囲で設定
-        resize: document.querySelector('input[name="resize"]:checked').value,
-        // 最小値を0.3に制限
-        watermarkOpacity: Math.max(0.3, watermarkOpacity.value / 100),
-        logoPosition: userSettings ? userSettings.logoPosition : "random",
-        logoFile: logoSelect ? logoSelect.value : 'logo', // 追加: 選択中のロゴファイル名を送信
-        // ロゴ位置の設定を追加
-        // アウトラインカラーを追加
-        outlineColor: watermarkToggle.checked ? [parseInt(redSlider.value), parseInt(greenSlider.value), parseInt(blueSlider.value)] : null,
-        // メタデータオプションを追加
-        // removeMetadata: userSettings ? userSettings.removeMetadata : true,
-        // addFakeMetadata: userSettings ? userSettings.addFakeMetadata : true,
-        // fakeMetadataType: userSettings ? userSettings.fakeMetadataType : "random",
-        // addNoAIFlag: userSettings ? userSettings.addNoAIFlag : true,
-        // マスタードプリセットフラグを追加
-        mustardPreset: isMustardPresetActive,
-        outputDir: outputDir // 必ずデフォルト保証
-      };
-
-      // マスタードプリセットが選択されている場合、ノイズタイプを上書き
-      if (isMustardPresetActive) {
-        options.noiseTypes = ['gaussian', 'dct', 'mustard'];
-      }
+      const options = buildProcessingOptions(outputDir);
 
       // 画像処理実行前に最新設定を保存
       await window.api.saveSettings(userSettings);
@@ -327,11 +402,25 @@ document.addEventListener('DOMContentLoaded', () => {
       console.error('Error processing image:', error);
       window.showModal('Error', '処理に失敗しました: ' + error.message);
     } finally {
+      processingInProgress = false;
       processBtn.disabled = false;
       processBtn.textContent = "Infuse Malice";
     }
   });
 
+  // 設定の変更でプレビューを更新する（スライダーは操作中も、その他は変更時に）
+  [noiseSlider, watermarkOpacity, watermarkSize, redSlider, greenSlider, blueSlider].forEach(element => {
+    element.addEventListener('input', schedulePreview);
+  });
+  [watermarkToggle, watermarkSelect, invertWatermarkToggle, enableOutlineToggle, mustardPreset].forEach(element => {
+    if (element) {
+      element.addEventListener('change', schedulePreview);
+    }
+  });
+  document.querySelectorAll('input[name="resize"]').forEach(radio => {
+    radio.addEventListener('change', schedulePreview);
+  });
+
   // Improved drag and drop file selection
   beforeImage.addEventListener('dragover', e => {
     e.preventDefault();
@@ -443,6 +532,8 @@ document.addEventListener('DOMContentLoaded', () => {
     try {
       selectedImagePath = imagePath;
       originalFileName = origFileName || basename(imagePath);
+      // 新しい画像ごとにシードを決め直す（同じ画像のプレビューと本番では同じシードを使う）
+      imageSeed = generateImageSeed();
       beforeImage.innerHTML = '';
       const img = document.createElement('img');
       img.src = `${selectedImagePath}?t=${new Date().getTime()}`;
@@ -453,6 +544,7 @@ document.addEventListener('DOMContentLoaded', () => {
       outputName.textContent = `maliced-${filenameWithoutExt}.${outputFormat}`;
       processBtn.disabled = false;
       console.log('Image selected:', selectedImagePath, 'Original file name:', originalFileName, 'Output format:', outputFormat);
+      schedulePreview();
     } catch (error) {
       console.error('Error handling selected image:', error);
       window.showModal('Error', '画像の読み込みに失敗しました。別の画像を試してください。');
@@ -571,6 +663,8 @@ document.addEventListener('DOMContentLoaded', () => {
           const filenameWithoutExt = parsePath(originalFileName).name;
           outputName.textContent = `maliced-${filenameWithoutExt}.${outputFormat}`;
         }
+        // ノイズの種類やロゴの位置が変わった場合に備えてプレビューを更新
+        schedulePreview();
         window.showModal('設定', '設定を保存しました');
         closeSettingsModal();
       } else {
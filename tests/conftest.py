@@ -0,0 +1,28 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# バックエンドのモジュールは src/backend から直接インポートする（process.py と同じ構成）
+BACKEND_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'backend'))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+def make_image(size, mode='RGB', seed=0):
+    """テスト用のランダムな画像を作る"""
+    width, height = size
+    channels = len(mode)
+    shape = (height, width, channels) if channels > 1 else (height, width)
+    pixels = np.random.default_rng(seed).integers(0, 256, shape, dtype=np.uint8)
+    return Image.fromarray(pixels, mode)
+
+@pytest.fixture
+def image_file(tmp_path):
+    """サイズと形式を指定して入力画像を書き出し、パスを返す"""
+    def write(size=(320, 240), mode='RGB', name='input.png'):
+        path = tmp_path / name
+        make_image(size, mode).save(path)
+        return str(path)
+    return write
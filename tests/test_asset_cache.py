@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+import watermark_processor
+from asset_cache import CACHE_DIR_ENV, LRUCache, file_signature, load_cached_image, save_cached_image
+from conftest import make_image
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1  # a が最近使ったものになる
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    cache.put('a', 10)
+    assert cache.get('a') == 10 and len(cache) == 2
+    cache.clear()
+    assert len(cache) == 0
+
+def test_file_signature_changes_with_the_file(tmp_path):
+    path = tmp_path / 'asset.png'
+    path.write_bytes(b'1234')
+    signature = file_signature(str(path))
+    assert file_signature(str(path)) == signature
+    # 同じサイズでも更新時刻が変われば別のキー
+    os.utime(path, ns=(signature[1] + 10**9, signature[1] + 10**9))
+    touched = file_signature(str(path))
+    assert touched != signature
+    path.write_bytes(b'12345')
+    assert file_signature(str(path)) not in (signature, touched)
+    with pytest.raises(OSError):
+        file_signature(str(tmp_path / 'missing.png'))
+
+def test_disk_cache_is_off_without_directory(monkeypatch):
+    monkeypatch.delenv(CACHE_DIR_ENV, raising=False)
+    save_cached_image('test', ('key',), make_image((8, 8)))
+    assert load_cached_image('test', ('key',)) is None
+
+def test_disk_cache_round_trip(monkeypatch, tmp_path):
+    monkeypatch.setenv(CACHE_DIR_ENV, str(tmp_path / 'cache'))
+    image = make_image((16, 12), 'RGBA')
+    save_cached_image('test', ('key', 1), image)
+    loaded = load_cached_image('test', ('key', 1))
+    assert loaded.mode == 'RGBA' and loaded.tobytes() == image.tobytes()
+    assert load_cached_image('test', ('key', 2)) is None
+    # 壊れたファイルはキャッシュが無い場合と同じ扱い
+    (cached_file,) = (tmp_path / 'cache' / 'test').iterdir()
+    cached_file.write_bytes(b'broken')
+    assert load_cached_image('test', ('key', 1)) is None
+
+@pytest.fixture
+def watermark_file(tmp_path, monkeypatch):
+    monkeypatch.delenv(CACHE_DIR_ENV, raising=False)
+    watermark_processor._watermark_layer_cache.clear()
+    watermark_processor._watermark_source_cache.clear()
+    path = tmp_path / 'watermark.png'
+    make_image((40, 20), 'RGBA', seed=1).save(path)
+    return path
+
+def test_watermark_layer_is_cached(watermark_file):
+    layer = watermark_processor.build_watermark_layer(str(watermark_file), (20, 10), opacity=0.5)
+    assert watermark_processor.build_watermark_layer(str(watermark_file), (20, 10), opacity=0.5) is layer
+    # 設定が違えば別のレイヤー
+    assert watermark_processor.build_watermark_layer(str(watermark_file), (20, 10), opacity=0.6) is not layer
+
+def test_watermark_layer_follows_file_changes(watermark_file):
+    layer = watermark_processor.build_watermark_layer(str(watermark_file), (20, 10), opacity=1.0)
+    make_image((40, 20), 'RGBA', seed=2).save(watermark_file)
+    stat = watermark_file.stat()
+    os.utime(watermark_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    rebuilt = watermark_processor.build_watermark_layer(str(watermark_file), (20, 10), opacity=1.0)
+    assert rebuilt is not layer
+    assert rebuilt.tobytes() != layer.tobytes()
+
+def test_watermark_layer_uses_disk_cache(watermark_file, monkeypatch, tmp_path):
+    monkeypatch.setenv(CACHE_DIR_ENV, str(tmp_path / 'cache'))
+    layer = watermark_processor.build_watermark_layer(str(watermark_file), (20, 10))
+    watermark_processor._watermark_layer_cache.clear()
+    watermark_processor._watermark_source_cache.clear()
+    cached = watermark_processor.build_watermark_layer(str(watermark_file), (20, 10))
+    assert cached is not layer and cached.tobytes() == layer.tobytes()
+    assert len(watermark_processor._watermark_source_cache) == 0  # 元画像はデコードしていない
@@ -0,0 +1,81 @@
+import os
+
+import pytest
+from PIL import Image
+
+import batch_processor
+from conftest import make_image
+from batch_processor import collect_input_files, plan_output_paths, run_batch
+
+OPTIONS = {'noiseLevel': 0.5, 'noiseTypes': ['gaussian', 'shot'], 'seed': 11}
+
+@pytest.fixture
+def input_dir(tmp_path):
+    directory = tmp_path / 'input'
+    directory.mkdir()
+    # a.png と a.jpg は同じ名前、b.png と c.png は同じ画素
+    make_image((48, 32), seed=1).save(directory / 'a.png')
+    make_image((48, 32), seed=2).save(directory / 'a.jpg')
+    make_image((48, 32), seed=3).save(directory / 'b.png')
+    make_image((48, 32), seed=3).save(directory / 'c.png')
+    (directory / 'notes.txt').write_text('skip')
+    return directory
+
+def test_collects_supported_files(input_dir):
+    names = [os.path.basename(path) for path in collect_input_files(str(input_dir))]
+    assert names == ['a.jpg', 'a.png', 'b.png', 'c.png']
+    assert [os.path.basename(path) for path in collect_input_files(str(input_dir / '*.jpg'))] == ['a.jpg']
+
+def test_duplicate_stems_get_distinct_outputs(input_dir, tmp_path):
+    output_paths = plan_output_paths(collect_input_files(str(input_dir)), str(tmp_path / 'output'))
+    assert [os.path.basename(path) for path in output_paths] == ['a.png', 'a_png.png', 'b.png', 'c.png']
+
+def test_repeated_stems_get_numbered_outputs(tmp_path):
+    # 別のディレクトリの同名ファイルや、拡張子の大文字小文字違いは連番で区別する
+    input_files = [str(tmp_path / name) for name in ('x/a.png', 'y/a.png', 'z/a.png', 'w/a.PNG', 'w/a_png.png')]
+    output_paths = plan_output_paths(input_files, str(tmp_path / 'output'))
+    names = [os.path.basename(path) for path in output_paths]
+    assert names == ['a.png', 'a_png.png', 'a_png_1.png', 'a_png_2.png', 'a_png_png.png']
+    assert len({os.path.normcase(name) for name in names}) == len(names)
+
+def test_refuses_to_write_into_the_input_directory(input_dir):
+    with pytest.raises(ValueError):
+        plan_output_paths(collect_input_files(str(input_dir)), str(input_dir))
+    with pytest.raises(ValueError):
+        run_batch(str(input_dir), str(input_dir), OPTIONS, max_workers=1)
+    # 入力は上書きされていない
+    with Image.open(input_dir / 'a.png') as image:
+        assert image.tobytes() == make_image((48, 32), seed=1).tobytes()
+
+def _outputs(summary):
+    outputs = {}
+    for result in summary['files']:
+        assert result['success'], result.get('error')
+        with Image.open(result['output']) as image:
+            outputs[os.path.basename(result['output'])] = image.tobytes()
+    return outputs
+
+def test_seeded_batch_is_reproducible_across_worker_counts(input_dir, tmp_path):
+    single = run_batch(str(input_dir), str(tmp_path / 'single'), OPTIONS, max_workers=1)
+    pooled = run_batch(str(input_dir), str(tmp_path / 'pooled'), OPTIONS, max_workers=2)
+    assert single['total'] == 4 and single['failed'] == 0
+    outputs = _outputs(single)
+    assert outputs == _outputs(pooled)
+    # 同じ画素のファイルでも、ファイルごとに別の乱数ストリームを使う
+    assert outputs['b.png'] != outputs['c.png']
+
+def _crash_on_b(input_path, output_path, options):
+    # ワーカープロセスの異常終了を再現する（spawn の子プロセスからこのモジュールを読み込む）
+    if os.path.basename(input_path) == 'b.png':
+        os._exit(1)
+    return {'input': input_path, 'output': output_path, 'success': True, 'seconds': 0.0}
+
+def test_crashed_worker_is_recorded_as_failed(input_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_processor, '_run_batch_job', _crash_on_b)
+    summary = run_batch(str(input_dir), str(tmp_path / 'output'), OPTIONS, max_workers=1)
+    # プールが壊れても要約は返り、全ファイルの結果が残る
+    assert summary['total'] == 4
+    failed = {os.path.basename(result['input']): result for result in summary['files'] if not result['success']}
+    assert 'b.png' in failed
+    assert 'BrokenProcessPool' in failed['b.png']['error']
+    assert summary['failed'] == len(failed)
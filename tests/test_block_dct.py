@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from scipy.fft import dctn, idctn
+
+from noise.block_dct import BLOCK_SIZES, apply_block_dct_noise
+
+def _reference_block_dct_noise(img_array, noise_level, block_size, seed):
+    # ブロックごとに1つずつ変換する素直な実装（端は対称パディング）。乱数の並びは (ブロック行, ブロック列, c)
+    amplify_factor = 1.0 + noise_level * 4.0
+    h, w, c = img_array.shape
+    padded_h = -(-h // block_size) * block_size
+    padded_w = -(-w // block_size) * block_size
+    source = np.pad(img_array, ((0, padded_h - h), (0, padded_w - w), (0, 0)), mode='symmetric')
+    rows, cols = padded_h // block_size, padded_w // block_size
+    amplify = np.random.default_rng(seed).random((rows, 1, cols, 1, c)) > 0.5
+    freq_threshold = max(1, int((1.0 - noise_level * 0.5) * block_size / 3))
+    band = slice(freq_threshold, block_size - freq_threshold)
+    result = source.copy()
+    for by in range(rows):
+        for bx in range(cols):
+            for ch in range(c):
+                ys, xs = slice(by * block_size, (by + 1) * block_size), slice(bx * block_size, (bx + 1) * block_size)
+                coeffs = dctn(source[ys, xs, ch], norm='ortho')
+                coeffs[band, band] *= amplify_factor if amplify[by, 0, bx, 0, ch] else 1.0 / amplify_factor
+                result[ys, xs, ch] = idctn(coeffs, norm='ortho')
+    return result[:h, :w]
+
+def _image(shape, seed=0):
+    return np.random.default_rng(seed).uniform(0, 255, shape)
+
+@pytest.mark.parametrize('block_size', BLOCK_SIZES)
+@pytest.mark.parametrize('shape', [(128, 128, 3), (70, 100, 3), (45, 37, 1)])
+def test_matches_per_block_reference(block_size, shape):
+    img = _image(shape)
+    expected = _reference_block_dct_noise(img, 0.8, block_size, seed=4)
+    result = apply_block_dct_noise(img.copy(), 0.8, block_size=block_size, rng=np.random.default_rng(4))
+    np.testing.assert_allclose(result, expected, atol=1e-8)
+
+@pytest.mark.parametrize('block_size', BLOCK_SIZES)
+def test_block_means_are_preserved(block_size):
+    # DC成分は変えないため、ブロックごとの平均（画像全体の明るさ）は変わらない
+    img = _image((128, 128, 3))
+    result = apply_block_dct_noise(img.copy(), 1.0, block_size=block_size, rng=np.random.default_rng(0))
+    n = 128 // block_size
+    before = img.reshape(n, block_size, n, block_size, 3).mean(axis=(1, 3))
+    after = result.reshape(n, block_size, n, block_size, 3).mean(axis=(1, 3))
+    np.testing.assert_allclose(after, before, atol=1e-8)
+    assert np.abs(result - img).std() > 1
+
+def test_blocks_are_independent():
+    # 1つのブロックの画素を変えても、他のブロックの結果は変わらない（左上基準の8x8グリッド）
+    img = _image((32, 32, 3))
+    changed = img.copy()
+    changed[8:16, 8:16] = 0
+    a = apply_block_dct_noise(img, 0.5, rng=np.random.default_rng(0))
+    b = apply_block_dct_noise(changed, 0.5, rng=np.random.default_rng(0))
+    outside = np.ones((32, 32), bool)
+    outside[8:16, 8:16] = False
+    np.testing.assert_allclose(a[outside], b[outside])
+
+def test_grayscale_is_updated_in_place():
+    img = _image((40, 40)).astype(np.float32)
+    result = apply_block_dct_noise(img, 0.5, rng=np.random.default_rng(0))
+    assert result is img and result.dtype == np.float32
+
+def test_unsupported_block_size():
+    with pytest.raises(ValueError):
+        apply_block_dct_noise(_image((16, 16, 3)), 0.5, block_size=12)
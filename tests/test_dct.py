@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from scipy.fft import dct, idct
+
+from noise.dct import apply_dct_noise
+
+def _baseline_dct_noise(img_array, noise_level, amplify):
+    # 従来の実装（チャンネルごとの1次元DCTの組み合わせと全体のマスク）。強調/減衰の選択だけを引数で固定する
+    amplify_factor = 1.0 + noise_level * 4.0
+    h, w, c = img_array.shape
+    result = img_array.copy()
+    for i in range(c):
+        dct_coeffs = dct(dct(img_array[:, :, i].T, norm='ortho').T, norm='ortho')
+        mask = np.ones_like(dct_coeffs)
+        freq_threshold = int((1.0 - noise_level * 0.5) * min(h, w) / 3)
+        factor = amplify_factor if amplify[i] else 1.0 / amplify_factor
+        mask[freq_threshold:h - freq_threshold, freq_threshold:w - freq_threshold] = factor
+        result[:, :, i] = idct(idct(dct_coeffs * mask, norm='ortho').T, norm='ortho').T
+    return result
+
+def _image(shape, seed=0):
+    return np.random.default_rng(seed).uniform(0, 255, shape)
+
+@pytest.mark.parametrize('shape', [(101, 131, 3), (64, 48, 3), (97, 89, 1)])
+@pytest.mark.parametrize('noise_level', [0.0, 0.5, 1.0])
+def test_matches_baseline(shape, noise_level):
+    img = _image(shape)
+    amplify = np.random.default_rng(5).random(shape[2]) > 0.5
+    expected = _baseline_dct_noise(img, noise_level, amplify)
+    result = apply_dct_noise(img.copy(), noise_level, rng=np.random.default_rng(5))
+    np.testing.assert_allclose(result, expected, atol=1e-8)
+
+def test_grayscale_matches_single_channel():
+    img = _image((101, 131))
+    gray = apply_dct_noise(img.copy(), 0.7, rng=np.random.default_rng(3))
+    single = apply_dct_noise(img[:, :, None].copy(), 0.7, rng=np.random.default_rng(3))
+    np.testing.assert_allclose(gray, single[:, :, 0])
+
+def test_float32_stays_close_to_float64():
+    img = _image((101, 131, 3))
+    result32 = apply_dct_noise(img.astype(np.float32), 1.0, rng=np.random.default_rng(1))
+    result64 = apply_dct_noise(img.copy(), 1.0, rng=np.random.default_rng(1))
+    assert result32.dtype == np.float32
+    np.testing.assert_allclose(result32, result64, atol=0.05)
+
+def test_fast_len_padding_is_opt_in():
+    # 101x131 は next_fast_len でパディングされる大きさ（パディングすると結果が変わる）
+    img = _image((101, 131, 3))
+    default = apply_dct_noise(img.copy(), 1.0, rng=np.random.default_rng(2))
+    padded = apply_dct_noise(img.copy(), 1.0, rng=np.random.default_rng(2), pad_to_fast_len=True)
+    unpadded = apply_dct_noise(img.copy(), 1.0, rng=np.random.default_rng(2), pad_to_fast_len=False)
+    np.testing.assert_array_equal(default, unpadded)
+    assert padded.shape == img.shape
+    assert not np.allclose(padded, unpadded)
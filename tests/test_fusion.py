@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+from PIL import Image
+from scipy import stats
+
+import process
+from noise import apply_noise_array, apply_fused_noise, plan_fused_stages, fuse_trailing_stage, stage_kernel_options
+from noise.rng import make_rng
+from tiled_processor import process_tiled
+
+# 画素値ごとに分布を比べるため、一定値の帯を並べた画像を使う（スペックルは画素値で標準偏差が変わる）
+LEVELS = (20.0, 128.0, 235.0)
+
+def _bands(height=200, width=200):
+    return np.concatenate([np.full((height, width, 3), value, np.float32) for value in LEVELS])
+
+def _sequential(stages, seed):
+    buffer = _bands()
+    for index, (noise_type, level) in enumerate(stages):
+        buffer = apply_noise_array(buffer, noise_type, level, rng=make_rng(seed + index))
+    return buffer
+
+def _fused(stages, seed):
+    noise_types = [noise_type for noise_type, _ in stages]
+    levels = [level for _, level in stages]
+    return apply_fused_noise(_bands(), 0.5, rng=make_rng(seed), noise_types=noise_types, levels=levels)
+
+def _assert_same_distribution(fused, sequential):
+    # 帯ごとに平均・標準偏差と、2標本KS検定で比べる
+    for fused_band, sequential_band in zip(np.split(fused, len(LEVELS)), np.split(sequential, len(LEVELS))):
+        fused_band = fused_band.ravel()
+        sequential_band = sequential_band.ravel()
+        assert fused_band.mean() == pytest.approx(sequential_band.mean(), abs=0.1)
+        assert fused_band.std() == pytest.approx(sequential_band.std(), rel=0.02)
+        assert stats.skew(fused_band) == pytest.approx(0.0, abs=0.05)
+        assert stats.ks_2samp(fused_band, sequential_band).pvalue > 0.01
+
+@pytest.mark.parametrize('stages', [
+    [('speckle', 0.5), ('gaussian', 0.5)],
+    [('speckle', 1.0), ('gaussian', 0.0)],
+    [('gaussian', 0.5), ('gaussian', 0.5)],
+    [('gaussian', 0.5), ('gaussian', 0.2)],
+    [('speckle', 0.5), ('gaussian', 0.5), ('gaussian', 0.2)],
+])
+def test_fused_matches_sequential_distribution(stages):
+    _assert_same_distribution(_fused(stages, seed=1), _sequential(stages, seed=100))
+
+def test_fused_stage_levels_default_to_noise_level():
+    stages = ['speckle', 'gaussian']
+    expected = apply_fused_noise(_bands(), 0.3, rng=make_rng(1), noise_types=stages, levels=[0.3, 0.3])
+    assert np.array_equal(apply_fused_noise(_bands(), 0.3, rng=make_rng(1), noise_types=stages), expected)
+    assert np.array_equal(apply_fused_noise(_bands(), 0.3, rng=make_rng(1), noise_types=stages, levels=[None, 0.3]), expected)
+
+@pytest.mark.parametrize('stages, expected', [
+    (['speckle', 'gaussian'], ['speckle+gaussian']),
+    (['gaussian', 'speckle'], ['gaussian', 'speckle']),
+    (['speckle', 'speckle'], ['speckle', 'speckle']),
+    (['dct', 'gaussian', 'shot', 'gaussian'], ['dct', 'gaussian', 'shot', 'gaussian']),
+    (['dct', 'speckle', 'gaussian', 'mustard'], ['dct', 'speckle+gaussian', 'mustard']),
+])
+def test_plan_fused_stages(stages, expected):
+    assert plan_fused_stages(stages) == expected
+
+@pytest.mark.parametrize('stages, expected', [
+    (['dct', 'gaussian'], (['dct', 'gaussian+gaussian'], True)),
+    (['speckle'], (['speckle+gaussian'], True)),
+    (['dct', 'speckle+gaussian'], (['dct', 'speckle+gaussian+gaussian'], True)),
+    (['gaussian', 'dct'], (['gaussian', 'dct'], False)),
+    ([], ([], False)),
+])
+def test_fuse_trailing_stage(stages, expected):
+    assert fuse_trailing_stage(stages, 'gaussian') == expected
+
+def test_fused_stage_inherits_pixel_scale():
+    stage_options = {'gaussian': {'pixel_scale': 0.25}, 'blockdct': {'block_size': 8}}
+    assert stage_kernel_options('speckle+gaussian', stage_options) == {'pixel_scale': 0.25}
+    assert stage_kernel_options('blockdct', stage_options) == {'block_size': 8}
+    assert stage_kernel_options('speckle+gaussian', {}) == {}
+
+@pytest.mark.parametrize('stages, watermark', [
+    (['speckle', 'gaussian'], False),
+    ([], True),
+])
+def test_tiled_noise_follows_pixel_scale(stages, watermark):
+    # タイル処理でも、融合したステージと仕上げノイズに縮尺が渡る（通常の処理と同じ強さになる）
+    # 透明なウォーターマークを置くと、仕上げノイズは融合せずに別に適用される
+    placement = (Image.new('RGBA', (1, 1)), (0, 0)) if watermark else None
+    results = []
+    for scale in (1.0, 0.25):
+        image = Image.fromarray(np.full((256, 256, 3), 128, np.uint8))
+        stage_options = {'gaussian': {'pixel_scale': scale}, 'speckle': {'pixel_scale': scale}}
+        result = process_tiled(image, stages, 1.0, stage_options, rng=make_rng(1), watermark=placement)
+        results.append(np.asarray(result, np.float32).std())
+    assert results[1] == pytest.approx(results[0] * 0.25, rel=0.05)
+
+def _noise_stage_names(image_file, tmp_path, options):
+    metrics = process.StageMetrics(track_memory=False).start()
+    output_path = str(tmp_path / 'output.png')
+    assert process._process_image(image_file(), output_path, options, metrics) == output_path
+    return [stage['name'] for stage in metrics.to_record()['stages'] if 'noise' in stage['name']]
+
+def test_default_preset_fuses_final_noise(image_file, tmp_path):
+    options = {'noiseLevel': 0.5, 'noiseTypes': ['gaussian', 'dct'], 'seed': 1}
+    assert _noise_stage_names(image_file, tmp_path, options) == ['noise:dct', 'noise:gaussian+gaussian']
+
+def test_final_noise_not_fused_when_disabled(image_file, tmp_path):
+    options = {'noiseLevel': 0.5, 'noiseTypes': ['gaussian', 'dct'], 'seed': 1, 'fuseNoise': False}
+    assert _noise_stage_names(image_file, tmp_path, options) == ['noise:dct', 'noise:gaussian', 'final_noise']
+
+def test_tiled_fuses_final_noise_with_stage_levels():
+    image = Image.fromarray(np.full((256, 256, 3), 128, np.uint8))
+    result = np.asarray(process_tiled(image, ['gaussian'], 0.5, rng=make_rng(1), final_noise_level=0.2), np.float32)
+    # 強度の異なる2つのガウシアン（Lv.0.5 と仕上げの Lv.0.2）の合成と同じ標準偏差になる
+    expected_std = np.hypot(2.0 + 0.5 * 9.0, 2.0 + 0.2 * 9.0)
+    assert result.std() == pytest.approx(expected_std, rel=0.03)
@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import process
+from image_buffer import sprite_has_color
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+WATERMARK_PATH = os.path.join(REPO_DIR, 'src', 'watermark', 'no_ai_1.png')
+
+def _sprite(color, alpha):
+    return Image.new('RGBA', (8, 8), (*color, alpha))
+
+@pytest.mark.parametrize('sprite, expected', [
+    (_sprite((128, 128, 128), 255), False),
+    (_sprite((255, 0, 0), 0), False),
+    (_sprite((255, 0, 0), 1), True),
+])
+def test_sprite_has_color(sprite, expected):
+    assert sprite_has_color(sprite) is expected
+
+def _chroma(path):
+    pixels = np.asarray(Image.open(path).convert('RGB'), dtype=np.int16)
+    return int((pixels.max(axis=2) - pixels.min(axis=2)).max())
+
+def _process_grayscale(image_file, tmp_path, options):
+    output_path = str(tmp_path / 'output.png')
+    assert process._process_image(image_file(mode='L'), output_path, {'seed': 1, **options}) == output_path
+    return output_path
+
+@pytest.mark.parametrize('tiled', [False, True])
+def test_grayscale_input_keeps_colored_outline(image_file, tmp_path, tiled):
+    options = {
+        'applyWatermark': True, 'watermarkPath': WATERMARK_PATH,
+        'enableOutline': True, 'outlineColor': [255, 0, 0], 'tiled': tiled,
+    }
+    output_path = _process_grayscale(image_file, tmp_path, options)
+    assert Image.open(output_path).mode in ('RGB', 'RGBA')
+    assert _chroma(output_path) > 40
+
+@pytest.mark.parametrize('tiled', [False, True])
+def test_grayscale_input_keeps_colored_logo(image_file, tmp_path, tiled):
+    logo_path = str(tmp_path / 'logo.png')
+    Image.new('RGBA', (64, 64), (0, 0, 255, 255)).save(logo_path)
+    output_path = _process_grayscale(image_file, tmp_path, {'logoPath': logo_path, 'tiled': tiled})
+    assert _chroma(output_path) > 200
+
+def test_grayscale_input_with_grey_overlays_stays_grayscale(image_file, tmp_path):
+    logo_path = str(tmp_path / 'logo.png')
+    Image.new('RGBA', (64, 64), (90, 90, 90, 255)).save(logo_path)
+    options = {
+        'applyWatermark': True, 'watermarkPath': WATERMARK_PATH,
+        'enableOutline': True, 'outlineColor': [255, 255, 255], 'logoPath': logo_path,
+    }
+    assert Image.open(_process_grayscale(image_file, tmp_path, options)).mode == 'L'
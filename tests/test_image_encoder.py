@@ -0,0 +1,110 @@
+import io
+import os
+import zlib
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from conftest import make_image
+from image_encoder import (
+    DEFAULT_OUTPUT_PROFILE, MAX_LOSSY_QUALITY, MIN_LOSSY_QUALITY, encode_to_target, encoder_options,
+    lossy_encoder_options, save_image
+)
+
+@pytest.mark.parametrize('output_format, profile, expected', [
+    # 未指定時は従来の Image.save の引数と同じ
+    ('png', None, {'format': 'PNG'}),
+    ('webp', None, {'format': 'WEBP', 'lossless': True, 'quality': 100}),
+    ('png', 'fast', {'format': 'PNG', 'compress_level': 1, 'compress_type': zlib.Z_RLE}),
+    ('png', 'balanced', {'format': 'PNG', 'compress_level': 6, 'compress_type': zlib.Z_FILTERED}),
+    ('png', 'smallest', {'format': 'PNG', 'compress_level': 9, 'compress_type': zlib.Z_FILTERED}),
+    ('png', 'preview', {'format': 'PNG', 'compress_level': 0}),
+    ('webp', 'fast', {'format': 'WEBP', 'lossless': True, 'method': 0, 'quality': 0}),
+    ('webp', 'balanced', {'format': 'WEBP', 'lossless': True, 'method': 4, 'quality': 50}),
+    ('webp', 'smallest', {'format': 'WEBP', 'lossless': True, 'method': 6, 'quality': 100}),
+    ('webp', 'preview', {'format': 'WEBP', 'lossless': True, 'method': 0, 'quality': 0}),
+])
+def test_encoder_options(output_format, profile, expected):
+    assert encoder_options(output_format, profile) == expected
+
+def test_default_profile_is_baseline():
+    assert DEFAULT_OUTPUT_PROFILE == 'default'
+    assert encoder_options('png') == encoder_options('png', 'default')
+
+def test_unknown_profile_is_rejected():
+    with pytest.raises(ValueError):
+        encoder_options('png', 'ultra')
+
+@pytest.mark.parametrize('output_format, profile', [
+    ('png', None), ('png', 'fast'), ('png', 'smallest'), ('webp', None), ('webp', 'fast'), ('webp', 'balanced'),
+])
+def test_lossless_profiles_keep_pixels(tmp_path, output_format, profile):
+    image = make_image((64, 48))
+    output_path = save_image(image, str(tmp_path / 'output.png'), output_format, profile)
+    assert output_path.endswith('.' + output_format)
+    with Image.open(output_path) as result:
+        assert result.convert('RGB').tobytes() == image.tobytes()
+
+@pytest.mark.parametrize('mode', ['L', 'LA', 'RGB', 'RGBA'])
+def test_preview_png_keeps_pixels(tmp_path, mode):
+    # 'preview' は行フィルタも圧縮も行わずに自前で書き出す
+    image = make_image((64, 48), mode)
+    output_path = save_image(image, str(tmp_path / 'output.png'), 'png', 'preview')
+    with Image.open(output_path) as result:
+        assert result.mode == mode
+        assert result.tobytes() == image.tobytes()
+
+def _photo(size=(160, 120), mode='RGB'):
+    # 品質でサイズが大きく変わるよう、なめらかな模様に弱いノイズを加えた画像
+    width, height = size
+    yy, xx = np.mgrid[:height, :width]
+    base = 128 + 60 * np.sin(xx / 9.0)[..., None] * np.cos(yy / 7.0)[..., None] * np.array([1.0, 0.6, -0.8])
+    base = base + np.random.default_rng(0).normal(0, 6, base.shape)
+    image = Image.fromarray(np.clip(base, 0, 255).astype(np.uint8), 'RGB')
+    return image.convert(mode)
+
+def _encoded_size(image, output_format, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, **lossy_encoder_options(output_format, quality))
+    return buffer.tell()
+
+@pytest.mark.parametrize('output_format', ['jpeg', 'webp'])
+@pytest.mark.parametrize('fraction', [0.3, 0.6])
+def test_target_search_picks_highest_fitting_quality(output_format, fraction):
+    image = _photo()
+    low = _encoded_size(image, output_format, MIN_LOSSY_QUALITY)
+    high = _encoded_size(image, output_format, MAX_LOSSY_QUALITY)
+    target = int(low + (high - low) * fraction)
+    data, quality, encodes = encode_to_target(image, output_format, target)
+    assert len(data) <= target
+    assert MIN_LOSSY_QUALITY <= quality < MAX_LOSSY_QUALITY
+    # 目標の95%以上で打ち切ったか、1つ上の品質では収まらない
+    assert len(data) >= target * 0.95 or _encoded_size(image, output_format, quality + 1) > target
+    # 最高品質の1回と二分探索（91通り）で高々8回
+    assert encodes <= 8
+
+@pytest.mark.parametrize('output_format', ['jpeg', 'webp'])
+def test_target_search_returns_max_quality_when_it_fits(output_format):
+    data, quality, encodes = encode_to_target(_photo(), output_format, 10 ** 8)
+    assert (quality, encodes) == (MAX_LOSSY_QUALITY, 1)
+
+@pytest.mark.parametrize('output_format', ['jpeg', 'webp'])
+def test_target_search_falls_back_to_min_quality(output_format):
+    image = _photo()
+    data, quality, _ = encode_to_target(image, output_format, 100)
+    assert quality == MIN_LOSSY_QUALITY
+    assert len(data) == _encoded_size(image, output_format, MIN_LOSSY_QUALITY)
+
+def test_target_bytes_writes_the_file(tmp_path):
+    image = _photo(mode='RGBA')
+    high = _encoded_size(image.convert('RGB'), 'jpeg', MAX_LOSSY_QUALITY)
+    output_path = save_image(image, str(tmp_path / 'output.png'), 'jpeg', target_bytes=high // 2)
+    assert output_path.endswith('.jpg')
+    assert os.path.getsize(output_path) <= high // 2
+    with Image.open(output_path) as result:
+        assert result.format == 'JPEG' and result.mode == 'RGB'
+
+def test_target_bytes_requires_lossy_format(tmp_path):
+    with pytest.raises(ValueError):
+        save_image(_photo(), str(tmp_path / 'output.png'), 'png', target_bytes=10000)
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from conftest import make_image
+from image_resizer import REDUCING_GAP, downscale_for_preview, resize_image
+
+def _smooth_image(size):
+    # JPEGで壊れにくい、なめらかな模様の画像
+    width, height = size
+    rows = np.cos(np.arange(height, dtype=np.float32) / 29.0)[:, None, None]
+    cols = np.sin(np.arange(width, dtype=np.float32) / 37.0)[None, :, None]
+    pixels = 128 + 100 * rows * cols * np.array([1.0, 0.5, -0.7], np.float32)
+    return Image.fromarray(pixels.astype(np.uint8), 'RGB')
+
+@pytest.fixture(scope='module')
+def jpeg_file(tmp_path_factory):
+    path = tmp_path_factory.mktemp('resize') / 'input.jpg'
+    _smooth_image((2400, 1800)).save(path, quality=95)
+    return path
+
+@pytest.mark.parametrize('option, pixels', [('small', 250000), ('medium', 589824), ('default', 2000000), ('unknown', 2000000)])
+def test_resize_targets_pixel_count(option, pixels):
+    image = make_image((2400, 1800))
+    resized = resize_image(image, option)
+    ratio = (pixels / (2400 * 1800)) ** 0.5
+    assert resized.size == (int(2400 * ratio), int(1800 * ratio))
+
+def test_small_images_are_not_resized():
+    image = make_image((400, 300))
+    assert resize_image(image, 'small') is image
+
+def test_jpeg_is_decoded_at_reduced_scale(jpeg_file):
+    with Image.open(jpeg_file) as image:
+        resized = resize_image(image, 'small')
+        # 1/2・1/4 で読み込む（目標の577x433以上を保つ最小の縮尺は1/4の600x450）
+        assert image.size == (600, 450)
+        assert resized.size == (577, 433)
+
+def test_draft_decode_stays_close_to_full_decode(jpeg_file):
+    with Image.open(jpeg_file) as image:
+        drafted = np.asarray(resize_image(image, 'small'), dtype=np.float32)
+    with Image.open(jpeg_file) as image:
+        image.load()
+        full = np.asarray(resize_image(image, 'small'), dtype=np.float32)
+    assert np.abs(drafted - full).mean() < 1.5
+
+def test_reducing_gap_stays_close_to_lanczos():
+    image = _smooth_image((2400, 1800))
+    size = (577, 433)
+    gapped = np.asarray(image.resize(size, Image.LANCZOS, reducing_gap=REDUCING_GAP), dtype=np.float32)
+    exact = np.asarray(image.resize(size, Image.LANCZOS), dtype=np.float32)
+    assert np.abs(gapped - exact).max() <= 2
+
+def test_loaded_images_are_not_drafted(jpeg_file):
+    with Image.open(jpeg_file) as image:
+        image.load()
+        resize_image(image, 'small')
+        assert image.size == (2400, 1800)
+
+def test_preview_downscale(jpeg_file):
+    with Image.open(jpeg_file) as image:
+        preview, scale = downscale_for_preview(image, 1024)
+    assert preview.size == (1024, 768)
+    assert scale == pytest.approx(1024 / 2400)
+    small = make_image((800, 600))
+    assert downscale_for_preview(small, 1024) == (small, 1.0)
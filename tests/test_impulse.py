@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from noise.himalayan_shot import HIMALAYAN_COLORS, apply_himalayan_shot_noise
+from noise.impulse import sample_pixels, scatter_impulses
+from noise.shot import apply_shot_noise
+
+def test_sample_pixels_are_unique_and_in_bounds():
+    rows, cols = sample_pixels((300, 200, 3), 0.05, np.random.default_rng(0))
+    assert rows.min() >= 0 and rows.max() < 300
+    assert cols.min() >= 0 and cols.max() < 200
+    assert len(set(zip(rows.tolist(), cols.tolist()))) == rows.size
+
+@pytest.mark.parametrize('density', [0.0001, 0.0015, 0.02])
+def test_sample_count_follows_binomial(density):
+    # 各画素を確率 density で選ぶ場合と同じ二項分布（平均 N·d、標準偏差 sqrt(N·d·(1-d))）
+    pixels = 500 * 400
+    counts = np.array([sample_pixels((500, 400), density, np.random.default_rng(seed))[0].size for seed in range(200)])
+    mean = pixels * density
+    sigma = np.sqrt(mean * (1 - density))
+    assert abs(counts.mean() - mean) < 4 * sigma / np.sqrt(len(counts))
+    assert counts.std() == pytest.approx(sigma, rel=0.25)
+
+def test_sample_pixels_handles_empty_and_full():
+    rows, cols = sample_pixels((10, 10), 0.0, np.random.default_rng(0))
+    assert rows.size == cols.size == 0
+    rows, cols = sample_pixels((10, 10), 1.0, np.random.default_rng(0))
+    assert rows.size == 100
+
+def test_scatter_writes_only_the_sampled_pixels():
+    img = np.full((200, 300, 3), 100, np.uint8)
+    rows, cols = sample_pixels(img.shape, 0.01, np.random.default_rng(4))
+    scatter_impulses(img, 0.01, ((255, 255, 255), (0, 0, 0)), np.random.default_rng(4))
+    changed = (img != 100).any(axis=2)
+    assert np.count_nonzero(changed) == rows.size
+    assert changed[rows, cols].all()
+
+@pytest.mark.parametrize('noise_level, density', [(0.0, 0.0001), (0.5, 0.0008), (1.0, 0.0015)])
+def test_shot_density_and_colors(noise_level, density):
+    img = np.full((1000, 1000), 128, np.uint8)
+    apply_shot_noise(img, noise_level, rng=np.random.default_rng(1))
+    salt, pepper = np.count_nonzero(img == 255), np.count_nonzero(img == 0)
+    expected = img.size * density
+    assert salt + pepper == pytest.approx(expected, rel=5 / np.sqrt(expected))
+    assert np.count_nonzero(img == 128) == img.size - salt - pepper
+    # 塩と胡椒は半分ずつ
+    assert abs(salt - pepper) < 5 * np.sqrt(salt + pepper)
+
+def test_himalayan_uses_three_colors_in_place():
+    img = np.full((800, 800, 3), 128, np.float32)
+    result = apply_himalayan_shot_noise(img, 1.0, rng=np.random.default_rng(2))
+    assert result is img
+    counts = [np.count_nonzero((img == color).all(axis=2)) for color in HIMALAYAN_COLORS]
+    total = sum(counts)
+    assert total == pytest.approx(img.shape[0] * img.shape[1] * 0.002, rel=0.1)
+    assert min(counts) > total / 3 - 4 * np.sqrt(total)
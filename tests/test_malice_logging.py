@@ -0,0 +1,82 @@
+import io
+import json
+import logging
+
+import pytest
+
+import process
+from malice_logging import (
+    DEFAULT_LOG_LEVEL, LOG_LEVEL_ENV, LOGGER_NAME, configure_logging, get_logger, parse_log_level, set_log_level
+)
+
+@pytest.fixture(autouse=True)
+def restore_logger():
+    # テストの間に変えた 'malice' ロガーの設定を元に戻す
+    logger = logging.getLogger(LOGGER_NAME)
+    saved = (list(logger.handlers), logger.level, logger.propagate)
+    yield
+    logger.handlers[:] = saved[0]
+    logger.setLevel(saved[1])
+    logger.propagate = saved[2]
+
+@pytest.mark.parametrize('value, expected', [
+    (None, DEFAULT_LOG_LEVEL), ('', DEFAULT_LOG_LEVEL), ('debug', logging.DEBUG), (' INFO ', logging.INFO),
+    ('warn', logging.WARNING), ('quiet', logging.ERROR), ('verbose', logging.INFO), ('10', 10), (25, 25),
+    (True, logging.DEBUG), (False, DEFAULT_LOG_LEVEL), ('nonsense', DEFAULT_LOG_LEVEL),
+])
+def test_parse_log_level(value, expected):
+    assert parse_log_level(value) == expected
+
+def test_loggers_share_the_malice_hierarchy():
+    assert get_logger('watermark').name == 'malice.watermark'
+
+def test_configure_logging_writes_to_stream_at_level():
+    stream = io.StringIO()
+    assert configure_logging('info', stream) == logging.INFO
+    logger = get_logger('test')
+    logger.debug('hidden')
+    logger.info('shown %d', 1)
+    output = stream.getvalue()
+    assert 'hidden' not in output
+    assert 'INFO malice.test: shown 1' in output
+
+def test_configure_logging_reads_environment(monkeypatch):
+    monkeypatch.setenv(LOG_LEVEL_ENV, 'error')
+    assert configure_logging(stream=io.StringIO()) == logging.ERROR
+
+def test_configure_logging_replaces_its_handler(caplog):
+    first, second = io.StringIO(), io.StringIO()
+    configure_logging('warning', first)
+    configure_logging('warning', second)
+    get_logger('test').warning('once')
+    assert first.getvalue() == ''
+    assert second.getvalue().count('once') == 1
+    # ルートロガーには伝播しない
+    assert 'once' not in caplog.text
+
+def test_set_log_level_returns_previous_level():
+    configure_logging('warning', io.StringIO())
+    previous = set_log_level('debug')
+    assert previous == logging.WARNING
+    assert logging.getLogger(LOGGER_NAME).level == logging.DEBUG
+    # 解釈できない指定や None では変えない
+    set_log_level(None)
+    assert logging.getLogger(LOGGER_NAME).level == logging.DEBUG
+    set_log_level(previous)
+    assert logging.getLogger(LOGGER_NAME).level == logging.WARNING
+
+def test_worker_job_log_level_is_scoped(image_file, tmp_path, capsys):
+    stream = io.StringIO()
+    configure_logging('warning', stream)
+    input_path = image_file(size=(64, 48))
+    jobs = [
+        json.dumps({'id': 1, 'inputPath': input_path, 'outputPath': str(tmp_path / 'a.png'),
+                    'options': {'resize': 'small', 'logLevel': 'info'}}),
+        json.dumps({'id': 2, 'inputPath': input_path, 'outputPath': str(tmp_path / 'b.png'),
+                    'options': {'resize': 'small'}}),
+    ]
+    process.run_worker(io.StringIO('\n'.join(jobs) + '\n'))
+    # 1つ目のジョブだけ INFO のログ（リサイズを省いた記録）が出て、その後は WARNING に戻る
+    assert stream.getvalue().count('skip resizing') == 1
+    assert logging.getLogger(LOGGER_NAME).level == logging.WARNING
+    assert 'skip resizing' not in capsys.readouterr().out
@@ -0,0 +1,83 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from noise.impulse import sample_pixels
+from noise.mustard import apply_mustard_noise, _blend_region, _blend_line
+from noise.rng import make_rng
+
+def _gray(height=200, width=300, value=128.0):
+    return np.full((height, width, 3), value, np.float32)
+
+def test_blend_region_matches_per_pixel_over():
+    # 形状を順番に重ねた結果が、画素ごとの over 合成（従来の実装）と一致する
+    rng = np.random.default_rng(0)
+    image = rng.uniform(0, 255, (40, 50, 3)).astype(np.float32)
+    expected = image.copy()
+    shapes = [(-3, 5, rng.uniform(0, 1, (10, 8)), (250, 220, 60)), (30, 45, rng.uniform(0, 1, (12, 9)), (10, 20, 30))]
+    for top, left, alpha, color in shapes:
+        _blend_region(image, top, left, alpha, color)
+        for dy in range(alpha.shape[0]):
+            for dx in range(alpha.shape[1]):
+                y, x = top + dy, left + dx
+                if 0 <= y < 40 and 0 <= x < 50:
+                    a = alpha[dy, dx]
+                    expected[y, x] = (1 - a) * expected[y, x] + a * np.array(color)
+    assert np.allclose(image, expected, atol=1e-3)
+
+@pytest.mark.parametrize('thickness', [1, 3, 4])
+def test_blend_line_matches_per_point_loop(thickness):
+    # 点ごとに重ねる従来の実装と一致する（同じ画素に複数の点が落ちる場合も含む）
+    image = np.random.default_rng(0).uniform(0, 255, (100, 120, 3)).astype(np.float32)
+    expected = image.copy()
+    angle, length, color = 0.6, 150, np.array((240, 210, 70))
+    offsets = np.arange(-thickness // 2, thickness // 2 + 1)
+    offset_alpha = 0.75 * (1.0 - np.abs(offsets) / (thickness // 2 + 1))
+    _blend_line(image, 10, 5, angle, length, offsets, offset_alpha, color)
+    for t in range(length):
+        x, y = 10 + int(t * np.cos(angle)), 5 + int(t * np.sin(angle))
+        if 0 <= x < 120 and 0 <= y < 100:
+            for offset, alpha in zip(offsets, offset_alpha):
+                nx, ny = int(x - offset * np.sin(angle)), int(y + offset * np.cos(angle))
+                if 0 <= nx < 120 and 0 <= ny < 100:
+                    expected[ny, nx] = (1 - alpha) * expected[ny, nx] + alpha * color
+    assert np.allclose(image, expected, atol=1e-2)
+
+def test_sample_pixels_matches_bernoulli_density():
+    shape, density = (1000, 800), 0.002
+    counts = []
+    for seed in range(20):
+        rows, cols = sample_pixels(shape, density, make_rng(seed))
+        assert len(set(zip(rows.tolist(), cols.tolist()))) == rows.size
+        assert rows.max() < shape[0] and cols.max() < shape[1]
+        counts.append(rows.size)
+    expected = shape[0] * shape[1] * density
+    assert np.mean(counts) == pytest.approx(expected, rel=0.02)
+    assert np.std(counts) == pytest.approx(np.sqrt(expected * (1 - density)), rel=0.4)
+
+def test_small_spot_density():
+    # レベル0ではテクスチャとブロックが無いため、変化した画素の大半は小さいスポットと黒点になる
+    image = _gray(1000, 1000)
+    apply_mustard_noise(image, 0.0, rng=make_rng(1))
+    mustard = np.all(image == (250, 220, 60), axis=2).mean()
+    black = np.all(image == 20, axis=2).mean()
+    # 黒点が後から書かれるため、マスタード色の割合はわずかに下がる
+    assert mustard == pytest.approx(0.0001 * (1 - 0.00004), rel=0.25)
+    assert black == pytest.approx(0.00004, rel=0.4)
+
+def test_same_seed_same_result():
+    results = [apply_mustard_noise(_gray(), 0.7, rng=make_rng(5)) for _ in range(2)]
+    assert np.array_equal(results[0], results[1])
+    assert not np.array_equal(results[0], _gray())
+
+def test_memory_does_not_scale_with_image_area():
+    # 画像全体の層やマスク（1画素あたり数バイト以上）を確保しない
+    image = _gray(2000, 2000)
+    tracemalloc.start()
+    try:
+        apply_mustard_noise(image, 1.0, rng=make_rng(3))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < 2000 * 2000
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from PIL import Image
+
+import noise
+from noise import apply_noise_array, buffer_dtype, parallel_safe, register_noise_kernel, NOISE_KERNELS
+from noise.registry import _loaded_functions
+from noise.rng import make_rng
+from tiled_processor import plan_tiled_stages, process_tiled
+
+def test_buffer_dtype_follows_kernel_dtype():
+    assert buffer_dtype(['shot']) is np.uint8
+    assert buffer_dtype(['shot', 'himalayan']) is np.uint8
+    assert buffer_dtype(['shot', 'gaussian']) is np.float32
+    assert buffer_dtype([]) is np.float32
+
+def test_any_dtype_kernel_keeps_uint8_buffer():
+    buffer = np.full((64, 64, 3), 128, np.uint8)
+    result = apply_noise_array(buffer, 'shot', 1.0, rng=make_rng(0))
+    assert result is buffer
+    assert result.dtype == np.uint8
+
+def test_float_kernel_receives_float32_buffer():
+    buffer = np.full((64, 64, 3), 128, np.uint8)
+    result = apply_noise_array(buffer, 'gaussian', 0.5, rng=make_rng(0))
+    assert result.dtype == np.float32
+    assert not np.array_equal(result, buffer)
+
+@pytest.fixture
+def copying_kernel():
+    # その場で更新しない（新しい配列を返す）カーネルを一時的に登録する
+    def apply_offset_noise(img_array, noise_level, rng=None):
+        return img_array + 10.0
+    register_noise_kernel('offset', apply_offset_noise, in_place=False)
+    yield 'offset'
+    del NOISE_KERNELS['offset']
+    _loaded_functions.pop('offset', None)
+
+def test_tiled_writes_back_results_of_copying_kernels(copying_kernel):
+    image = Image.new('L', (40, 200), 100)
+    result = process_tiled(image, [copying_kernel], 0.5, rng=make_rng(0), final_noise_level=0.0)
+    # 仕上げノイズ（標準偏差2）を除いて、全ての行にオフセットが加わっていること
+    assert abs(np.asarray(result, dtype=np.float32).mean() - 110) < 1
+    assert plan_tiled_stages([copying_kernel]) == ([copying_kernel], [])
+
+def test_parallel_safe_follows_kernel_metadata():
+    assert parallel_safe('gaussian')
+    assert parallel_safe('speckle+gaussian')
+    assert not parallel_safe('dct')
+    assert not parallel_safe('mustard')
+    assert not parallel_safe('unknown')
+
+@pytest.mark.parametrize('stages', [['gaussian', 'shot'], ['blockdct', 'speckle', 'himalayan']])
+def test_tiled_threads_do_not_change_result(stages):
+    # 乱数は64行単位で派生させるため、スレッドで並列に処理しても結果は同じになる
+    image = Image.fromarray(np.random.default_rng(0).integers(0, 256, (300, 96, 3), dtype=np.uint8))
+    results = [
+        np.asarray(process_tiled(image.copy(), stages, 0.5, rng=make_rng(3), memory_limit_mb=1, workers=workers))
+        for workers in (1, 4)
+    ]
+    assert np.array_equal(results[0], results[1])
+
+def test_public_names_are_exported():
+    assert all(hasattr(noise, name) for name in noise.__all__)
+    assert {'NoiseKernel', 'register_noise_kernel', 'plan_fused_stages', 'fuse_trailing_stage'} <= set(noise.__all__)
@@ -0,0 +1,115 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import process
+from noise import apply_noise_array
+from noise.block_dct import scaled_block_size
+from noise.impulse import scatter_impulses
+from stage_metrics import StageMetrics
+from tiled_processor import UNIT_ROWS
+
+@pytest.mark.parametrize('noise_type', ['gaussian', 'speckle', 'speckle+gaussian'])
+def test_noise_amplitude_follows_pixel_scale(noise_type):
+    base = np.full((256, 256, 3), 128, np.float32)
+    full = apply_noise_array(base.copy(), noise_type, 1.0, rng=np.random.default_rng(0))
+    preview = apply_noise_array(base.copy(), noise_type, 1.0, rng=np.random.default_rng(0), pixel_scale=0.25)
+    # 同じ乱数で、ずれの大きさだけが縮尺倍になる
+    np.testing.assert_allclose(preview - 128, (full - 128) * 0.25, rtol=1e-4, atol=1e-4)
+
+def test_impulses_keep_mean_contribution_at_pixel_scale():
+    density = 0.002
+    full = scatter_impulses(np.zeros((400, 400), np.float32), density, (255,), np.random.default_rng(0))
+    preview = scatter_impulses(np.zeros((400, 400), np.float32), density, (255,), np.random.default_rng(0), 0.25)
+    # 選ぶ画素は16倍、1画素あたりの強さは1/16で、画素あたりの平均の寄与は同じ
+    assert np.count_nonzero(preview) > 10 * np.count_nonzero(full)
+    assert preview.max() == pytest.approx(255 / 16)
+    assert preview.mean() == pytest.approx(full.mean(), rel=0.2)
+
+def test_impulses_blend_uint8_buffers():
+    img = np.full((200, 200, 3), 100, np.uint8)
+    scatter_impulses(img, 0.01, ((255, 255, 255),), np.random.default_rng(0), 0.5)
+    assert img.dtype == np.uint8
+    assert set(np.unique(img)) == {100, 139}
+
+def test_block_dct_grain_follows_pixel_scale():
+    img = np.random.default_rng(0).uniform(0, 255, (64, 64)).astype(np.float32)
+    result = apply_noise_array(img.copy(), 'blockdct', 1.0, rng=np.random.default_rng(1), block_size=16, pixel_scale=0.5)
+    # 16px のブロックは 8px になり、8x8 ブロックごとの平均（DC成分）は変わらない
+    blocks = (result - img).reshape(8, 8, 8, 8)
+    np.testing.assert_allclose(blocks.mean(axis=(1, 3)), 0, atol=1e-3)
+    assert np.abs(result - img).max() > 1
+
+@pytest.mark.parametrize('block_size, pixel_scale, expected', [
+    (8, 1.0, 8), (16, 0.5, 8), (16, 0.3, 4), (8, 0.3, 2), (8, 0.05, 2), (64, 0.7, 32), (64, 1.5, 64), (16, 0.75, 16),
+])
+def test_scaled_block_size_stays_on_unit_grid(block_size, pixel_scale, expected):
+    # 縮尺を掛けたブロックは2のべき乗に丸め、タイル処理の乱数単位（UNIT_ROWS 行）を割り切る
+    assert scaled_block_size(block_size, pixel_scale) == expected
+    assert UNIT_ROWS % expected == 0
+
+def _preview(input_path, output_path, seed=1, **extra):
+    metrics = StageMetrics(track_memory=False).start()
+    options = {'preview': True, 'previewSize': 128, 'noiseLevel': 0.5, 'noiseTypes': ['gaussian', 'shot'], 'seed': seed}
+    options.update(extra)
+    written_path = process._process_image(input_path, output_path, options, metrics=metrics)
+    return written_path, metrics.to_record()
+
+def test_preview_reuses_downscaled_image(image_file, tmp_path):
+    process._preview_cache.clear()
+    input_path = image_file(size=(512, 384))
+    first_path, first = _preview(input_path, str(tmp_path / 'first.png'))
+    second_path, second = _preview(input_path, str(tmp_path / 'second.png'))
+    assert not first['previewCached']
+    assert second['previewCached']
+    # キャッシュした縮小画像からも同じ結果になる
+    with Image.open(first_path) as a, Image.open(second_path) as b:
+        assert a.size == (128, 96)
+        assert a.tobytes() == b.tobytes()
+
+def test_preview_cache_follows_file_changes(image_file, tmp_path):
+    process._preview_cache.clear()
+    input_path = image_file(size=(512, 384))
+    _preview(input_path, str(tmp_path / 'first.png'))
+    Image.new('RGB', (400, 400), 'white').save(input_path)
+    written_path, record = _preview(input_path, str(tmp_path / 'second.png'))
+    assert not record['previewCached']
+    with Image.open(written_path) as result:
+        assert result.size == (128, 128)
+
+def test_cached_preview_survives_tiled_processing(image_file, tmp_path):
+    # タイル処理は入力を閉じるため、キャッシュの画像は複製して渡す
+    process._preview_cache.clear()
+    input_path = image_file(size=(512, 384))
+    first_path, _ = _preview(input_path, str(tmp_path / 'first.png'), tiled=True)
+    second_path, second = _preview(input_path, str(tmp_path / 'second.png'), tiled=True)
+    third_path, third = _preview(input_path, str(tmp_path / 'third.png'), tiled=True)
+    assert second['previewCached'] and third['previewCached'] and third['tiled']
+    with Image.open(first_path) as a, Image.open(third_path) as b:
+        assert a.tobytes() == b.tobytes()
+
+def test_preview_cache_is_keyed_on_source_path(image_file, tmp_path):
+    # GUIは元の画像を毎回同じ一時ファイルにコピーして送る（コピーの更新時刻は毎回変わる）
+    process._preview_cache.clear()
+    source = image_file(size=(512, 384), name='source.png')
+    other = str(tmp_path / 'other.png')
+    Image.new('RGB', (400, 400), 'white').save(other)
+    temp_input = str(tmp_path / 'temp_preview_input.png')
+    records = []
+    for source_path in (source, source, other):
+        shutil.copyfile(source_path, temp_input)
+        os.utime(temp_input, ns=(0, 0))  # 一時ファイルの識別子が同じでも、元の画像で区別する
+        _, record = _preview(temp_input, str(tmp_path / 'out.png'), sourcePath=source_path)
+        records.append(record)
+    assert [record['previewCached'] for record in records] == [False, True, False]
+
+def test_cached_preview_skips_resize(image_file, tmp_path):
+    process._preview_cache.clear()
+    input_path = image_file(size=(1600, 1200))
+    _, first = _preview(input_path, str(tmp_path / 'first.png'), resize='medium')
+    _, second = _preview(input_path, str(tmp_path / 'second.png'), resize='medium')
+    assert 'resize' in [stage['name'] for stage in first['stages']]
+    assert 'resize' not in [stage['name'] for stage in second['stages']]
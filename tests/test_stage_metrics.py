@@ -0,0 +1,56 @@
+import mmap
+
+import numpy as np
+import pytest
+
+import stage_metrics
+from stage_metrics import StageMetrics, TRACE_MEMORY_ENV
+
+def _record(metrics):
+    metrics.start()
+    with metrics.stage('alloc'):
+        np.ones((256, 1024), np.float64)
+    return metrics.to_record()
+
+def test_memory_tracing_is_off_by_default(monkeypatch):
+    monkeypatch.delenv(TRACE_MEMORY_ENV, raising=False)
+    record = _record(StageMetrics())
+    assert record['peakBytes'] is None
+    assert record['stages'][0]['peakBytes'] is None
+
+@pytest.mark.parametrize('value', ['1', 'true'])
+def test_memory_tracing_enabled_by_env(monkeypatch, value):
+    monkeypatch.setenv(TRACE_MEMORY_ENV, value)
+    record = _record(StageMetrics())
+    assert record['stages'][0]['peakBytes'] >= 256 * 1024 * 8
+
+def test_peak_rss_is_reported():
+    pytest.importorskip('resource')
+    assert _record(StageMetrics(track_memory=False))['peakRssBytes'] > 0
+
+def _touch(size):
+    with mmap.mmap(-1, size) as mapping:
+        pages = np.frombuffer(mapping, np.uint8)
+        pages[:] = 1
+        del pages
+
+def test_stage_rss_peak_is_reported_by_default(monkeypatch):
+    pytest.importorskip('resource')
+    monkeypatch.delenv(TRACE_MEMORY_ENV, raising=False)
+    metrics = StageMetrics().start()
+    # 先に大きな領域を確保して、プロセスの最大RSSを押し上げておく
+    # （malloc が解放済みの常駐ページを使い回すとRSSが増えないため、新しい匿名マッピングに書き込む）
+    with metrics.stage('large'):
+        _touch(64 * 1024 * 1024)
+    with metrics.stage('small'):
+        _touch(16 * 1024 * 1024)
+    record = metrics.to_record()
+    large, small = record['stages']
+    assert large['rssPeakBytes'] >= 48 * 1024 * 1024
+    assert record['rssPeakBytes'] == large['rssPeakBytes']
+    assert record['peakRssBytes'] >= large['rssPeakBytes']
+    if stage_metrics._rss_peak_resettable:
+        # 最大RSSをステージごとにリセットできる環境では、前のステージのピークに隠れずに計測できる
+        assert small['rssPeakBytes'] >= 12 * 1024 * 1024
+    else:
+        assert small['rssPeakBytes'] is not None
@@ -0,0 +1,101 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+import PIL
+from PIL import Image
+
+import process
+from noise.rng import make_rng
+import tiled_processor
+from tiled_processor import process_tiled_to_scratch
+
+@pytest.mark.parametrize('options', [
+    {'tiled': True},
+    {'tiled': True, 'noiseTypes': ['gaussian']},
+])
+def test_tiled_without_noise_level(image_file, tmp_path, options):
+    # noiseLevel が無いジョブでもタイル処理が最後まで進むこと
+    output_path = str(tmp_path / 'output.png')
+    assert process._process_image(image_file(), output_path, dict(options, seed=1)) == output_path
+    with Image.open(output_path) as result:
+        assert result.size == (320, 240)
+
+@pytest.mark.parametrize('option', ['tileMemoryLimitMB', 'memoryLimitMB'])
+def test_memory_limit_switches_to_tiled_without_noise_level(image_file, tmp_path, option):
+    # tileMemoryLimitMB（以前の名前の memoryLimitMB も）でタイル処理に自動で切り替わる場合も同じ
+    input_path = image_file(size=(1600, 1200), name='input.jpg')
+    output_path = str(tmp_path / 'output.png')
+    metrics = process.StageMetrics(track_memory=False).start()
+    assert process._process_image(input_path, output_path, {option: 1, 'seed': 1}, metrics) == output_path
+    assert metrics.to_record()['tiled'] is True
+    assert os.path.getsize(output_path) > 0
+
+@pytest.mark.parametrize('mode, name, stages', [
+    ('RGB', 'input.png', ['gaussian', 'shot']),
+    ('RGB', 'input.jpg', ['speckle', 'blockdct']),
+    ('RGBA', 'input.png', ['gaussian']),
+    ('L', 'input.png', ['gaussian']),
+    ('L', 'input.png', ['himalayan']),
+])
+def test_direct_decode_matches_loaded_image(image_file, mode, name, stages):
+    # スクラッチへ直接デコードした場合も、読み込み済みの画像を渡した場合と同じ結果になる
+    path = image_file(size=(150, 300), mode=mode, name=name)
+    results = []
+    for preload in (False, True):
+        with Image.open(path) as image:
+            if preload:
+                image.load()
+            with process_tiled_to_scratch(image, stages, 0.5, rng=make_rng(2), memory_limit_mb=1) as tiled:
+                results.append((tiled.mode, np.asarray(tiled.to_image())))
+    assert results[0][0] == results[1][0]
+    assert np.array_equal(results[0][1], results[1][1])
+
+def _tiled_result(path, stages):
+    with Image.open(path) as image:
+        with process_tiled_to_scratch(image, stages, 0.5, rng=make_rng(2), memory_limit_mb=1) as tiled:
+            return tiled.mode, np.asarray(tiled.to_image())
+
+@pytest.mark.parametrize('unavailable', ['version', 'signature'])
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'RGBA'])
+def test_fallback_without_direct_decode_matches(image_file, monkeypatch, mode, unavailable):
+    # Pillow の内部APIが使えない場合は公開APIの経路に切り替わり、直接デコードと同じ結果になる
+    path = image_file(size=(150, 300), mode=mode)
+    expected = _tiled_result(path, ['gaussian'])
+    if unavailable == 'version':
+        monkeypatch.setattr(PIL, '__version__', '%d.0.0' % tiled_processor.DIRECT_DECODE_PILLOW_VERSIONS[1][0])
+        assert not tiled_processor._direct_decode_available()
+    else:
+        # 内部APIの引数が変わった場合
+        def changed_map_scratch(scratch, image):
+            raise TypeError('map_buffer() takes different arguments')
+        monkeypatch.setattr(tiled_processor, '_map_scratch', changed_map_scratch)
+    with Image.open(path) as image:
+        assert tiled_processor._decode_to_scratch(image) is None
+        # 画像は未デコードのまま残り、通常どおり読み込める
+        image.load()
+    result = _tiled_result(path, ['gaussian'])
+    assert result[0] == expected[0]
+    assert np.array_equal(result[1], expected[1])
+
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'RGBA'])
+def test_streamed_png_matches_full_frame(image_file, tmp_path, mode):
+    with Image.open(image_file(size=(97, 200), mode=mode)) as image:
+        with process_tiled_to_scratch(image, ['gaussian'], 0.5, rng=make_rng(1), memory_limit_mb=1) as tiled:
+            expected = np.asarray(tiled.to_image())
+            output_path = tiled.save(str(tmp_path / 'output.png'))
+    with Image.open(output_path) as result:
+        assert result.mode == mode
+        assert np.array_equal(np.asarray(result), expected)
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='ステージごとの最大RSSは Linux でのみ計測できる')
+def test_tiled_png_stays_below_full_frame(image_file, tmp_path):
+    # 入力のデコードからPNGの書き出しまで、画像全体の画素（1画素4バイト）をメモリに載せない
+    width, height = 3000, 2000
+    input_path = image_file(size=(width, height), name='input.jpg')
+    metrics = process.StageMetrics(track_memory=False).start()
+    options = {'tiled': True, 'tileMemoryLimitMB': 4, 'noiseLevel': 0.5, 'noiseTypes': ['gaussian'], 'seed': 1}
+    process._process_image(input_path, str(tmp_path / 'output.png'), options, metrics)
+    stages = {stage['name']: stage['rssPeakBytes'] for stage in metrics.to_record()['stages']}
+    assert max(stages['tiled'], stages['encode']) < width * height * 4 // 2
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from PIL import Image
+from scipy.ndimage import binary_dilation, binary_erosion, generate_binary_structure
+
+from watermark_processor import add_simple_outline
+
+COLOR = (255, 0, 0)
+
+def _watermark(shape=(48, 64)):
+    # 長方形と円と1画素の点（端に接する図形を含む）
+    alpha = np.zeros(shape, np.uint8)
+    alpha[10:20, 8:30] = 255
+    yy, xx = np.mgrid[:shape[0], :shape[1]]
+    alpha[(yy - 30) ** 2 + (xx - 45) ** 2 <= 36] = 200
+    alpha[40, 10] = 255
+    alpha[0:4, 60:64] = 255
+    rgba = np.zeros(shape + (4,), np.uint8)
+    rgba[..., :3] = 30
+    rgba[..., 3] = alpha
+    return Image.fromarray(rgba, 'RGBA')
+
+def _baseline_outline_mask(alpha, border_width, overlap_factor=0.2, structure=None):
+    # 従来の実装（二値の膨張・収縮の繰り返し）が作るアウトラインの範囲
+    foreground = alpha > 0
+    shrink_amount = int(border_width * overlap_factor)
+    if shrink_amount > 0:
+        watermark_mask = binary_erosion(foreground, structure=structure, iterations=shrink_amount)
+    else:
+        watermark_mask = foreground
+    return binary_dilation(foreground, structure=structure, iterations=border_width) & ~watermark_mask
+
+def _outline_mask(watermark, border_width, **kwargs):
+    outlined = add_simple_outline(watermark, COLOR, borderWidth=border_width, opacity=1.0, **kwargs)
+    alpha = np.array(watermark.getchannel('A'))
+    result = np.array(outlined)
+    # 元が透明な画素は、アウトラインの色が入った画素
+    return (result[..., 3] > 0) & (alpha == 0), result
+
+@pytest.mark.parametrize('border_width', [1, 2])
+def test_matches_baseline_for_thin_borders(border_width):
+    # 半径2までは、ユークリッド距離の円と4近傍の膨張の繰り返し（菱形）が同じ画素になる
+    watermark = _watermark()
+    alpha = np.array(watermark.getchannel('A'))
+    mask, _ = _outline_mask(watermark, border_width)
+    expected = _baseline_outline_mask(alpha, border_width) & (alpha == 0)
+    np.testing.assert_array_equal(mask, expected)
+
+@pytest.mark.parametrize('border_width', [3, 5, 8])
+def test_stays_between_baseline_diamond_and_square(border_width):
+    # 太い場合は円形になり、従来の菱形（4近傍）を含み、正方形（8近傍）に含まれる
+    watermark = _watermark()
+    alpha = np.array(watermark.getchannel('A'))
+    mask, result = _outline_mask(watermark, border_width)
+    diamond = _baseline_outline_mask(alpha, border_width) & (alpha == 0)
+    square = _baseline_outline_mask(alpha, border_width, structure=generate_binary_structure(2, 2)) & (alpha == 0)
+    assert not (diamond & ~mask).any()
+    assert not (mask & ~square).any()
+    assert (result[mask][:, :3] == COLOR).all()
+
+def test_overlap_shrinks_inside_the_watermark():
+    # 重なり分（幅×0.2）だけ、ウォーターマークの縁の内側にもアウトラインが入る
+    # （半透明の円の部分で、下に合成されたアウトラインの色が見える）
+    watermark = _watermark()
+    alpha = np.array(watermark.getchannel('A'))
+    outlined = np.array(add_simple_outline(watermark, COLOR, borderWidth=10, opacity=1.0))
+    circle = alpha == 200
+    diamond = binary_erosion(alpha > 0, iterations=2)
+    square = binary_erosion(alpha > 0, structure=generate_binary_structure(2, 2), iterations=2)
+    assert (outlined[circle & ~diamond][:, 0] > 30).all()
+    np.testing.assert_array_equal(outlined[circle & square][:, :3], 30)
+
+def test_smooth_outline_has_soft_edge():
+    watermark = _watermark()
+    alpha = np.array(watermark.getchannel('A'))
+    hard = np.array(add_simple_outline(watermark, COLOR, borderWidth=4, opacity=1.0))[..., 3]
+    smooth = np.array(add_simple_outline(watermark, COLOR, borderWidth=4, opacity=1.0, smooth=True))[..., 3]
+    outside = alpha == 0
+    assert set(np.unique(hard[outside])) <= {0, 255}
+    assert ((smooth[outside] > 0) & (smooth[outside] < 255)).any()
+    # 外縁を除けば同じ範囲
+    assert not ((smooth[outside] == 255) & (hard[outside] == 0)).any()
+
+def test_opacity_scales_outline_alpha():
+    watermark = _watermark()
+    mask, _ = _outline_mask(watermark, 3)
+    outlined = np.array(add_simple_outline(watermark, COLOR, borderWidth=3, opacity=0.5))
+    assert set(np.unique(outlined[..., 3][mask])) == {127}
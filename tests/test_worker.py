@@ -0,0 +1,70 @@
+import io
+import os
+import json
+
+import process
+
+def _run(lines, capsys):
+    process.run_worker(io.StringIO(''.join(line + '\n' for line in lines)))
+    captured = capsys.readouterr()
+    # 結果チャネル（stdout）はすべてJSONの行
+    records = [json.loads(line) for line in captured.out.splitlines()]
+    return records, captured.err
+
+def _job(job_id, input_path, output_path, **options):
+    return json.dumps({'id': job_id, 'inputPath': input_path, 'outputPath': output_path, 'options': options})
+
+def test_worker_reports_ready_then_results(image_file, tmp_path, capsys):
+    input_path = image_file(size=(64, 48))
+    output_path = str(tmp_path / 'output.png')
+    records, _ = _run([_job(7, input_path, output_path, noiseLevel=0.5, noiseTypes=['gaussian'], seed=1)], capsys)
+    ready, result = records
+    assert ready['event'] == 'ready' and ready['pid'] > 0
+    assert result['id'] == 7
+    assert result['success'] is True
+    assert result['outputPath'] == output_path
+    assert [stage['name'] for stage in result['metrics']['stages']][-1] == 'encode'
+
+def test_worker_reports_errors_and_continues(image_file, tmp_path, capsys):
+    input_path = image_file(size=(64, 48))
+    records, _ = _run([
+        'not json',
+        _job(1, str(tmp_path / 'missing.png'), str(tmp_path / 'a.png')),
+        _job(2, str(tmp_path / 'input.gif'), str(tmp_path / 'b.png')),
+        _job(3, input_path, str(tmp_path / 'c.png')),
+    ], capsys)
+    invalid, missing, unsupported, ok = records[1:]
+    assert invalid['id'] is None and invalid['success'] is False
+    assert missing['id'] == 1 and missing['success'] is False and 'metrics' in missing
+    assert unsupported['id'] == 2 and 'Unsupported file format' in unsupported['error']
+    assert ok['id'] == 3 and ok['success'] is True
+
+def test_worker_redirects_job_output_to_stderr(monkeypatch, tmp_path, capsys):
+    def noisy_process(input_path, output_path, options=None, metrics=None):
+        print('library chatter')
+        return output_path
+    monkeypatch.setattr(process, '_process_image', noisy_process)
+    records, err = _run([_job(1, 'in.png', str(tmp_path / 'out.png'))], capsys)
+    assert records[1]['success'] is True
+    assert 'library chatter' in err
+
+def test_worker_stops_on_shutdown(image_file, tmp_path, capsys):
+    input_path = image_file(size=(32, 32))
+    records, _ = _run([
+        json.dumps({'command': 'shutdown'}),
+        _job(1, input_path, str(tmp_path / 'output.png')),
+    ], capsys)
+    assert [record.get('event') for record in records] == ['ready']
+
+def test_worker_prewarms_preview_logo_sprites(image_file, tmp_path, capsys):
+    import logo_processor
+    logo_processor._logo_sprite_cache.clear()
+    logo_path = os.path.join(logo_processor.BUNDLED_LOGO_DIR, 'logo_A.png')
+    _run([], capsys)
+    cached = len(logo_processor._logo_sprite_cache)
+    assert cached > 0
+    # 4:3 の画像のプレビュー（1024x768）で使うロゴは作成済み
+    input_path = image_file(size=(2048, 1536))
+    records, _ = _run([_job(1, input_path, str(tmp_path / 'preview.png'), preview=True, logoPath=logo_path)], capsys)
+    assert records[1]['success'] is True
+    assert len(logo_processor._logo_sprite_cache) == cached